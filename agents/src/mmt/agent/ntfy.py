@@ -4,6 +4,7 @@ from loguru import logger
 from requests import post
 
 from litter.adapt import agent, FromConfig
+from litter.ratelimit import rate_limit
 from mmt.api.ntfy import NtfyApi
 
 
@@ -13,6 +14,8 @@ class NtfyAgent(NtfyApi):
         self.server_url = server_url
         self.max_len = max_len
 
+    # 与ntfy服务端默认的访客限制一致：突发60条，之后每5秒1条
+    @rate_limit("ntfy", 1, per=5., burst=60)
     def _publish(self, topic: str, message: str, **kwargs):
         data = {"topic": topic, "message": message, **kwargs}
         logger.debug(f"发送ntfy通知：{data}")
@@ -3,14 +3,16 @@ import json
 import re
 import zipfile
 from pathlib import Path
-from time import sleep, time
-from typing import TypeAlias, Any, Literal, IO
+from typing import TypeAlias, Any, Literal, IO, Iterator
 
 import requests
 from PIL import Image
 from loguru import logger
 
+from litter import current_token
 from litter.adapt import agent, FromConfig
+from litter.cache import cached, invalidates
+from litter.ratelimit import RateLimiter
 from mmt.api.pixiv import PixivApi
 
 Json: TypeAlias = dict[str, Any] | list[Any]
@@ -24,12 +26,24 @@ class PixivWebAPIException(Exception):
     "mmt.agent.pixiv",
     init_args=(FromConfig("pixiv_webapi/php_session_id"), FromConfig("pixiv_webapi/csrf_token")),
     init_kwargs=dict(debug=FromConfig("pixiv_webapi/debug", False),
-                     dump_path=FromConfig("pixiv_webapi/dump_path", None)),
+                     dump_path=FromConfig("pixiv_webapi/dump_path", None),
+                     timeout=FromConfig("pixiv_webapi/timeout", 20.)),
+    max_queue=FromConfig("pixiv_webapi/max_queue", None),
+    channel_limits=FromConfig("pixiv_webapi/channel_limits", None),
+    # ugoira转gif是CPU密集的，只有转换在子进程中执行，下载仍在按优先级调度的线程中执行
+    process_methods=("_ugoira_to_gif",),
+    # 多副本部署时各副本配置不同的 replica_id，相同作品的请求总是由同一个副本处理
+    replica_id=FromConfig("pixiv_webapi/replica_id", None),
+    # 为 rand_img 等交互式的高优先级请求保留1个线程，不被归档等批量任务占满
+    reserved_workers=FromConfig("pixiv_webapi/reserved_workers", 1),
 )
 class PixivWebAPI(PixivApi):
     def __init__(self, php_session_id: str, csrf_token: str, lang: str = "zh", proxies=None, *,
-                 min_interval: float = 0.5, debug: bool = False, dump_path: Path = Path(".")):
+                 min_interval: float = 0.5, debug: bool = False, dump_path: Path = Path("."),
+                 timeout: float = 20.):
         self.lang = lang
+        # 接口请求的超时时间（秒），避免上游无响应时一直占用执行线程
+        self.timeout = timeout
         self.base_url = "https://www.pixiv.net/ajax"
         self.session = requests.Session()
         self.session.cookies.set("PHPSESSID", php_session_id)
@@ -41,8 +55,8 @@ class PixivWebAPI(PixivApi):
         })
         if proxies and isinstance(proxies, dict):
             self.session.proxies.update(proxies)
-        self.min_interval = min_interval
-        self._last_request_time = 0.
+        # 所有线程、进程和副本共用 pixiv 的请求额度
+        self._limiter = RateLimiter("pixiv", 1 / min_interval) if min_interval > 0 else None
         self.debug = debug
         self.dump_path = None if dump_path is None else Path(dump_path)
 
@@ -51,18 +65,15 @@ class PixivWebAPI(PixivApi):
         return result is not None, result["name"]
 
     def resolve(self, url: str, method: Literal["GET", "POST"] = 'GET', data: Any = None) -> bytes:
-        return self.session.request(method=method, url=url, data=data,
+        return self.session.request(method=method, url=url, data=data, timeout=self.timeout,
                                     headers={"Referer": "https://www.pixiv.net/"}).content
 
     def request(self, method: str, endpoint: str, **kwargs) -> Json | None:
-        if (itv := time() - self._last_request_time) < self.min_interval:
-            s = self.min_interval - itv
-            logger.debug(f"请求过于频繁，等待{s:.2f}秒")
-            sleep(s)
-
-        self._last_request_time = time()
+        if self._limiter is not None:
+            self._limiter.acquire()
 
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        kwargs.setdefault("timeout", self.timeout)
 
         if method == "GET":
             if "params" not in kwargs or not kwargs["params"]:
@@ -97,6 +108,20 @@ class PixivWebAPI(PixivApi):
         return self.get(f"user/{user_id}/illusts/bookmarks",
                         params={"tag": tag, "offset": offset, "limit": limit, "rest": rest})
 
+    def iter_user_bookmarks(self, user_id: int | None = None, tag: str = "", limit: int = 48,
+                            rest: Literal["show", "hide"] = "show") -> Iterator[Json]:
+        """
+        流式获取全部收藏，每一页作为一帧响应返回
+        """
+        offset = 0
+        while True:
+            page = self.user_bookmarks(user_id, tag=tag, offset=offset, limit=limit, rest=rest)
+            yield page
+            offset += limit
+            if not page["works"] or offset >= page["total"]:
+                break
+
+    @cached(600, key="{illust_id}")
     def illust(self, illust_id: int) -> Json | None:
         """
         illustType: 0-普通；1-漫画；2-ugoira
@@ -105,14 +130,17 @@ class PixivWebAPI(PixivApi):
         """
         return self.get(f"illust/{illust_id}")
 
+    @cached(3600, key="{illust_id}")
     def illust_pages(self, illust_id: int | str) -> list[Json] | None:
         return self.get(f"illust/{illust_id}/pages")
 
+    @cached(600)
     def user_info(self, user_id: int | None = None) -> Json | None:
         if user_id is None:
             user_id = self.user_id
         return self.get(f"user/{user_id}", headers={"Referer": f"https://www.pixiv.net/member.php?id={user_id}"})
 
+    @cached(86400, key="{illust_id}")
     def ugoira_meta(self, illust_id: int | str) -> Json | None:
         return self.get(f"illust/{illust_id}/ugoira_meta")
 
@@ -140,7 +168,10 @@ class PixivWebAPI(PixivApi):
             out = io.BytesIO()
 
         successfully_downloaded = False
+        token = current_token()
         for attempt in range(max_retries):
+            # 请求已超时或被客户端取消时不再重试
+            token.raise_if_cancelled()
             try:
                 response = self.session.get(url, stream=True, timeout=timeout,
                                             headers={"Referer": "https://www.pixiv.net/"})
@@ -150,17 +181,13 @@ class PixivWebAPI(PixivApi):
 
                 if (mat := re.match(r".+/(?P<iid>\d+)_ugoira.+\.zip$", url)) is not None:
                     iid = mat.group("iid")
-                    zip_buffer = io.BytesIO(response.content)
                     frames = self.ugoira_meta(iid)["frames"]
                     logger.debug("开始转换ugoira为gif")
-                    with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
-                        images = [Image.open(io.BytesIO(zip_file.read(frame["file"]))) for frame in frames]
-                        durations = [frame["delay"] for frame in frames]
-                        images[0].save(out, format="gif", save_all=True, append_images=images[1:], duration=durations,
-                                       loop=0)
+                    out.write(self._ugoira_to_gif(response.content, frames))
                 else:
                     chunk_size = 1024 * 1024  # 1 MB
                     for chunk in response.iter_content(chunk_size=chunk_size):
+                        token.raise_if_cancelled()
                         if chunk:
                             out.write(chunk)
                 successfully_downloaded = True
@@ -169,12 +196,23 @@ class PixivWebAPI(PixivApi):
                 logger.warning(f"图片 {url} 下载出错：{e}，重试次数: {attempt + 1}/{max_retries}")
                 fail_reason.append(f"Error: {e}")
                 if attempt < max_retries - 1:
-                    sleep(timeout)
+                    token.wait(timeout)
                 else:
                     logger.error(f"图片 {url} 重试已超过最大次数，下载失败")
 
         return out if successfully_downloaded else None
 
+    def _ugoira_to_gif(self, data: bytes, frames: list[Json]) -> bytes:
+        """
+        将ugoira的zip转换为gif动图
+        """
+        out = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(data), 'r') as zip_file:
+            images = [Image.open(io.BytesIO(zip_file.read(frame["file"]))) for frame in frames]
+            durations = [frame["delay"] for frame in frames]
+            images[0].save(out, format="gif", save_all=True, append_images=images[1:], duration=durations, loop=0)
+        return out.getvalue()
+
     def save_img(self, url: str, path: str | Path, max_retries: int = 3, timeout: float = 10.) -> bool:
         """
         下载illust到文件
@@ -206,6 +244,7 @@ class PixivWebAPI(PixivApi):
     def top_illust(self, mode: Literal["all", "r18"] = "all"):
         return self.get(f"top/illust", params={"mode": mode})
 
+    @invalidates("illust", key="{illust_id}")
     def bookmarks_add(self, illust_id: int | str, *, restrict: int = 0, comment: str = "",
                       tags: list[str] | None = None) -> Json | None:
         tags = tags or []
@@ -217,6 +256,7 @@ class PixivWebAPI(PixivApi):
                                 "tags": tags
                             })
 
+    @invalidates("illust", key="{illust_id}")
     def bookmarks_delete(self, *, bookmark_id: int | str | None = None,
                          illust_id: int | str | None = None) -> Json | None:
         if bookmark_id is None:
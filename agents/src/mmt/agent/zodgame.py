@@ -9,6 +9,8 @@ from pathvalidate import sanitize_filename
 from requests import Session
 
 from litter.adapt import agent, FromConfig
+from litter.cache import cached
+from litter.ratelimit import rate_limit
 from mmt.api.zodgame import ZodgameApi
 
 
@@ -67,6 +69,7 @@ class ZodgameAgent(ZodgameApi):
         if cookies is not None:
             self.authorize(cookies)
 
+    @rate_limit("zodgame", 2, burst=4)
     def _request(self, method: str, url: str, **kwargs) -> bytes:
         if not url.startswith('http'):
             url = self.base_url + "/" + url.lstrip('/')
@@ -132,6 +135,7 @@ class ZodgameAgent(ZodgameApi):
             result.append(dict(id=tid, title=title, link=url, image=image_url, author=author))
         return result
 
+    @cached(300, key="{tid}")
     def get_view_thread(self, tid: str | int) -> dict[str, Any]:
         url = f"/forum.php?mod=viewthread&tid={tid}"
         resp = self.http_get(url)
@@ -1,51 +1,278 @@
+import collections.abc
 import inspect
 import re
-from typing import Self, Any, Callable
+import time
+from typing import Self, Any, Callable, Iterable, Iterator, get_origin
 
-from litter import publish, request
+from litter import publish, request, hedged_request, iter_request, iter_request_many, aio, shard, get_redis
+from litter.agent import PRIORITY_HEADER
+from litter.executor import HIGH, NORMAL, LOW
+from litter.model import LitterException, NoSubscriberException
+from litter.policy import Policy, LatencyWindow, CircuitBreaker
+from litter.stream import PUBSUB
+
+
+# 在客户端本地执行，不转为litter接口的方法
+LOCAL_METHODS = ("api", "aio_api", "batch", "iter_batch")
+
+# channel -> (耗时记录, 熔断器)，同一方法的所有客户端实例共用
+_policy_states: dict[str, tuple[LatencyWindow, CircuitBreaker | None]] = {}
+
+_STREAMING_RETURNS = (collections.abc.Iterator, collections.abc.Generator, collections.abc.Iterable,
+                      collections.abc.AsyncIterator, collections.abc.AsyncGenerator, collections.abc.AsyncIterable)
+
+
+def _is_streaming(method: Callable) -> bool:
+    """
+    返回值注解为 Iterator/Generator 等的方法视为流式接口
+    """
+    ann = inspect.signature(method).return_annotation
+    return get_origin(ann) in _STREAMING_RETURNS or ann in _STREAMING_RETURNS
+
+
+def _shard_key_getter(method: Callable, shard_key: str) -> Callable[[tuple, dict], Any]:
+    """
+    返回从调用参数中取出 shard_key 参数值的函数，参数可以是位置参数或关键字参数
+    """
+    sig = inspect.signature(method)
+
+    def _get(args: tuple, kwargs: dict) -> Any:
+        if shard_key in kwargs:
+            return kwargs[shard_key]
+        try:
+            return sig.bind_partial(*args, **kwargs).arguments.get(shard_key)
+        except TypeError:
+            return None
+
+    return _get
+
+
+def _probe_ok(resp) -> bool:
+    body = resp.body
+    return bool(body[0]) if isinstance(body, (list, tuple)) and body else True
+
+
+def _with_policy(channel: str, policy: Policy, call: Callable, probe: Callable[[], bool]) -> Callable:
+    """
+    按 policy 对冲和熔断 call(channel, body, hedge_after)
+    """
+    if channel not in _policy_states:
+        breaker = CircuitBreaker(channel, policy.breaker_threshold, probe, policy.probe_interval) \
+            if policy.breaker_threshold else None
+        _policy_states[channel] = (LatencyWindow(), breaker)
+    latency, breaker = _policy_states[channel]
+
+    def _call(ch: str, body):
+        if breaker is not None:
+            breaker.before_call()
+        hedge_after = latency.percentile(policy.hedge_percentile, policy.hedge_min_samples) if policy.hedge else None
+        start = time.time()
+        try:
+            resp = call(ch, body, hedge_after)
+        except LitterException:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        latency.add(time.time() - start)
+        if breaker is not None:
+            breaker.record_success()
+        return resp
+
+    return _call
 
 
 class ApiBase:
     app_name: str
     special_args: dict[str, Any]
+    transport: str = PUBSUB
 
     @classmethod
     def _patch(cls, method: Callable, *, ret: bool | None = None, headers: dict[str, Any] | None = None,
-               timeout: int = 5):
+               timeout: int = 5, transport: str | None = None, streaming: bool | None = None,
+               shard_key: str | None = None, policy: Policy | dict[str, Any] | None = None):
         if ret is None:
             ret = inspect.signature(method).return_annotation is not None
+        if streaming is None:
+            streaming = _is_streaming(method)
+        transport = transport or cls.transport
+        channel = f"{cls.app_name}:{method.__name__}"
+        get_key = _shard_key_getter(method, shard_key) if shard_key else None
+
+        def _channel(args: tuple, kwargs: dict) -> str:
+            if get_key is None:
+                return channel
+            return shard.route(get_redis(), cls.app_name, channel, get_key(args, kwargs))
+
+        if streaming:
+            def _stream(*args, **kwargs):
+                ch = _channel(args, kwargs)
+                kwargs["_"] = args
+                for resp in iter_request(ch, kwargs, headers=headers, timeout=timeout, transport=transport):
+                    yield resp.body
 
-        if ret:
-            m = lambda channel, body: request(channel, body, headers=headers, timeout=timeout)
+            return _stream
+
+        if ret and policy is not None:
+            policy = policy if isinstance(policy, Policy) else Policy(**policy)
+            m = _with_policy(
+                channel, policy,
+                lambda ch, body, hedge_after: hedged_request(ch, body, hedge_after=hedge_after, headers=headers,
+                                                             timeout=timeout, transport=transport),
+                lambda: _probe_ok(request(f"{cls.app_name}:{policy.probe}", {"_": []}, timeout=timeout)))
+        elif ret:
+            m = lambda channel, body: request(channel, body, headers=headers, timeout=timeout, transport=transport)
         else:
-            m = lambda channel, body: publish(channel, body, headers=headers)
+            m = lambda channel, body: publish(channel, body, headers=headers, transport=transport)
 
         def _inner(*args, **kwargs):
+            ch = _channel(args, kwargs)
             kwargs["_"] = args
-            resp = m(f"{cls.app_name}:{method.__name__}", kwargs)
+            try:
+                resp = m(ch, kwargs)
+            except NoSubscriberException:
+                if ch == channel:
+                    raise
+                # 选中的副本已退出但还没有从哈希环中移除，改为发送到共享channel
+                resp = m(channel, kwargs)
             return resp.body
 
         return _inner
 
     @classmethod
-    def api(cls) -> Self:
+    def _patch_aio(cls, method: Callable, *, ret: bool | None = None, headers: dict[str, Any] | None = None,
+                   timeout: int = 5, transport: str | None = None, streaming: bool | None = None,
+                   shard_key: str | None = None, policy: Policy | dict[str, Any] | None = None):
+        if ret is None:
+            ret = inspect.signature(method).return_annotation is not None
+        if streaming is None:
+            streaming = _is_streaming(method)
+        transport = transport or cls.transport
+        channel = f"{cls.app_name}:{method.__name__}"
+        get_key = _shard_key_getter(method, shard_key) if shard_key else None
+
+        async def _channel(args: tuple, kwargs: dict) -> str:
+            if get_key is None:
+                return channel
+            return await shard.aio_route(aio.get_redis(), cls.app_name, channel, get_key(args, kwargs))
+
+        if streaming:
+            async def _stream(*args, **kwargs):
+                ch = await _channel(args, kwargs)
+                kwargs["_"] = args
+                async for resp in aio.iter_request(ch, kwargs, headers=headers, timeout=timeout,
+                                                   transport=transport):
+                    yield resp.body
+
+            return _stream
+
+        async def _inner(*args, **kwargs):
+            ch = await _channel(args, kwargs)
+            kwargs["_"] = args
+            if ret:
+                try:
+                    resp = await aio.request(ch, kwargs, headers=headers, timeout=timeout, transport=transport)
+                except NoSubscriberException:
+                    if ch == channel:
+                        raise
+                    resp = await aio.request(channel, kwargs, headers=headers, timeout=timeout, transport=transport)
+                return resp.body
+            await aio.publish(ch, kwargs, headers=headers, transport=transport)
+
+        return _inner
+
+    @classmethod
+    def _special_args(cls, name: str) -> dict[str, Any]:
+        for name_pat, sp in cls.special_args.items():
+            if re.match(name_pat, name):
+                return sp
+        return {}
+
+    @classmethod
+    def _build_api(cls, patch: Callable, priority: str | None = None) -> Self:
+        if priority not in (HIGH, NORMAL, LOW, None):
+            raise ValueError(f"Invalid priority: {priority}")
         obj = cls.__new__(cls)
-        methods = [x for x in inspect.getmembers(obj, predicate=inspect.ismethod) if not x[0].startswith("_")]
+        obj._headers = {PRIORITY_HEADER: priority} if priority else {}
+        methods = [x for x in inspect.getmembers(obj, predicate=inspect.ismethod)
+                   if not x[0].startswith("_") and x[0] not in LOCAL_METHODS]
         for name, method in methods:
-            extra_args = {}
-            for name_pat, sp in cls.special_args.items():
-                if re.match(name_pat, name):
-                    extra_args = sp
-                    break
-            setattr(obj, name, cls._patch(method, ret=True, **extra_args))
+            sp = cls._special_args(name)
+            sp = {**sp, "headers": {**obj._headers, **(sp.get("headers") or {})}}
+            setattr(obj, name, patch(method, ret=True, **sp))
         return obj
 
+    @classmethod
+    def api(cls, priority: str | None = None) -> Self:
+        """
+        :param priority: 该实例发出的请求的优先级 high、normal、low，agent按优先级分别排队；
+            None表示使用 litter.with_priority 设置的优先级（处理请求时继承该请求的优先级）
+        """
+        return cls._build_api(cls._patch, priority)
+
+    @classmethod
+    def aio_api(cls, priority: str | None = None) -> Self:
+        """
+        asyncio版本的api，所有方法都返回coroutine，需要先 await litter.aio.connect()
+        """
+        return cls._build_api(cls._patch_aio, priority)
+
+    def iter_batch(self, method: str, calls: Iterable[tuple | dict | tuple[tuple, dict]], *,
+                   concurrency: int = 16, timeout: int | None = None) -> Iterator[tuple[int, Any | LitterException]]:
+        """
+        批量调用同一个方法，按完成顺序返回 (序号, 返回值)，失败的调用返回对应的异常
+        :param method: 方法名
+        :param calls: 每次调用的参数：位置参数tuple、关键字参数dict或 (args, kwargs)
+        :param concurrency: 同时等待响应的最大调用数
+        :param timeout: 单次调用的超时时间，缺省使用 @api 中该方法的设置
+        """
+        sp = self._special_args(method)
+        channel = f"{self.app_name}:{method}"
+        get_key = _shard_key_getter(getattr(type(self), method).__get__(self), sp["shard_key"]) \
+            if sp.get("shard_key") else None
+        requests = []
+        for call in calls:
+            if isinstance(call, dict):
+                args, kwargs = (), call
+            elif len(call) == 2 and isinstance(call[0], tuple) and isinstance(call[1], dict):
+                args, kwargs = call
+            else:
+                args, kwargs = call, {}
+            ch = channel if get_key is None else \
+                shard.route(get_redis(), self.app_name, channel, get_key(args, kwargs))
+            requests.append((ch, {**kwargs, "_": args}))
+        headers = {**getattr(self, "_headers", {}), **(sp.get("headers") or {})}
+        for index, result in iter_request_many(requests, headers=headers,
+                                               timeout=timeout or sp.get("timeout", 5), concurrency=concurrency,
+                                               transport=sp.get("transport") or self.transport):
+            yield index, (result if isinstance(result, LitterException) else result.body)
+
+    def batch(self, method: str, calls: Iterable[tuple | dict | tuple[tuple, dict]], *,
+              concurrency: int = 16, timeout: int | None = None) -> list[Any | LitterException]:
+        """
+        批量调用同一个方法，按调用顺序返回结果，参数见 iter_batch
+        """
+        calls = list(calls)
+        results = [None] * len(calls)
+        for index, result in self.iter_batch(method, calls, concurrency=concurrency, timeout=timeout):
+            results[index] = result
+        return results
+
     def health_check(self) -> tuple[bool, str]:
         return True, "OK"
 
-def api(app_name: str, **kwargs):
+def api(app_name: str, *, transport: str = PUBSUB, **kwargs):
+    """
+    声明litter接口的客户端
+    :param app_name: litter 应用名称
+    :param transport: pubsub 或 stream
+    :param kwargs: 方法名正则 -> 该方法的参数：ret、headers、timeout、transport、streaming，
+        shard_key：按该参数的值一致性哈希选择副本，相同值的请求总是发送到同一个副本（需要agent设置 replica_id），
+        以及 policy：litter.policy.Policy 或其参数，对冲请求和熔断，只作用于 api()
+    """
+
     def _inner(cls):
         cls.app_name = app_name
+        cls.transport = transport
         cls.special_args = kwargs
         return cls
 
@@ -1,12 +1,13 @@
 from pathlib import Path
-from typing import Literal, TypeAlias, Any
+from typing import Literal, TypeAlias, Any, Iterator
 
 from .framework import ApiBase, api
 
 Json: TypeAlias = dict[str, Any] | list[Any]
 
 
-@api("mmt.agent.pixiv", download={"timeout": 120})
+@api("mmt.agent.pixiv", download={"timeout": 120, "shard_key": "url"}, save_img={"shard_key": "url"},
+     **{r"illust|ugoira_meta|bookmarks_(add|delete)": {"shard_key": "illust_id"}})
 class PixivApi(ApiBase):
     def resolve(self, url: str, method: Literal["GET", "POST"] = 'GET', data: Any = None) -> bytes:
         ...
@@ -21,6 +22,13 @@ class PixivApi(ApiBase):
                        limit: int = 48, rest: Literal["show", "hide"] = "show") -> Json | None:
         ...
 
+    def iter_user_bookmarks(self, user_id: int | None = None, tag: str = "", limit: int = 48,
+                            rest: Literal["show", "hide"] = "show") -> Iterator[Json]:
+        """
+        流式获取全部收藏，每一页作为一帧响应返回
+        """
+        ...
+
     def illust(self, illust_id: int) -> Json | None:
         """
         illustType: 0-普通；1-漫画；2-ugoira
@@ -15,7 +15,7 @@ from .model import initialize_database
 
 
 class PixivFavArchiver:
-    papi: PixivApi = PixivApi.api()
+    papi: PixivApi = PixivApi.api(priority="low")
 
     def __init__(self):
         self.task_status = {}
@@ -21,7 +21,7 @@ APP_NAME = "random_image_server"
 
 util.default_arg_config_loggers()
 litter.connect(app_name=APP_NAME)
-api: PixivApi = PixivApi.api()
+api: PixivApi = PixivApi.api(priority="high")
 
 HTTP_PORT = config.get("random_image_server/http/port", 8080)
 IMAGE_FOLDER = Path(config.get("random_image_server/images/folder", "./images"))
@@ -1,6 +1,7 @@
 from typing import Sequence
 
 from .agent import *
+from .cancel import *
 from .model import *
 
 
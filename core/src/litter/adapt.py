@@ -1,10 +1,16 @@
+import functools
 import inspect
-from typing import Callable, Any
+import pickle
+from typing import Callable, Any, Collection
 
 from loguru import logger
 
 from confctl import util, config
-from litter.agent import subscribe, listen_bg, listen
+from litter import cache, shard
+from litter.agent import subscribe, listen_bg, listen, get_redis, _resolve_credentials
+from litter.executor import ChannelLimit
+from litter.process import ProcessPool
+from litter.stream import PUBSUB
 from litter.model import Message
 
 __all__ = [
@@ -14,37 +20,100 @@ __all__ = [
 ]
 
 
-def _adapt_method(name: str, method: Callable) -> Callable:
+def _adapt_method(app_name: str, name: str, method: Callable) -> Callable:
+    call = cache.wrap(get_redis, app_name, name, method)
+
     def _inner(message: Message):
-        kwargs = message.body
+        # body 是缓存的属性，重试和其他处理函数会再次读取，不能修改
+        kwargs = dict(message.body)
         args = kwargs.pop("_", [])
-        return method(*args, **kwargs)
+        return call(args, kwargs, no_cache=message.headers.get("litter-cache-control") == "no-cache")
 
     return _inner
 
 
+def _pool_credentials(redis_credentials: dict[str, Any] | None) -> dict[str, Any]:
+    """
+    子进程连接的redis与本进程相同
+    """
+    if redis_credentials is None and (client := get_redis()) is not None:
+        kwargs = client.connection_pool.connection_kwargs
+        return {k: kwargs.get(k) for k in ("host", "port", "password", "db")}
+    return _resolve_credentials(None, None, None, 0, redis_credentials)
+
+
 def adapt(obj, app_name: str, *,
           redis_credentials: dict[str, Any] | None = None, bg: bool = False,
-          executor_workers: int = 4
-          ) -> None:
+          executor_workers: int = 4, transport: str = PUBSUB, stream_options: dict[str, Any] | None = None,
+          max_queue: int | None = None, channel_limits: dict[str, ChannelLimit | dict[str, Any]] | None = None,
+          singleflight: bool = True, process_methods: Collection[str] | None = None, process_workers: int = 2,
+          process_factory: Callable[[], Any] | None = None, replica_id: str | None = None,
+          reserved_workers: int = 0, priority_weights: dict[str, int] | None = None) -> None:
     """
-    将一个对象转为监听litter消息的服务应用，对象的 method_name 方法会被转为监听 app_name:method_name 的litter接口
+    将一个对象转为监听litter消息的服务应用，对象的 method_name 方法会被转为监听 app_name:method_name 的litter接口。
+    方法可以用 litter.cache.cached / invalidates 声明结果缓存，请求头 litter-cache-control 为 no-cache 时不读取缓存。
+    应用及其方法、负载和 health_check 的结果会定期写入注册表，可以通过 litter agents 命令查看
     :param obj: 被转换的对象
     :param app_name: 应用名称
     :param redis_credentials: 连接litter的redis配置，缺省时自动读取配置文件中的redis项
     :param bg: 是否后台运行
     :param executor_workers:
+    :param transport: pubsub：每个副本都执行请求；stream：基于Redis Streams消费者组，每个请求只由一个副本执行
+    :param stream_options: stream模式的参数，见 litter.stream.listen_stream
+    :param max_queue: 等待执行的最大请求数，超出时立即拒绝；None表示不限制
+    :param channel_limits: 方法名或channel（支持通配符）-> ChannelLimit(concurrency, max_queue)
+    :param singleflight: 参数相同的请求正在执行时，后到的请求共享其结果而不是重复执行
+    :param process_methods: 在子进程中执行的方法名，用于CPU密集的方法，参数和返回值需要可以pickle；
+        可以是不作为接口的私有方法，对象的其他方法调用它们时也在子进程中执行
+    :param process_workers: 子进程数；调用按请求的优先级排队，reserved_workers 同样适用于子进程（至少留一个给其他请求）
+    :param process_factory: 在子进程中创建对象的函数，缺省时将obj pickle后复制到子进程
+    :param replica_id: 副本标识，设置时额外监听 app_name:method_name@replica_id 并加入 app_name 的哈希环，
+        客户端可以按参数将相同key的请求发送到同一个副本，见 mmt.api.framework.api 的 shard_key；
+        副本重启后应使用相同的标识以保持key的分配不变
+    :param reserved_workers: 只执行高优先级请求的线程数，客户端通过 litter-priority 请求头指定优先级
+    :param priority_weights: 优先级 -> 权重，默认 high: 8, normal: 3, low: 1
     :return: None
     """
     methods = [x for x in inspect.getmembers(obj, predicate=inspect.ismethod)
-               if not x[0].startswith("_") and x[0] != "api"]
+               if not x[0].startswith("_") and x[0] not in ("api", "aio_api", "batch", "iter_batch")]
+
+    pool = None
+    if process_methods:
+        if unknown := {name for name in process_methods if not callable(getattr(obj, name, None))}:
+            logger.warning(f"Process methods not found: {unknown}")
+        pool = ProcessPool(process_factory or functools.partial(pickle.loads, pickle.dumps(obj)), process_workers,
+                           redis_credentials=_pool_credentials(redis_credentials), app_name=app_name,
+                           # 子进程同样为高优先级的请求保留，但至少留一个进程给其他请求
+                           reserved_workers=min(reserved_workers, process_workers - 1))
+        # 对象的其他方法调用这些方法时同样在子进程中执行
+        for name in set(process_methods) - unknown:
+            setattr(obj, name, pool.proxy(name, getattr(obj, name)))
+
     logger.info(f"Adapting {len(methods)} methods of {app_name}:")
     for name, method in methods:
-        subscribe(f"{app_name}:{name}", _adapt_method(name, method))
-        logger.info(f"\t{name}")
+        in_process = pool is not None and name in process_methods
+        if in_process:
+            method = getattr(obj, name)
+        func = _adapt_method(app_name, name, method)
+        subscribe(f"{app_name}:{name}", func)
+        if replica_id is not None:
+            subscribe(shard.replica_channel(f"{app_name}:{name}", replica_id), func)
+        logger.info(f"\t{name}{' (process)' if in_process else ''}")
+
+    if channel_limits:
+        channel_limits = {(k if ":" in k else f"{app_name}:{k}"): v for k, v in channel_limits.items()}
+        if replica_id is not None:
+            # 副本专属的channel与共享channel使用相同的限制
+            channel_limits.update({shard.replica_channel(k, replica_id): v for k, v in channel_limits.items()})
+    if replica_id is not None:
+        shard.join(get_redis, app_name, replica_id)
 
     (listen_bg if bg else listen)(app_name=app_name, redis_credentials=redis_credentials,
-                                  executor_workers=executor_workers)
+                                  executor_workers=executor_workers, transport=transport,
+                                  stream_options=stream_options, max_queue=max_queue,
+                                  channel_limits=channel_limits, singleflight=singleflight,
+                                  health_check=getattr(obj, "health_check", None),
+                                  reserved_workers=reserved_workers, priority_weights=priority_weights)
 
 
 class FromConfig:
@@ -59,7 +128,12 @@ class FromConfig:
 def agent(
         app_name: str, *, init_args: tuple | None = None, init_kwargs: dict[str, Any] | FromConfig | None = None,
         init_config: bool = True, log_config_key=None, redis_credentials: dict[str, Any] | None = None,
-        executor_workers: int = 4
+        executor_workers: int = 4, transport: str = PUBSUB, stream_options: dict[str, Any] | None = None,
+        max_queue: int | FromConfig | None = None,
+        channel_limits: dict[str, ChannelLimit | dict[str, Any]] | FromConfig | None = None,
+        singleflight: bool = True, process_methods: Collection[str] | None = None, process_workers: int = 2,
+        replica_id: str | FromConfig | None = None, reserved_workers: int | FromConfig = 0,
+        priority_weights: dict[str, int] | FromConfig | None = None
 ):
     """
     将一个类转为监听litter消息的服务应用，类的 method_name 方法会被转为监听 app_name:method_name 的litter接口
@@ -70,12 +144,22 @@ def agent(
     :param log_config_key: 日志配置在配置文件中的位置
     :param redis_credentials: 连接litter的redis配置，缺省时自动读取配置文件中的redis项
     :param executor_workers:
+    :param transport: pubsub 或 stream，见 adapt
+    :param stream_options: stream模式的参数，见 litter.stream.listen_stream
+    :param max_queue: 见 adapt
+    :param channel_limits: 见 adapt
+    :param singleflight: 见 adapt
+    :param process_methods: 在子进程中执行的方法名，子进程使用相同的参数创建自己的实例，见 adapt
+    :param process_workers: 子进程数
+    :param replica_id: 见 adapt
+    :param reserved_workers: 见 adapt
+    :param priority_weights: 见 adapt
     :return:
     """
 
     def _inner(clazz):
         if clazz.__module__ == "__main__":
-            nonlocal init_args, init_kwargs
+            nonlocal init_args, init_kwargs, max_queue, channel_limits, replica_id, reserved_workers, priority_weights
             if init_config:
                 util.default_arg_config_loggers(log_config_key=log_config_key)
 
@@ -91,9 +175,24 @@ def agent(
                 for k, arg in init_kwargs.items()
             } if init_kwargs else {}
 
+            if isinstance(max_queue, FromConfig):
+                max_queue = max_queue()
+            if isinstance(channel_limits, FromConfig):
+                channel_limits = channel_limits()
+            if isinstance(replica_id, FromConfig):
+                replica_id = replica_id()
+            if isinstance(reserved_workers, FromConfig):
+                reserved_workers = reserved_workers()
+            if isinstance(priority_weights, FromConfig):
+                priority_weights = priority_weights()
+
             delegate = clazz(*init_args, **init_kwargs)
             adapt(delegate, app_name=app_name, bg=False, redis_credentials=redis_credentials,
-                  executor_workers=executor_workers)
+                  executor_workers=executor_workers, transport=transport, stream_options=stream_options,
+                  max_queue=max_queue, channel_limits=channel_limits, singleflight=singleflight,
+                  process_methods=process_methods, process_workers=process_workers,
+                  process_factory=functools.partial(clazz, *init_args, **init_kwargs), replica_id=replica_id,
+                  reserved_workers=reserved_workers, priority_weights=priority_weights)
         return clazz
 
     return _inner
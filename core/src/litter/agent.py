@@ -1,37 +1,87 @@
+import asyncio
 import atexit
+import inspect
+import json
+import queue
 import threading
+import time
 import traceback
 import uuid
-from concurrent.futures import Executor, ThreadPoolExecutor, Future
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 from threading import Lock
-from typing import Callable, Collection, Any, Iterator
+from typing import Callable, Collection, Any, Iterator, Iterable
 
 import redis
 from loguru import logger
 
-from litter.model import Message, serialize, RequestTimeoutException, Response, RemoteFunctionRaisedException
+from litter import blob, stream, cancel, metrics, trace, compress, shard, registry, retry
+from litter.executor import BoundedExecutor, ChannelLimit, HIGH, NORMAL, LOW
+from litter.codec import JSON, encode, available_codecs, negotiate_codec
+from litter.model import Message, LitterException, RequestTimeoutException, Response, \
+    RemoteFunctionRaisedException, RequestRejectedException, RequestCancelledException, NoSubscriberException
 
 __all__ = [
     "connect",
     "disconnect",
     "subscribe",
+    "unsubscribe",
     "publish",
     "listen",
     "listen_bg",
     "get_appname",
+    "get_redis",
+    "set_codec",
+    "get_codec",
+    "set_blob_store",
+    "set_compression",
+    "set_retry_policy",
+    "set_response_mirror",
     "request",
-    "iter_request"
+    "iter_request",
+    "request_many",
+    "hedged_request",
+    "with_priority",
+    "current_priority",
+    "iter_request_many",
+    "executor_stats"
 ]
 
 _redis_client: redis.client.Redis | None = None
 _lock = Lock()
 _sub_entity: redis.client.PubSub | None = None
+# listen 的传输方式，None表示尚未开始监听
+_transport: str | None = None
 _register_map: dict[str, list[Callable]] = {}
 _litter_thread: threading.Thread | None = None
 _app_name: str | None = None
-_executor: Executor | None = None
+_executor: BoundedExecutor | None = None
+_codec: str = JSON
+MIRROR_OFF, MIRROR_HEADERS, MIRROR_FULL = "off", "headers", "full"
+_response_mirror: str = MIRROR_OFF
 _RESPONSE_QUEUE_PREFIX = "LRQ:"  # lt response queue
+# 本进程所有请求共用一个响应队列，由 _reply_thread 按 litter-request-id 分发给等待中的请求
+_reply_queue: str | None = None
+_reply_thread: threading.Thread | None = None
+_reply_waiters: dict[str, queue.Queue] = {}
+_TIMEOUT_SUFFIX = ":timeout"
+METRICS_SUFFIX = ":_metrics"
+# 对冲请求（hedged_request 发出的第二个请求）的标记，agent不会将其与相同的请求合并
+HEDGE_HEADER = "litter-hedge"
+# 请求的优先级，agent按优先级分别排队，见 BoundedExecutor
+PRIORITY_HEADER = "litter-priority"
+# 本上下文发出的请求的优先级；处理请求时为该请求的优先级，嵌套请求随之继承
+_priority: ContextVar[str | None] = ContextVar("litter_priority", default=None)
+# 正在排队或执行的请求的取消令牌，request-id -> CancelToken
+_cancel_tokens: dict[str, cancel.CancelToken] = {}
+# 正在执行的请求，(handler, channel, 优先级, 规范化的body) -> 等待同一结果的 [(message, future)]
+_singleflight: bool = True
+# 编码后超过该大小的请求不合并
+_FLIGHT_MAX_BYTES = 64 * 1024
+_flight_lock = Lock()
+_flights: dict[tuple, list[tuple[Message, Future]]] = {}
 
 
 def connected() -> bool:
@@ -39,6 +89,13 @@ def connected() -> bool:
         return _redis_client is not None
 
 
+def get_redis() -> redis.Redis | None:
+    """
+    当前连接的redis客户端，未连接时返回None
+    """
+    return _redis_client
+
+
 def get_appname() -> str:
     global _app_name
     if _app_name is None:
@@ -53,15 +110,73 @@ def set_appname(app_name: str) -> None:
         logger.info(f"AppName changed to {_app_name}")
 
 
-def connect(host: str | None = None, port: int | str | None = None, password: str | None = None, db: int = 0,
-            *, redis_credentials: dict[str, Any] | None = None, app_name: str | None = None):
+def get_codec() -> str:
+    return _codec
+
+
+def set_codec(codec: str) -> None:
+    """
+    设置本进程发出消息所用的编码；响应总是按请求方的 litter-accept-codecs 协商
+    """
+    global _codec
+    if codec not in available_codecs():
+        raise ValueError(f"Codec {codec} is not available, choices: {available_codecs()}")
+    _codec = codec
+
+
+def set_response_mirror(mode: str) -> None:
+    """
+    设置是否将响应镜像发布到 <channel>:response
+    :param mode: off: 不发布；headers: 只发布响应头；full: 发布完整的响应信封
+    """
+    global _response_mirror
+    if mode not in (MIRROR_OFF, MIRROR_HEADERS, MIRROR_FULL):
+        raise ValueError(f"Invalid response mirror mode: {mode}")
+    _response_mirror = mode
+
+
+def set_blob_store(store: blob.BlobStore | str | None, *, threshold: int | None = None, ttl: int = 300) -> None:
+    """
+    设置大消息体的外部存储，编码后超过 threshold 字节的消息体只在信封中传递引用
+    :param store: "redis" 表示存入redis（需要先connect）；其他字符串视为共享目录路径；None表示关闭
+    :param threshold: 阈值（字节）
+    :param ttl: 数据的有效期（秒）
+    """
+    if isinstance(store, str):
+        if store == "redis":
+            if _redis_client is None:
+                raise RuntimeError("Redis is not connected, you must connect first by calling 'connect(host, port)'")
+            store = blob.RedisBlobStore(_redis_client, ttl=ttl)
+        else:
+            store = blob.LocalBlobStore(store, ttl=ttl)
+    blob.configure(store, threshold)
+
+
+def set_compression(rules: dict[str, compress.Compression | dict[str, Any] | None] | None) -> None:
+    """
+    设置各channel发出的请求和响应的压缩方式，消息体较大的文本类channel可以显著减少redis的带宽和内存占用
+    :param rules: channel（支持通配符）-> Compression(algorithm, level, threshold) 或其参数，见 litter.compress.configure
+    """
+    compress.configure(rules)
+
+
+def set_retry_policy(rules: dict[str, retry.RetryPolicy | dict[str, Any] | None] | None) -> None:
+    """
+    设置不需要响应的消息（publish）处理失败时的重试策略，全部失败后写入死信列表
+    :param rules: channel（支持通配符）-> RetryPolicy(max_attempts, backoff, ...) 或其参数，见 litter.retry.configure
+    """
+    retry.configure(rules)
+
+
+def _resolve_credentials(host: str | None, port: int | str | None, password: str | None, db: int,
+                         redis_credentials: dict[str, Any] | None) -> dict[str, Any]:
     """
     redis_credentials > (host, port, password) > config.get("redis")
     """
     if redis_credentials is None:
         if host is None and port is None and password is None:
             from confctl import config
-            redis_credentials = config.get("redis")
+            redis_credentials = dict(config.get("redis"))
             redis_credentials["password"] = redis_credentials.get("password", None)
             redis_credentials["db"] = redis_credentials.get("db", 0)
         else:
@@ -71,15 +186,39 @@ def connect(host: str | None = None, port: int | str | None = None, password: st
                 "password": password,
                 "db": db,
             }
+    return redis_credentials
+
+
+def connect(host: str | None = None, port: int | str | None = None, password: str | None = None, db: int = 0,
+            *, redis_credentials: dict[str, Any] | None = None, app_name: str | None = None,
+            codec: str | None = None):
+    """
+    redis_credentials > (host, port, password) > config.get("redis")
+    """
+    from confctl import config
+    redis_credentials = _resolve_credentials(host, port, password, db, redis_credentials)
 
     global _redis_client
     if app_name is not None:
         set_appname(app_name)
+    if codec is not None:
+        set_codec(codec)
 
     if _redis_client is None:
         with _lock:
-            _redis_client = redis.StrictRedis(decode_responses=True, **redis_credentials)
+            _redis_client = redis.StrictRedis(decode_responses=False, **redis_credentials)
             _redis_client.client()
+        blob.register(blob.RedisBlobStore(_redis_client))
+        set_response_mirror(config.get("litter/response_mirror", _response_mirror))
+        if (trace_conf := config.get("litter/trace", None)) is not None:
+            trace.configure(trace_conf)
+        if (blob_conf := config.get("litter/blob", None)) is not None:
+            set_blob_store(blob_conf.get("store", "redis"), threshold=blob_conf.get("threshold"),
+                           ttl=blob_conf.get("ttl", 300))
+        if (compression_conf := config.get("litter/compression", None)) is not None:
+            set_compression(compression_conf)
+        if (retry_conf := config.get("litter/retry", None)) is not None:
+            set_retry_policy(retry_conf)
         redis_credentials.pop("password", None)
         logger.info(
             f"Redis connected {redis_credentials} with name {get_appname()}")
@@ -90,20 +229,62 @@ def connect(host: str | None = None, port: int | str | None = None, password: st
 def disconnect() -> None:
     global _redis_client, _sub_entity
     if _redis_client is not None:
-        _redis_client.close()
-        _redis_client = None
+        with _lock:
+            client, _redis_client = _redis_client, None
+            sub, _sub_entity = _sub_entity, None
+        if sub is not None:
+            # 关闭连接以唤醒阻塞在读取上的监听线程
+            sub.close()
+        shard.leave(client)
+        registry.stop(client)
+        client.close()
         logger.info("Redis disconnected")
 
 
+def _is_pattern(channel: str) -> bool:
+    return any(c in channel for c in "*?[")
+
+
+def _listen_keys(key: str) -> list[str]:
+    """
+    监听 key 需要订阅的channel：stream模式下请求通过 Redis Streams 接收，只需订阅超时通知。
+    <app>:_metrics 返回的是各副本自己的指标，总是通过 pubsub 接收
+    """
+    if _transport == stream.STREAM and not key.endswith(METRICS_SUFFIX):
+        return [f"{key}{_TIMEOUT_SUFFIX}"]
+    return [key, f"{key}{_TIMEOUT_SUFFIX}"]
+
+
+def _update_subscription(keys: list[str], subscribed: bool) -> None:
+    """
+    普通channel使用 SUBSCRIBE，只有含通配符的才使用 PSUBSCRIBE
+    """
+    if (sub := _sub_entity) is None or not keys:
+        return
+    channels = [k for k in keys if not _is_pattern(k)]
+    patterns = [k for k in keys if _is_pattern(k)]
+    if channels:
+        (sub.subscribe if subscribed else sub.unsubscribe)(*channels)
+    if patterns:
+        (sub.psubscribe if subscribed else sub.punsubscribe)(*patterns)
+
+
 def subscribe(pattern: str | Collection[str], func: Callable[[Message], Message | None] | None = None):
+    """
+    注册处理函数，可以在监听开始后调用
+    """
     if func is not None:
         global _register_map
         if isinstance(pattern, str):
             pattern = [pattern]
+        new_keys = []
         for p in pattern:
             if p not in _register_map:
                 _register_map[p] = []
+                new_keys.extend(_listen_keys(p))
             _register_map[p].append(func)
+        if _transport is not None:
+            _update_subscription(new_keys, True)
         return None
     else:
         def warp(_func):
@@ -113,129 +294,831 @@ def subscribe(pattern: str | Collection[str], func: Callable[[Message], Message
         return warp
 
 
-def publish(channel: str, body, *, headers: dict[str, Any] | None = None):
-    if _redis_client is None:
-        raise RuntimeError("Redis is not connected, you must connect first by calling 'connect(host, port)'")
+def unsubscribe(pattern: str | Collection[str], func: Callable[[Message], Message | None] | None = None) -> None:
+    """
+    移除处理函数，func为None时移除该channel的全部处理函数；正在执行的请求不受影响
+    """
+    if isinstance(pattern, str):
+        pattern = [pattern]
+    removed_keys = []
+    for p in pattern:
+        funcs = _register_map.get(p, [])
+        if func is not None and func in funcs:
+            funcs.remove(func)
+        if func is None or not funcs:
+            if _register_map.pop(p, None) is not None:
+                removed_keys.extend(_listen_keys(p))
+    if _transport is not None:
+        _update_subscription(removed_keys, False)
+
 
+def _envelope(body, headers: dict[str, Any] | None) -> dict[str, Any]:
     if headers is None:
         headers = {}
 
     headers["litter-name"] = get_appname()
     headers["litter-datetime"] = datetime.now().isoformat()
 
-    message = {
+    return {
         "headers": headers,
         "body": body,
     }
 
-    return _redis_client.publish(channel, serialize(message))
 
+def _encode(channel: str, envelope: dict[str, Any], codec: str) -> str | bytes:
+    """
+    编码信封，按需压缩消息体；编码后仍超过阈值时存入外部存储
+    """
+    return blob.offload(envelope, compress.encode_envelope(channel, envelope, codec), codec)
 
-def request(channel: str, body, *, headers: dict[str, Any] | None = None, timeout: int = 15) -> Response:
-    assert timeout > 0
 
-    request_id = str(uuid.uuid4().hex.replace("-", ""))
-    response_queue = f"{_RESPONSE_QUEUE_PREFIX}{channel}:{request_id}"
+def publish(channel: str, body, *, headers: dict[str, Any] | None = None, transport: str = stream.PUBSUB):
+    if _redis_client is None:
+        raise RuntimeError("Redis is not connected, you must connect first by calling 'connect(host, port)'")
 
-    if headers is None:
-        headers = {}
-    headers["litter-request-id"] = request_id
-    headers["litter-response-queue"] = response_queue
+    start = time.time()
+    data = _encode(channel, _envelope(body, headers), _codec)
+    metrics.observe("litter_publish_bytes", len(data), buckets=metrics.SIZE_BUCKETS, channel=channel,
+                    app=get_appname())
+    if transport == stream.STREAM:
+        ret = stream.xadd(_redis_client, channel, data)
+    else:
+        ret = _redis_client.publish(channel, data)
+    if headers is not None:
+        trace.record("publish", headers, start, time.time(), channel=channel, app=get_appname(), bytes=len(data))
+    return ret
+
+
+def _reply_loop():
+    while True:
+        with _lock:
+            client = _redis_client
+        if client is None:
+            break
+        try:
+            result = client.brpop([_reply_queue], timeout=1)
+        except redis.exceptions.RedisError as e:
+            if not connected():
+                break
+            logger.error(f"Error while reading response queue {_reply_queue}: {e}")
+            time.sleep(1)
+            continue
+        if result is None:
+            continue
+        try:
+            resp = Response.from_redis_response(result[1])
+            request_id = resp.request_id
+        except Exception:
+            # 响应队列由本进程的全部请求共用，无法解码的响应只丢弃这一条
+            logger.exception(f"Dropped undecodable response from {_reply_queue}")
+            continue
+        if (waiter := _reply_waiters.get(request_id)) is not None:
+            waiter.put(resp)
+        else:
+            logger.debug(f"Dropped response of finished request {request_id}")
+
+
+def _ensure_reply_thread():
+    global _reply_queue, _reply_thread
+    with _lock:
+        if _reply_queue is None:
+            _reply_queue = f"{_RESPONSE_QUEUE_PREFIX}{get_appname()}:{uuid.uuid4().hex}"
+        if _reply_thread is None or not _reply_thread.is_alive():
+            _reply_thread = threading.Thread(target=_reply_loop, name="LITTER_REPLY_DAEMON", daemon=True)
+            _reply_thread.start()
+
+
+@contextmanager
+def with_priority(priority: str | None):
+    """
+    在上下文中发出的请求默认使用该优先级，如：
+        with with_priority("low"):
+            api.save_img(url, path)
+    :param priority: high、normal、low；None表示不指定
+    """
+    if priority not in (HIGH, NORMAL, LOW, None):
+        raise ValueError(f"Invalid priority: {priority}")
+    reset = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(reset)
+
+
+def current_priority() -> str | None:
+    """
+    当前上下文的优先级：处理请求时为该请求的优先级，否则为 with_priority 设置的优先级
+    """
+    return _priority.get()
+
+
+def _stamp_priority(headers: dict[str, Any]) -> None:
+    if PRIORITY_HEADER not in headers and (priority := _priority.get()) is not None:
+        headers[PRIORITY_HEADER] = priority
+
+
+def _request_headers(headers: dict[str, Any] | None, timeout: int, stamp_deadline: bool = True) -> dict[str, Any]:
+    headers = dict(headers) if headers else {}
+    _stamp_priority(headers)
+    headers["litter-request-id"] = uuid.uuid4().hex
+    headers["litter-response-queue"] = _reply_queue
+    headers["litter-accept-codecs"] = ",".join(available_codecs())
     headers.setdefault("litter-request-timeout", timeout)
-    publish(channel, body, headers=headers)
+    trace.inject(headers)
+    # 在处理函数中发起的嵌套请求不会晚于上游请求的截止时间
+    deadlines = [time.time() + headers["litter-request-timeout"]] if stamp_deadline else []
+    if (parent_deadline := cancel.current_token().deadline) is not None:
+        deadlines.append(parent_deadline)
+    if deadlines:
+        headers["litter-deadline"] = min(deadlines)
+    return headers
+
+
+def _no_subscriber(channel: str) -> NoSubscriberException:
+    metrics.inc("litter_request_errors_total", channel=channel, app=get_appname(),
+                exception=NoSubscriberException.__name__)
+    return NoSubscriberException(f"No agent is listening on {channel}")
+
+
+def _unrouted(channel: str, transport: str) -> bool:
+    """
+    stream模式下发送前检查注册表中是否有agent监听 channel；pubsub模式在发送后根据 PUBLISH 的返回值判断
+    """
+    return transport == stream.STREAM and not registry.listening(_redis_client, channel)
+
+
+def _send_request(channel: str, body, headers: dict[str, Any] | None, timeout: int,
+                  transport: str, stamp_deadline: bool = True) -> tuple[dict[str, Any], queue.Queue]:
+    _ensure_reply_thread()
 
-    result = _redis_client.brpop([response_queue], timeout=headers["litter-request-timeout"])
-    if result is None:
-        publish(f"{channel}:timeout", body, headers=headers)
+    if _unrouted(channel, transport):
+        raise _no_subscriber(channel)
+    headers = _request_headers(headers, timeout, stamp_deadline)
+    waiter = _reply_waiters[headers["litter-request-id"]] = queue.Queue()
+    try:
+        if not publish(channel, body, headers=headers, transport=transport):
+            raise _no_subscriber(channel)
+    except BaseException:
+        _reply_waiters.pop(headers["litter-request-id"], None)
+        raise
+    return headers, waiter
+
+
+def _observe_response(channel: str, headers: dict[str, Any], resp: Response, start: float) -> None:
+    end = time.time()
+    metrics.observe("litter_request_seconds", end - start, channel=channel, app=get_appname())
+    if resp.exception_type is not None:
+        metrics.inc("litter_request_errors_total", channel=channel, app=get_appname(), exception=resp.exception_type)
+    trace.record_request(headers, start, end, channel=channel, app=get_appname(), error=resp.exception_type)
+
+
+def _cancel_remote(channel: str, body, headers: dict[str, Any]) -> None:
+    try:
+        publish(f"{channel}{_TIMEOUT_SUFFIX}", body, headers=headers)
+    except redis.exceptions.RedisError as e:
+        logger.warning(f"Failed to cancel request {headers['litter-request-id']} of {channel}: {e}")
+
+
+def request(channel: str, body, *, headers: dict[str, Any] | None = None, timeout: int = 15,
+            transport: str = stream.PUBSUB) -> Response:
+    assert timeout > 0
+
+    start = time.time()
+    headers, waiter = _send_request(channel, body, headers, timeout, transport)
+    try:
+        resp = waiter.get(timeout=headers["litter-request-timeout"])
+    except queue.Empty:
+        _cancel_remote(channel, body, headers)
+        metrics.inc("litter_request_timeouts_total", channel=channel, app=get_appname())
+        trace.record_request(headers, start, time.time(), channel=channel, app=get_appname(), error="timeout")
         raise RequestTimeoutException(f"Request {channel} timed out. ({timeout}s)")
+    finally:
+        _reply_waiters.pop(headers["litter-request-id"], None)
 
-    resp = Response.from_redis_response(result[1])
+    _observe_response(channel, headers, resp, start)
     if resp.exception_type is not None:
         raise RemoteFunctionRaisedException(resp)
     return resp
 
 
-def iter_request(channel: str, body, *, headers: dict[str, Any] | None = None, timeout: int = 5,
-                 n: int | None = None) -> Iterator[Response]:
+def hedged_request(channel: str, body, *, hedge_after: float | None, headers: dict[str, Any] | None = None,
+                   timeout: int = 15, transport: str = stream.PUBSUB) -> Response:
+    """
+    发出请求后 hedge_after 秒内没有响应时再发送一个相同的请求，返回先到达的响应并取消另一个请求。
+    第二个请求不与正在执行的相同请求合并（singleflight），只能用于幂等的方法
+    :param hedge_after: 发送第二个请求前等待的时间（秒），None表示不发送
+    """
     assert timeout > 0
+    if _unrouted(channel, transport):
+        raise _no_subscriber(channel)
+    _ensure_reply_thread()
 
-    request_id = str(uuid.uuid4().hex.replace("-", ""))
-    response_queue = f"{_RESPONSE_QUEUE_PREFIX}{channel}:{request_id}"
+    start = time.time()
+    waiter = queue.Queue()
+    sent: list[dict[str, Any]] = []
 
-    if headers is None:
-        headers = {}
-    headers["litter-request-id"] = request_id
+    def _send(extra: dict[str, Any] | None = None):
+        h = _request_headers({**(headers or {}), **(extra or {})}, timeout)
+        _reply_waiters[h["litter-request-id"]] = waiter
+        sent.append(h)
+        if not publish(channel, body, headers=h, transport=transport):
+            raise _no_subscriber(channel)
+
+    resp = None
+    try:
+        _send()
+        if hedge_after is not None and hedge_after < timeout:
+            try:
+                resp = waiter.get(timeout=hedge_after)
+            except queue.Empty:
+                metrics.inc("litter_hedged_requests_total", channel=channel, app=get_appname())
+                _send({HEDGE_HEADER: 1})
+        if resp is None:
+            resp = waiter.get(timeout=max(start + timeout - time.time(), 0))
+    except queue.Empty:
+        metrics.inc("litter_request_timeouts_total", channel=channel, app=get_appname())
+        trace.record_request(sent[0], start, time.time(), channel=channel, app=get_appname(), error="timeout")
+        raise RequestTimeoutException(f"Request {channel} timed out. ({timeout}s)")
+    finally:
+        for h in sent:
+            _reply_waiters.pop(h["litter-request-id"], None)
+        # 未完成的请求发送超时通知，使agent取消执行
+        losers = [h for h in sent if resp is None or h["litter-request-id"] != resp.request_id]
+        if losers:
+            _publish_many([(f"{channel}{_TIMEOUT_SUFFIX}", body, h) for h in losers], stream.PUBSUB)
+
+    _observe_response(channel, next(h for h in sent if h["litter-request-id"] == resp.request_id), resp, start)
+    if resp.exception_type is not None:
+        raise RemoteFunctionRaisedException(resp)
+    return resp
+
+
+def iter_request(channel: str, body, *, headers: dict[str, Any] | None = None, timeout: int = 5,
+                 n: int | None = None, transport: str = stream.PUBSUB) -> Iterator[Response]:
+    assert timeout > 0
+
+    headers = dict(headers) if headers else {}
     headers["litter-request-timeout"] = timeout
-    headers["litter-response-queue"] = response_queue
-    publish(channel, body, headers=headers)
+    # 流式响应的总耗时可能超过单帧的超时时间，不设置截止时间
+    start = time.time()
+    headers, waiter = _send_request(channel, body, headers, timeout, transport, stamp_deadline=False)
 
     if n is None:
         n = float("inf")
     i = 0
-    while i < n:
-        result = _redis_client.brpop([response_queue], timeout=timeout)
-        if result is None:
-            break
-        yield Response.from_redis_response(result[1])
-        i += 1
+    ended = False
+    try:
+        while i < n:
+            try:
+                resp = waiter.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if resp.stream_end:
+                # 流式响应的结束帧
+                ended = True
+                if resp.exception_type is not None:
+                    raise RemoteFunctionRaisedException(resp)
+                break
+            yield resp
+            i += 1
+    finally:
+        _reply_waiters.pop(headers["litter-request-id"], None)
+        if not ended:
+            # 超时、达到 n 帧或调用方提前退出时通知agent停止生成
+            _cancel_remote(channel, body, headers)
+        trace.record_request(headers, start, time.time(), channel=channel, app=get_appname())
 
 
-def _build_response(req_message: Message, body, *, headers: dict[str, str] | None = None) -> Response:
-    response_queue = f'{_RESPONSE_QUEUE_PREFIX}{req_message.channel}:{req_message.headers["litter-request-id"]}'
-    if headers is None:
-        headers = {}
+def _publish_many(messages: list[tuple[str, Any, dict[str, Any]]], transport: str) -> list:
+    """
+    在一个pipeline中发布多条消息
+    """
+    pipe = _redis_client.pipeline(transaction=False)
+    for channel, body, headers in messages:
+        data = _encode(channel, _envelope(body, headers), _codec)
+        metrics.observe("litter_publish_bytes", len(data), buckets=metrics.SIZE_BUCKETS, channel=channel,
+                        app=get_appname())
+        if transport == stream.STREAM:
+            stream.xadd(pipe, channel, data)
+        else:
+            pipe.publish(channel, data)
+    return pipe.execute()
+
+
+def _batch_calls(channel_or_calls: str | Iterable[tuple[str, Any]], bodies: Iterable | None) -> list[tuple[str, Any]]:
+    if isinstance(channel_or_calls, str):
+        if bodies is None:
+            raise ValueError("bodies is required when channel_or_calls is a channel")
+        return [(channel_or_calls, body) for body in bodies]
+    if bodies is not None:
+        raise ValueError("bodies must be None when channel_or_calls is a list of (channel, body)")
+    return list(channel_or_calls)
+
+
+def iter_request_many(channel_or_calls: str | Iterable[tuple[str, Any]], bodies: Iterable | None = None, *,
+                      headers: dict[str, Any] | None = None, timeout: int = 15, concurrency: int = 64,
+                      transport: str = stream.PUBSUB) -> Iterator[tuple[int, Response | LitterException]]:
+    """
+    批量发送请求，按完成顺序返回 (序号, 结果)。单个请求失败不影响其他请求，结果为对应的异常
+    :param channel_or_calls: channel，与 bodies 一起使用；或 (channel, body) 列表
+    :param bodies: 各请求的body
+    :param headers: 所有请求共用的请求头
+    :param timeout: 单个请求的超时时间（秒），从其发出时开始计算
+    :param concurrency: 同时等待响应的最大请求数，每一轮补充的请求在一个pipeline中发出
+    :param transport: pubsub 或 stream
+    """
+    assert timeout > 0 and concurrency > 0
+    if _redis_client is None:
+        raise RuntimeError("Redis is not connected, you must connect first by calling 'connect(host, port)'")
+
+    calls = _batch_calls(channel_or_calls, bodies)
+    _ensure_reply_thread()
+    # 同一批次的请求共用一个等待队列
+    waiter = queue.Queue()
+    # request-id -> (序号, channel, body, headers, 发出时间)
+    pending: dict[str, tuple[int, str, Any, dict[str, Any], float]] = {}
+    i = 0
+    try:
+        while i < len(calls) or pending:
+            messages = []
+            while i < len(calls) and len(pending) < concurrency:
+                channel, body = calls[i]
+                if _unrouted(channel, transport):
+                    yield i, _no_subscriber(channel)
+                    i += 1
+                    continue
+                h = _request_headers(headers, timeout)
+                _reply_waiters[h["litter-request-id"]] = waiter
+                pending[h["litter-request-id"]] = (i, channel, body, h, time.time())
+                messages.append((channel, body, h))
+                i += 1
+            if messages:
+                for (channel, _, h), received in zip(messages, _publish_many(messages, transport)):
+                    if transport == stream.PUBSUB and not received:
+                        index = pending.pop(h["litter-request-id"])[0]
+                        _reply_waiters.pop(h["litter-request-id"], None)
+                        yield index, _no_subscriber(channel)
+                if not pending:
+                    continue
+
+            try:
+                resp = waiter.get(timeout=max(min(x[4] for x in pending.values()) + timeout - time.time(), 0))
+            except queue.Empty:
+                now = time.time()
+                expired = [pending.pop(rid) for rid, x in list(pending.items()) if x[4] + timeout <= now]
+                for _, channel, _, h, sent in expired:
+                    _reply_waiters.pop(h["litter-request-id"], None)
+                    metrics.inc("litter_request_timeouts_total", channel=channel, app=get_appname())
+                    trace.record_request(h, sent, now, channel=channel, app=get_appname(), error="timeout")
+                if expired:
+                    _publish_many([(f"{channel}{_TIMEOUT_SUFFIX}", body, h) for _, channel, body, h, _ in expired],
+                                  stream.PUBSUB)
+                for index, channel, *_ in expired:
+                    yield index, RequestTimeoutException(f"Request {channel} timed out. ({timeout}s)")
+                continue
+
+            if (item := pending.pop(resp.request_id, None)) is None:
+                continue
+            _reply_waiters.pop(resp.request_id, None)
+            _observe_response(item[1], item[3], resp, item[4])
+            yield item[0], (RemoteFunctionRaisedException(resp) if resp.exception_type is not None else resp)
+    finally:
+        for rid in pending:
+            _reply_waiters.pop(rid, None)
+
+
+def request_many(channel_or_calls: str | Iterable[tuple[str, Any]], bodies: Iterable | None = None, *,
+                 headers: dict[str, Any] | None = None, timeout: int = 15, concurrency: int = 64,
+                 transport: str = stream.PUBSUB) -> list[Response | LitterException]:
+    """
+    批量发送请求，按请求顺序返回结果，参数见 iter_request_many
+    :return: 各请求的 Response；失败的请求为 RemoteFunctionRaisedException 或 RequestTimeoutException
+    """
+    calls = _batch_calls(channel_or_calls, bodies)
+    results: list[Response | LitterException | None] = [None] * len(calls)
+    for index, result in iter_request_many(calls, headers=headers, timeout=timeout, concurrency=concurrency,
+                                           transport=transport):
+        results[index] = result
+    return results
+
+
+def _build_response(req_message: Message, body, *,
+                    headers: dict[str, Any] | None = None) -> tuple[dict[str, Any], str | bytes]:
+    """
+    构造并编码响应，返回 (headers, 编码后的信封)；消息体只编码一次
+    """
+    response_queue = req_message.headers.get("litter-response-queue") or \
+                     f'{_RESPONSE_QUEUE_PREFIX}{req_message.channel}:{req_message.headers["litter-request-id"]}'
+    headers = dict(headers) if headers else {}
+    headers.pop(blob.BODY_REF_HEADER, None)
     headers["litter-publish-channel"] = req_message.channel
     headers["litter-request-id"] = req_message.headers["litter-request-id"]
     headers["litter-name"] = get_appname()
     headers["litter-response-queue"] = response_queue
     headers["litter-datetime"] = datetime.now().isoformat()
-    resp = serialize({
-        "headers": headers,
-        "body": body,
-    })
-    return Response.from_redis_response(resp)
+    headers["litter-codec"] = negotiate_codec(req_message.headers.get("litter-accept-codecs"))
+    data = _encode(req_message.channel, {"headers": headers, "body": body}, headers["litter-codec"])
+    return headers, data
+
+
+def _do_response(headers: dict[str, Any], data: str | bytes, timeout):
+    """
+    LPUSH、EXPIRE 以及 <channel>:response 镜像在同一个pipeline中发送
+    """
+    response_queue = headers["litter-response-queue"]
+    with _redis_client.pipeline(transaction=False) as pipe:
+        pipe.lpush(response_queue, data)
+        pipe.expire(response_queue, int(timeout))
+        if _response_mirror != MIRROR_OFF:
+            channel = f"{headers['litter-publish-channel']}:response"
+            if _response_mirror == MIRROR_FULL:
+                pipe.publish(channel, data)
+            else:
+                pipe.publish(channel, encode({"headers": headers, "body": None}, headers["litter-codec"]))
+        pipe.execute()
 
 
-def _do_response(resp: Response, timout):
-    _redis_client.lpush(resp.response_queue, resp.serialize())
-    _redis_client.expire(resp.response_queue, int(timout))
-    publish(f"{resp.headers['litter-publish-channel']}:response", {"headers": resp.headers, "body": resp.body})
+def _respond(req_message: Message, body, *, headers: dict[str, Any] | None = None):
+    start = time.time()
+    _do_response(*_build_response(req_message, body, headers=headers), req_message.headers["litter-request-timeout"])
+    trace.record("response", req_message.headers, start, time.time(), channel=req_message.channel, app=get_appname(),
+                 error=(headers or {}).get("litter-exception-type"), seq=(headers or {}).get("litter-stream-seq"))
 
 
-def handler_callback(message: Message):
+def _exception_headers(e: Exception) -> dict[str, Any]:
+    return {
+        "litter-exception-type": f"{e.__class__.__module__}.{e.__class__.__name__}",
+        "litter-exception-message": str(e)
+    }
+
+
+def _iter_async(agen) -> Iterator:
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
+def _respond_stream(message: Message, gen, token: cancel.CancelToken | None = None):
+    """
+    将生成器的每个元素作为一帧响应发送，最后发送带 litter-stream-end 的结束帧。
+    在执行线程中调用；请求被取消时关闭生成器并抛出 RequestCancelledException，不再发送结束帧
+    """
+    seq = 0
+    frames = _iter_async(gen) if inspect.isasyncgen(gen) else gen
+    try:
+        for item in frames:
+            if token is not None:
+                token.raise_if_cancelled()
+            _respond(message, item, headers={"litter-stream-seq": seq})
+            seq += 1
+    except RequestCancelledException:
+        raise
+    except Exception as e:
+        logger.error(f"Exception while streaming response of {message}:")
+        traceback.print_exc()
+        _respond(message, None, headers={"litter-stream-seq": seq, "litter-stream-end": True, **_exception_headers(e)})
+    else:
+        _respond(message, None, headers={"litter-stream-seq": seq, "litter-stream-end": True})
+    finally:
+        frames.close()
+
+
+def _drain(gen, token: cancel.CancelToken | None = None) -> None:
+    """
+    不需要响应时也要执行完生成器
+    """
+    frames = _iter_async(gen) if inspect.isasyncgen(gen) else gen
+    try:
+        for _ in frames:
+            if token is not None:
+                token.raise_if_cancelled()
+    finally:
+        frames.close()
+
+
+def handler_callback(message: Message, on_error: Callable[[Exception], None] | None = None):
+    """
+    :param on_error: 不需要响应的消息处理失败时调用，用于重试
+    """
+
     def _handler(f: Future):
+        token = _cancel_tokens.pop(message.request_id, None) if message.request_id else None
         try:
             ret = f.result()
+        except RequestCancelledException as e:
+            logger.info(f"Request {message.request_id} of {message.channel} cancelled: {e}")
+            metrics.inc("litter_handler_cancelled_total", channel=message.pattern or message.channel,
+                        app=get_appname())
         except Exception as e:
             # 函数报错，返回错误response
+            metrics.inc("litter_handler_exceptions_total", channel=message.pattern or message.channel,
+                        app=get_appname(), exception=f"{type(e).__module__}.{type(e).__qualname__}")
             logger.error(f"Exception while handling message {message}:")
             traceback.print_exc()
             if "litter-request-id" in message.headers:
-                headers = {
-                    "litter-exception-type": f"{e.__class__.__module__}.{e.__class__.__name__}",
-                    "litter-exception-message": str(e)
-                }
-                resp = _build_response(message, None, headers=headers)
-                _do_response(resp, message.headers["litter-request-timeout"])
+                _respond(message, None, headers=_exception_headers(e))
+            elif on_error is not None:
+                on_error(e)
         else:
             # 函数正常返回
-            if "litter-request-id" in message.headers:
+            if ret is _STREAMED:
+                # 流式响应已经在执行线程中发送
+                pass
+            elif token is not None and token.cancelled:
+                logger.info(f"Request {message.request_id} of {message.channel} was cancelled, response dropped")
+            elif "litter-request-id" in message.headers:
                 # is litter-request, litter-response is required
-                if ret is None:
-                    resp = _build_response(message, None)
-                elif isinstance(ret, Response):
-                    resp = _build_response(message, ret.body, headers=ret.headers)
+                if isinstance(ret, Response):
+                    _respond(message, ret.body, headers=ret.headers)
                 else:
-                    resp = _build_response(message, ret, headers=None)
-                _do_response(resp, message.headers["litter-request-timeout"])
+                    _respond(message, ret)
             elif ret is not None:
                 logger.warning(f"Unhandled response: {ret}")
 
     return _handler
 
 
-def listen(*, app_name: str | None = None, redis_credentials: dict[str, Any] | None = None, executor_workers: int = 4):
-    global _litter_thread, _sub_entity, _executor
+# _invoke 已经执行完生成器（并发送了流式响应）时的返回值
+_STREAMED = object()
+
+
+def _invoke(func: Callable, message: Message, token: cancel.CancelToken | None, submitted: float):
+    channel = message.pattern or message.channel
+    start = time.perf_counter()
+    wall_start = time.time()
+    metrics.observe("litter_queue_wait_seconds", start - submitted, channel=channel, app=get_appname())
+    trace.record("queue", message.headers, wall_start - (start - submitted), wall_start, channel=message.channel,
+                 app=get_appname())
+    if token is not None:
+        # 排队期间可能已经超时或被取消
+        token.raise_if_cancelled()
+    span_id, error = trace.new_id(), None
+    try:
+        with cancel.bind(token), trace.bind(message.headers.get(trace.TRACE_ID_HEADER), span_id), \
+                with_priority(_message_priority(message)):
+            ret = func(message)
+            if inspect.isgenerator(ret) or inspect.isasyncgen(ret):
+                # 生成器在同一个执行线程和上下文中逐帧执行，可以被取消，耗时包括全部帧
+                if "litter-request-id" in message.headers:
+                    _respond_stream(message, ret, token)
+                else:
+                    _drain(ret, token)
+                return _STREAMED
+            return ret
+    except Exception as e:
+        error = f"{type(e).__module__}.{type(e).__qualname__}"
+        raise
+    finally:
+        metrics.observe("litter_handler_seconds", time.perf_counter() - start, channel=channel, app=get_appname())
+        trace.record("handle", message.headers, wall_start, time.time(), channel=message.channel, app=get_appname(),
+                     span_id=span_id, error=error)
+
+
+def _on_timeout(message: Message) -> None:
+    if (token := _cancel_tokens.get(message.request_id)) is not None:
+        logger.info(f"Cancelling request {message.request_id} of {message.channel[:-len(_TIMEOUT_SUFFIX)]}")
+        token.cancel()
+
+
+def _pubsub_loop() -> None:
+    """
+    阻塞读取订阅的消息直到断开连接，分发请求和超时通知。
+    消息到达时立即返回；读取超时只用于定期检查是否已断开连接
+    """
+    while connected() and (sub := _sub_entity) is not None:
+        try:
+            redis_msg = sub.get_message(timeout=1.)
+        except redis.exceptions.TimeoutError:
+            continue
+        except (redis.exceptions.RedisError, OSError, AttributeError) as e:
+            if not connected():
+                break
+            logger.error(f"Error while reading subscribed messages: {e}")
+            time.sleep(1)
+            continue
+        if redis_msg is None or redis_msg["type"] not in ("message", "pmessage"):
+            continue
+        logger.trace(f"Received redis message: {redis_msg}")
+        try:
+            _dispatch(Message.from_redis_message(redis_msg))
+        except Exception:
+            # 无法解码的消息只丢弃这一条，不能结束监听
+            logger.exception(f"Failed to dispatch message of {redis_msg.get('channel')}")
+
+
+def _dispatch(message: Message) -> None:
+    key = message.channel if message.type == "message" else message.pattern
+    if key.endswith(_TIMEOUT_SUFFIX) and key[:-len(_TIMEOUT_SUFFIX)] in _register_map:
+        _on_timeout(message)
+        return
+    for func in list(_register_map.get(key, [])):
+        _submit(func, message, key)
+
+
+def _flight_key(func: Callable, message: Message) -> tuple | None:
+    """
+    在读取线程中调用，不读取外部存储的消息体，也不序列化大的消息体；返回None表示不合并
+    """
+    headers = message.headers
+    if headers.get("litter-cache-control") == "no-cache":
+        # 要求不使用缓存的请求需要真正执行
+        return None
+    if blob.BODY_REF_HEADER in headers or len(message.data) > _FLIGHT_MAX_BYTES:
+        # 外部存储的引用每次请求都不同，大的消息体很少完全相同
+        return None
+    try:
+        body = json.dumps(message.data_obj["body"], sort_keys=True, default=str, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+    return func, message.channel, _message_priority(message), body
+
+
+def _land(flight: tuple, func: Callable, key: str | None, f: Future) -> None:
+    """
+    请求执行完成后，将结果发送给执行期间到达的相同请求
+    """
+    with _flight_lock:
+        followers = _flights.pop(flight, [])
+    if not followers:
+        return
+    e = f.exception()
+    ret = f.result() if e is None else None
+    # 流式响应只发送给了第一个请求，被取消的请求没有结果，这两种情况下重新执行
+    rerun = isinstance(e, RequestCancelledException) or ret is _STREAMED
+    logger.debug(f"{len(followers)} identical requests of {followers[0][0].channel} "
+                 f"{'resubmitted' if rerun else 'share the result'}")
+    for message, follower in followers:
+        if rerun:
+            _submit(func, message, key, coalesce=False).add_done_callback(
+                lambda _f, _follower=follower: _follower.set_result(None))
+            continue
+        try:
+            handler_callback(message)(f)
+        finally:
+            follower.set_result(None)
+
+
+def _message_priority(message: Message) -> str:
+    priority = message.headers.get(PRIORITY_HEADER, NORMAL)
+    return priority if priority in (HIGH, NORMAL, LOW) else NORMAL
+
+
+def _retry(func: Callable, message: Message, key: str | None, attempt: int, error: Exception) -> None:
+    """
+    按 channel 的重试策略在后台延迟重新执行失败的处理函数，全部失败后写入死信列表
+    """
+    if (policy := retry.policy(message.channel)) is None:
+        return
+    channel = message.pattern or message.channel
+    if attempt < policy.max_attempts:
+        delay = policy.delay(attempt)
+        logger.warning(f"Retrying {message.channel} in {delay:.2f}s ({attempt + 1}/{policy.max_attempts})")
+        metrics.inc("litter_retries_total", channel=channel, app=get_appname())
+
+        def _resubmit():
+            if not connected():
+                logger.error(f"Retry of {message.channel} dropped: disconnected")
+                return
+            # 从原始数据重新解码，不受上一次执行对消息体的修改影响
+            fresh = Message(message.data, channel=message.channel, type=message.type, pattern=message.pattern)
+            _submit(func, fresh, key, attempt=attempt + 1)
+
+        timer = threading.Timer(delay, _resubmit)
+        timer.daemon = True
+        timer.start()
+    elif policy.dead_letter and (client := _redis_client) is not None:
+        try:
+            dl_id = retry.dead_letter(client, message, func, error, attempts=attempt, app=get_appname(),
+                                      transport=_transport or stream.PUBSUB)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Failed to dead-letter message of {message.channel}: {e}")
+            return
+        metrics.inc("litter_dead_letters_total", channel=channel, app=get_appname())
+        logger.error(f"Message of {message.channel} dead-lettered as {dl_id} after {attempt} attempts")
+
+
+def _submit(func: Callable, message: Message, key: str | None = None, coalesce: bool = True,
+            attempt: int = 1) -> Future:
+    if attempt == 1:
+        metrics.observe("litter_receive_bytes", len(message.data), buckets=metrics.SIZE_BUCKETS,
+                        channel=key or message.channel, app=get_appname())
+    token = None
+    if (request_id := message.request_id) is not None:
+        deadline = message.headers.get("litter-deadline")
+        token = _cancel_tokens.setdefault(request_id, cancel.CancelToken(deadline))
+        if token.expired:
+            # 已经超过截止时间的请求直接丢弃
+            logger.info(f"Dropped expired request {request_id} of {message.channel}")
+            _cancel_tokens.pop(request_id, None)
+            future = Future()
+            future.set_exception(RequestCancelledException("Request deadline exceeded"))
+            return future
+
+    coalesce = coalesce and _singleflight and request_id is not None and not message.headers.get(HEDGE_HEADER)
+    flight = _flight_key(func, message) if coalesce else None
+    if flight is not None:
+        with _flight_lock:
+            if (followers := _flights.get(flight)) is not None:
+                # 相同的请求正在执行，等待其结果
+                future = Future()
+                followers.append((message, future))
+                return future
+            _flights[flight] = []
+
+    try:
+        future = _executor.submit(key or message.channel, _invoke, func, message, token, time.perf_counter(),
+                                  priority=_message_priority(message))
+    except RequestRejectedException as e:
+        # 队列已满，立即返回错误而不是排队
+        metrics.inc("litter_rejected_total", channel=key or message.channel, app=get_appname())
+        if request_id is not None:
+            _cancel_tokens.pop(request_id, None)
+            _respond(message, None, headers=_exception_headers(e))
+        future = Future()
+        future.set_exception(e)
+    else:
+        future.add_done_callback(handler_callback(message, lambda e: _retry(func, message, key, attempt, e)))
+    if flight is not None:
+        future.add_done_callback(lambda f: _land(flight, func, key, f))
+    return future
+
+
+def executor_stats() -> dict[str, dict[str, int]]:
+    """
+    各 channel 的执行中、等待中以及被拒绝的请求数量
+    """
+    return {} if _executor is None else _executor.stats()
+
+
+def _agent_info() -> dict[str, Any]:
+    """
+    随心跳写入注册表的信息：监听的channel以及执行器的负载
+    """
+    stats = executor_stats()
+    return {
+        "app": get_appname(),
+        "transport": _transport,
+        "channels": list(_register_map),
+        "workers": 0 if _executor is None else _executor.max_workers,
+        "running": sum(v["running"] for v in stats.values()),
+        "queued": sum(v["queued"] for v in stats.values()),
+        "rejected": sum(v["rejected"] for v in stats.values()),
+        "priorities": {} if _executor is None else _executor.priority_stats(),
+    }
+
+
+def _metrics_handler(message: Message):
+    """
+    <app>:_metrics 接口，body 为 {"format": "json"} 时返回 metrics.snapshot()，否则返回 Prometheus text
+    """
+    if isinstance(message.body, dict) and message.body.get("format") == "json":
+        return metrics.snapshot()
+    return metrics.render()
+
+
+def _setup_metrics():
+    from confctl import config
+
+    def _collect(field: str):
+        return lambda: [({"channel": channel, "app": get_appname()}, v[field])
+                        for channel, v in executor_stats().items()]
+
+    metrics.register_gauge("litter_executor_running", _collect("running"))
+    metrics.register_gauge("litter_executor_queued", _collect("queued"))
+    metrics.register_gauge("litter_executor_priority_queued", lambda: [
+        ({"priority": priority, "app": get_appname()}, v["queued"])
+        for priority, v in (_executor.priority_stats() if _executor is not None else {}).items()])
+    _register_map.setdefault(f"{get_appname()}{METRICS_SUFFIX}", [_metrics_handler])
+    if (port := config.get("litter/metrics_port", None)) is not None:
+        metrics.serve(int(port), config.get("litter/metrics_host", "127.0.0.1"))
+
+
+def listen(*, app_name: str | None = None, redis_credentials: dict[str, Any] | None = None, executor_workers: int = 4,
+           transport: str = stream.PUBSUB, stream_options: dict[str, Any] | None = None,
+           max_queue: int | None = None, channel_limits: dict[str, ChannelLimit | dict[str, Any]] | None = None,
+           singleflight: bool = True, health_check: Callable[[], tuple[bool, str]] | None = None,
+           reserved_workers: int = 0, priority_weights: dict[str, int] | None = None):
+    """
+    :param executor_workers: 执行线程数
+    :param reserved_workers: 只执行高优先级（litter-priority: high）请求的线程数
+    :param priority_weights: 优先级 -> 权重，各优先级都有请求等待时按权重分配线程，默认 high: 8, normal: 3, low: 1
+    :param max_queue: 全部 channel 等待执行的最大请求数，超出时立即以 RequestRejectedException 拒绝；None表示不限制
+    :param channel_limits: channel（支持通配符）-> ChannelLimit(concurrency, max_queue)
+    :param transport: pubsub: 所有订阅者都会收到并执行请求；stream: 同一消费者组（默认为app_name）内只有一个副本执行请求
+    :param stream_options: 传给 stream.listen_stream 的参数，如 group、consumer、claim_idle、claim_interval
+    :param singleflight: 是否合并相同的请求：channel、优先级和 body 相同的请求正在执行时，后到的请求不再执行而是共享其结果；no-cache 的请求不合并
+    :param health_check: 返回 (是否健康, 说明) 的函数，结果随心跳写入注册表，见 litter.registry
+    """
+    global _litter_thread, _sub_entity, _executor, _singleflight, _transport
+
+    _singleflight = singleflight
 
     if not connected() or redis_credentials is not None:
         connect(app_name=app_name, redis_credentials=redis_credentials)
@@ -244,49 +1127,53 @@ def listen(*, app_name: str | None = None, redis_credentials: dict[str, Any] | N
         raise RuntimeError("Redis is not connected, you must connect first by calling 'connect(host, port)'")
 
     if _executor is None:
-        _executor = ThreadPoolExecutor(executor_workers, thread_name_prefix=get_appname())
-
-    if len(_register_map) == 0:
-        logger.warning(f"No channel to listen.")
-
-    if _sub_entity is None:
-        _sub_entity = _redis_client.pubsub()
-    _sub_entity.psubscribe(list(_register_map.keys()))
-    logger.debug(f"Registered channels: {_register_map.keys()}")
+        _executor = BoundedExecutor(executor_workers, max_queue=max_queue, channel_limits=channel_limits,
+                                    thread_name_prefix=get_appname(), reserved_workers=reserved_workers,
+                                    priority_weights=priority_weights)
+    _setup_metrics()
 
     if _litter_thread is None:
         _litter_thread = threading.current_thread()
-    logger.info(f"Thread {_litter_thread.name} listening.")
 
-    while connected():
+    with _lock:
+        _transport = transport
+        if _sub_entity is None:
+            _sub_entity = _redis_client.pubsub()
+    _update_subscription([k for key in list(_register_map) for k in _listen_keys(key)], True)
+    logger.debug(f"Registered channels: {_register_map.keys()}")
+    registry.start(get_redis, get_appname(), _agent_info, health_check=health_check)
+
+    if transport == stream.STREAM:
+        options = dict(group=get_appname(), capacity=executor_workers)
+        options.update(stream_options or {})
+        threading.Thread(target=_pubsub_loop, name="LITTER_TIMEOUT_WATCHER", daemon=True).start()
         try:
-            redis_msg = _sub_entity.get_message(timeout=0.5)
-            if redis_msg is None:
-                continue
-            logger.trace(f"Received redis message: {redis_msg}")
-            message = Message.from_redis_message(redis_msg)
-
-            if message.type in ('message', 'pmessage'):
-                key = {
-                    "message": message.channel,
-                    "pmessage": message.pattern
-                }[message.type]
-                funcs = _register_map.get(key, [])
-                for func in funcs:
-                    _executor.submit(func, message).add_done_callback(handler_callback(message))
+            stream.listen_stream(_redis_client, _register_map, _submit, running=connected, **options)
         except KeyboardInterrupt:
             disconnect()
-            break
+        return
+
+    logger.info(f"Thread {_litter_thread.name} listening.")
+    try:
+        _pubsub_loop()
+    except KeyboardInterrupt:
+        disconnect()
 
 
 def listen_bg(*, app_name: str | None = None, redis_credentials: dict[str, Any] | None = None,
-              executor_workers: int = 4):
+              executor_workers: int = 4, transport: str = stream.PUBSUB, stream_options: dict[str, Any] | None = None,
+              max_queue: int | None = None, channel_limits: dict[str, ChannelLimit | dict[str, Any]] | None = None,
+              singleflight: bool = True, health_check: Callable[[], tuple[bool, str]] | None = None,
+              reserved_workers: int = 0, priority_weights: dict[str, int] | None = None):
     global _litter_thread
     if _litter_thread is not None:
         raise RuntimeError(f"listen thread had been already running")
 
     _litter_thread = threading.Thread(target=listen, kwargs=dict(
-        app_name=app_name, redis_credentials=redis_credentials, executor_workers=executor_workers))
+        app_name=app_name, redis_credentials=redis_credentials, executor_workers=executor_workers,
+        transport=transport, stream_options=stream_options, max_queue=max_queue, channel_limits=channel_limits,
+        singleflight=singleflight, health_check=health_check, reserved_workers=reserved_workers,
+        priority_weights=priority_weights))
     _litter_thread.name = "LITTER_AGENT_LISTEN_DAEMON"
     _litter_thread.daemon = True
     _litter_thread.start()
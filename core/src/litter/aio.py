@@ -0,0 +1,220 @@
+import asyncio
+import time
+import uuid
+from typing import Any, AsyncIterator
+
+import redis.asyncio
+from loguru import logger
+
+from litter import blob, stream, trace, compress, registry
+from litter.agent import get_appname, set_appname, get_codec, _envelope, _resolve_credentials, \
+    _stamp_priority, _RESPONSE_QUEUE_PREFIX
+from litter.codec import available_codecs
+from litter.model import Response, RequestTimeoutException, RemoteFunctionRaisedException, NoSubscriberException, \
+    BlobNotFoundException
+
+__all__ = [
+    "connect",
+    "disconnect",
+    "connected",
+    "get_redis",
+    "publish",
+    "request",
+    "iter_request",
+]
+
+_redis_client: redis.asyncio.Redis | None = None
+_reply_client: redis.asyncio.Redis | None = None
+_reply_queue: str | None = None
+_reply_task: asyncio.Task | None = None
+# 所有请求共用进程级的响应队列 _reply_queue，由 _reply_loop 按 litter-request-id 分发
+_waiters: dict[str, asyncio.Queue] = {}
+
+
+def connected() -> bool:
+    return _redis_client is not None
+
+
+def get_redis() -> redis.asyncio.Redis | None:
+    """
+    当前连接的redis客户端，未连接时返回None
+    """
+    return _redis_client
+
+
+async def connect(host: str | None = None, port: int | str | None = None, password: str | None = None, db: int = 0,
+                  *, redis_credentials: dict[str, Any] | None = None, app_name: str | None = None,
+                  max_connections: int = 8):
+    """
+    redis_credentials > (host, port, password) > config.get("redis")
+    :param max_connections: 连接池大小，超出时等待空闲连接而不是新建连接
+    """
+    redis_credentials = _resolve_credentials(host, port, password, db, redis_credentials)
+    if app_name is not None:
+        set_appname(app_name)
+
+    if _redis_client is None:
+        pool = redis.asyncio.BlockingConnectionPool(max_connections=max_connections, **redis_credentials)
+        # 响应队列的 BRPOP 会长期占用连接，单独使用一个连接
+        _attach(redis.asyncio.Redis(connection_pool=pool), redis.asyncio.Redis(**redis_credentials))
+        await _redis_client.ping()
+        redis_credentials.pop("password", None)
+        logger.info(f"Redis(asyncio) connected {redis_credentials} with name {get_appname()}")
+
+
+def _attach(client: redis.asyncio.Redis, reply_client: redis.asyncio.Redis) -> None:
+    global _redis_client, _reply_client, _reply_queue
+    _redis_client, _reply_client = client, reply_client
+    _reply_queue = f"{_RESPONSE_QUEUE_PREFIX}{get_appname()}:{uuid.uuid4().hex}"
+    blob.register_async(blob.AioRedisBlobStore(client))
+
+
+async def _resolve(resp: Response) -> Response:
+    """
+    读取通过外部存储传递的消息体，避免在事件循环中同步读取
+    """
+    if (ref := resp.body_ref) is not None:
+        try:
+            resp.body = await blob.aio_resolve(ref)
+        except KeyError as e:
+            raise BlobNotFoundException(str(e)) from e
+    return resp
+
+
+async def disconnect() -> None:
+    global _redis_client, _reply_client, _reply_task
+    if _reply_task is not None:
+        _reply_task.cancel()
+        _reply_task = None
+    for client in (_redis_client, _reply_client):
+        if client is not None:
+            await client.aclose()
+    if _redis_client is not None:
+        logger.info("Redis(asyncio) disconnected")
+    _redis_client = _reply_client = None
+
+
+async def _reply_loop():
+    while _reply_client is not None:
+        try:
+            result = await _reply_client.brpop([_reply_queue], timeout=1)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error while reading response queue {_reply_queue}: {e}")
+            await asyncio.sleep(1)
+            continue
+        if result is None:
+            continue
+        try:
+            resp = Response.from_redis_response(result[1])
+            request_id = resp.request_id
+        except Exception:
+            # 无法解码的响应只丢弃这一条，不能影响其他等待中的请求
+            logger.exception(f"Dropped undecodable response from {_reply_queue}")
+            continue
+        if (q := _waiters.get(request_id)) is not None:
+            q.put_nowait(resp)
+        else:
+            logger.debug(f"Dropped response of finished request {request_id}")
+
+
+def _ensure_reply_loop():
+    global _reply_task
+    if _reply_task is None or _reply_task.done():
+        _reply_task = asyncio.get_running_loop().create_task(_reply_loop(), name="LITTER_AIO_REPLY_LOOP")
+
+
+async def publish(channel: str, body, *, headers: dict[str, Any] | None = None, transport: str = stream.PUBSUB):
+    if _redis_client is None:
+        raise RuntimeError("Redis is not connected, you must connect first by calling 'await connect(host, port)'")
+
+    message = _envelope(body, headers)
+    data = compress.encode_envelope(channel, message, get_codec())
+    if blob.enabled():
+        # 外部存储的写入是同步的，放到线程中执行
+        data = await asyncio.to_thread(blob.offload, message, data, get_codec())
+    if transport == stream.STREAM:
+        return await stream.xadd(_redis_client, channel, data)
+    return await _redis_client.publish(channel, data)
+
+
+def _request_headers(headers: dict[str, Any] | None, timeout: int, stamp_deadline: bool) -> dict[str, Any]:
+    headers = dict(headers) if headers else {}
+    _stamp_priority(headers)
+    headers["litter-request-id"] = uuid.uuid4().hex
+    headers["litter-response-queue"] = _reply_queue
+    headers["litter-accept-codecs"] = ",".join(available_codecs())
+    headers.setdefault("litter-request-timeout", timeout)
+    trace.inject(headers)
+    if stamp_deadline:
+        headers["litter-deadline"] = time.time() + headers["litter-request-timeout"]
+    return headers
+
+
+async def _send(channel: str, body, headers: dict[str, Any] | None, timeout: int,
+                transport: str, stamp_deadline: bool = True) -> tuple[dict[str, Any], asyncio.Queue]:
+    _ensure_reply_loop()
+    if transport == stream.STREAM and not await registry.aio_listening(_redis_client, channel):
+        raise NoSubscriberException(f"No agent is listening on {channel}")
+    headers = _request_headers(headers, timeout, stamp_deadline)
+    q = _waiters[headers["litter-request-id"]] = asyncio.Queue()
+    try:
+        if not await publish(channel, body, headers=headers, transport=transport):
+            raise NoSubscriberException(f"No agent is listening on {channel}")
+    except BaseException:
+        _waiters.pop(headers["litter-request-id"], None)
+        raise
+    return headers, q
+
+
+async def request(channel: str, body, *, headers: dict[str, Any] | None = None, timeout: int = 15,
+                  transport: str = stream.PUBSUB) -> Response:
+    assert timeout > 0
+
+    start = time.time()
+    headers, q = await _send(channel, body, headers, timeout, transport)
+    try:
+        resp = await asyncio.wait_for(q.get(), timeout=headers["litter-request-timeout"])
+    except asyncio.TimeoutError:
+        await publish(f"{channel}:timeout", body, headers=headers)
+        trace.record_request(headers, start, time.time(), channel=channel, app=get_appname(), error="timeout")
+        raise RequestTimeoutException(f"Request {channel} timed out. ({timeout}s)")
+    finally:
+        _waiters.pop(headers["litter-request-id"], None)
+
+    trace.record_request(headers, start, time.time(), channel=channel, app=get_appname(), error=resp.exception_type)
+    if resp.exception_type is not None:
+        raise RemoteFunctionRaisedException(resp)
+    return await _resolve(resp)
+
+
+async def iter_request(channel: str, body, *, headers: dict[str, Any] | None = None, timeout: int = 5,
+                       n: int | None = None, transport: str = stream.PUBSUB) -> AsyncIterator[Response]:
+    assert timeout > 0
+
+    # 流式响应的总耗时可能超过单帧的超时时间，不设置截止时间
+    headers, q = await _send(channel, body, headers, timeout, transport, stamp_deadline=False)
+    ended = False
+    try:
+        i = 0
+        while n is None or i < n:
+            try:
+                resp = await asyncio.wait_for(q.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            if resp.stream_end:
+                ended = True
+                if resp.exception_type is not None:
+                    raise RemoteFunctionRaisedException(resp)
+                break
+            yield await _resolve(resp)
+            i += 1
+    finally:
+        _waiters.pop(headers["litter-request-id"], None)
+        if not ended:
+            # 超时、达到 n 帧或调用方提前退出时通知agent停止生成
+            try:
+                await publish(f"{channel}:timeout", body, headers=headers)
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Failed to cancel request {headers['litter-request-id']} of {channel}: {e}")
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from loguru import logger
+
+from litter import compress
+from litter.codec import encode, decode
+
+__all__ = [
+    "BlobStore",
+    "RedisBlobStore",
+    "LocalBlobStore",
+    "AioRedisBlobStore",
+    "BODY_REF_HEADER",
+    "register",
+    "register_async",
+    "configure",
+    "enabled",
+    "offload",
+    "resolve",
+    "aio_resolve",
+]
+
+BODY_REF_HEADER = "litter-body-ref"
+
+_stores: dict[str, "BlobStore"] = {}
+_aio_stores: dict[str, "AioRedisBlobStore"] = {}
+_writer: "BlobStore | None" = None
+_threshold: int = 1024 * 1024
+
+
+class BlobStore(ABC):
+    """
+    存放大体积消息体的外部存储，信封中只携带 "<scheme>:<key>" 形式的引用
+    """
+    scheme: str
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """
+        保存数据，返回引用
+        """
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        """
+        按引用（不含 scheme）读取数据，数据不存在或已过期时返回None
+        """
+
+
+class RedisBlobStore(BlobStore):
+    scheme = "redis"
+
+    def __init__(self, client, *, ttl: int = 300, prefix: str = "LBLOB:"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def put(self, data: bytes) -> str:
+        key = f"{self.prefix}{uuid.uuid4().hex}"
+        self.client.set(key, data, ex=self.ttl)
+        return f"{self.scheme}:{key}"
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(key)
+
+
+class AioRedisBlobStore:
+    """
+    redis.asyncio 版本的 RedisBlobStore，只用于 asyncio 客户端读取引用
+    """
+    scheme = "redis"
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+
+class LocalBlobStore(BlobStore):
+    """
+    共享目录存储，引用中携带绝对路径，读取端需要以相同路径挂载该目录
+    """
+    scheme = "file"
+
+    def __init__(self, path: str | Path, *, ttl: int = 300, sweep_interval: int = 60):
+        self.path = Path(path).absolute()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.ttl = int(ttl)
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.
+        self._lock = threading.Lock()
+
+    def _sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        for f in self.path.glob("*.blob"):
+            try:
+                if now - f.stat().st_mtime > self.ttl:
+                    f.unlink()
+            except FileNotFoundError:
+                pass
+
+    def put(self, data: bytes) -> str:
+        self._sweep()
+        path = self.path / f"{uuid.uuid4().hex}.blob"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return f"{self.scheme}:{path}"
+
+    def get(self, key: str) -> bytes | None:
+        # 引用来自对端的请求头，只允许读取本存储目录下的文件
+        path = Path(key).resolve()
+        if not path.is_relative_to(self.path.resolve()):
+            logger.warning(f"Rejected blob ref outside {self.path}: {key}")
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+
+def register(store: BlobStore) -> None:
+    """
+    注册用于解析引用的存储
+    """
+    _stores[store.scheme] = store
+
+
+def register_async(store: AioRedisBlobStore) -> None:
+    """
+    注册 asyncio 客户端用于解析引用的存储；没有注册异步存储的 scheme 在线程中使用同步存储读取
+    """
+    _aio_stores[store.scheme] = store
+
+
+def configure(store: BlobStore | None, threshold: int | None = None) -> None:
+    """
+    设置写入端存储，编码后超过 threshold 字节的消息体会被存入 store；store 为None时关闭
+    """
+    global _writer, _threshold
+    _writer = store
+    if store is not None:
+        register(store)
+    if threshold is not None:
+        _threshold = int(threshold)
+
+
+def enabled() -> bool:
+    return _writer is not None
+
+
+def offload(envelope: dict, data: str | bytes, codec: str) -> str | bytes:
+    """
+    编码后的信封超过阈值时将其整体存入外部存储，在 headers 中记录引用，返回不含消息体的信封的编码；否则原样返回 data。
+    存入的是完整的信封而不是单独的消息体，消息体为 bytes、datetime 时也能按原类型解码
+    """
+    if _writer is None or envelope.get("body") is None or len(data) <= _threshold:
+        return data
+    envelope["headers"][BODY_REF_HEADER] = _writer.put(data.encode("utf8") if isinstance(data, str) else data)
+    return encode({**envelope, "body": None}, codec)
+
+
+def resolve(ref: str):
+    """
+    解析引用，返回解码后的消息体；引用失效时抛出 KeyError
+    """
+    scheme, key = ref.split(":", 1)
+    if scheme not in _stores:
+        raise KeyError(f"No blob store registered for {scheme}")
+    return _decode(ref, _stores[scheme].get(key))
+
+
+async def aio_resolve(ref: str):
+    """
+    asyncio版本的 resolve
+    """
+    scheme, key = ref.split(":", 1)
+    if scheme in _aio_stores:
+        data = await _aio_stores[scheme].get(key)
+    elif scheme in _stores:
+        data = await asyncio.to_thread(_stores[scheme].get, key)
+    else:
+        raise KeyError(f"No blob store registered for {scheme}")
+    return _decode(ref, data)
+
+
+def _decode(ref: str, data: bytes | None):
+    if data is None:
+        raise KeyError(f"Blob {ref} not found or expired")
+    return compress.inflate(decode(data))["body"]
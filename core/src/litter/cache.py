@@ -0,0 +1,142 @@
+import hashlib
+import inspect
+import string
+from dataclasses import dataclass
+from typing import Callable, Any
+
+import redis
+from loguru import logger
+
+from litter.codec import encode, decode, available_codecs
+from litter.model import Response
+
+__all__ = [
+    "cached",
+    "invalidates",
+    "wrap",
+]
+
+CACHE_PREFIX = "LCACHE:"  # lt cache
+
+
+@dataclass
+class CacheSpec:
+    ttl: int
+    key: str | Callable[..., str] | None
+
+
+@dataclass
+class InvalidateSpec:
+    methods: tuple[str, ...]
+    key: str | Callable[..., str] | None
+
+
+def cached(ttl: int, key: str | Callable[..., str] | None = None):
+    """
+    声明 agent 方法的结果可以缓存到redis，命中缓存时不进入方法。返回None或抛出异常时不缓存
+    :param ttl: 有效期（秒）
+    :param key: 缓存键：格式化字符串（如 "{illust_id}"）；或接收方法参数返回字符串的函数；None表示使用全部参数
+    """
+
+    def _inner(func):
+        func.__litter_cache__ = CacheSpec(int(ttl), key)
+        return func
+
+    return _inner
+
+
+def invalidates(*methods: str, key: str | Callable[..., str] | None = None):
+    """
+    声明方法执行成功后使哪些方法的缓存失效，可以叠加多个
+    :param methods: 方法名
+    :param key: 失效的缓存键，规则同 cached；None或无法根据参数生成时，使对应方法的全部缓存失效
+    """
+
+    def _inner(func):
+        func.__litter_invalidates__ = [*getattr(func, "__litter_invalidates__", []), InvalidateSpec(tuple(methods), key)]
+        return func
+
+    return _inner
+
+
+def _format_key(key: str | Callable[..., str] | None, arguments: dict[str, Any]) -> str | None:
+    if key is None:
+        return hashlib.sha1(encode(sorted(arguments.items())).encode("utf8")).hexdigest()
+    if callable(key):
+        return key(**arguments)
+    try:
+        if any(arguments.get(name) is None for name in _key_fields(key)):
+            return None
+        return key.format(**arguments)
+    except (KeyError, IndexError):
+        return None
+
+
+def _key_fields(key: str) -> list[str]:
+    return [field for _, field, _, _ in string.Formatter().parse(key) if field]
+
+
+def _invalidate(client, app_name: str, spec: InvalidateSpec, arguments: dict[str, Any]):
+    k = None if spec.key is None else _format_key(spec.key, arguments)
+    for method in spec.methods:
+        if k is not None:
+            client.delete(f"{CACHE_PREFIX}{app_name}:{method}:{k}")
+        else:
+            keys = list(client.scan_iter(match=f"{CACHE_PREFIX}{app_name}:{method}:*", count=500))
+            if keys:
+                client.delete(*keys)
+        logger.debug(f"Invalidated cache {app_name}:{method}:{k or '*'}")
+
+
+def _cacheable(ret) -> bool:
+    return ret is not None and not (inspect.isgenerator(ret) or inspect.isasyncgen(ret) or isinstance(ret, Response))
+
+
+def wrap(get_client: Callable[[], Any], app_name: str, name: str, method: Callable) -> Callable[..., Any]:
+    """
+    根据 cached / invalidates 声明包装方法。缓存读写失败时只记录日志，不影响方法调用
+    :param get_client: 返回redis客户端的函数
+    :return: (args, kwargs, no_cache) -> result
+    """
+    cache_spec: CacheSpec | None = getattr(method, "__litter_cache__", None)
+    invalidate_specs: list[InvalidateSpec] = getattr(method, "__litter_invalidates__", [])
+    if cache_spec is None and not invalidate_specs:
+        return lambda args, kwargs, no_cache=False: method(*args, **kwargs)
+
+    signature = inspect.signature(method)
+    codec = available_codecs()[0]
+
+    def _arguments(args, kwargs) -> dict[str, Any]:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return dict(bound.arguments)
+
+    def _inner(args, kwargs, no_cache: bool = False):
+        client = get_client()
+        arguments = _arguments(args, kwargs)
+        cache_key = None
+        if cache_spec is not None and client is not None \
+                and (k := _format_key(cache_spec.key, arguments)) is not None:
+            cache_key = f"{CACHE_PREFIX}{app_name}:{name}:{k}"
+            try:
+                if not no_cache and (data := client.get(cache_key)) is not None:
+                    logger.debug(f"Cache hit {cache_key}")
+                    return decode(data)
+            except redis.RedisError as e:
+                logger.warning(f"Failed to read cache {cache_key}: {e}")
+            except (ValueError, ImportError, RuntimeError) as e:
+                # 其他副本用本进程无法解码的编码写入（如未安装msgpack，RuntimeError），视为未命中
+                logger.warning(f"Failed to decode cache {cache_key}, treated as miss: {e}")
+
+        ret = method(*args, **kwargs)
+
+        try:
+            if cache_key is not None and _cacheable(ret):
+                client.set(cache_key, encode(ret, codec), ex=cache_spec.ttl)
+            for spec in (invalidate_specs if client is not None else []):
+                _invalidate(client, app_name, spec, arguments)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to update cache of {app_name}:{name}: {e}")
+        return ret
+
+    return _inner
@@ -0,0 +1,74 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from litter.model import RequestCancelledException
+
+__all__ = [
+    "CancelToken",
+    "current_token",
+]
+
+
+class CancelToken:
+    """
+    请求的取消令牌：请求超过 litter-deadline 或客户端发出 <channel>:timeout 通知后视为已取消。
+    耗时较长的处理函数应在重试、分块等间隙检查令牌，尽早释放执行线程
+    """
+
+    def __init__(self, deadline: float | None = None):
+        self.deadline = deadline
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.time() > self.deadline
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or self.expired
+
+    def remaining(self) -> float | None:
+        """
+        距离截止时间的秒数，没有截止时间时返回None
+        """
+        return None if self.deadline is None else max(self.deadline - time.time(), 0.)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise RequestCancelledException("Request has been cancelled" if self._event.is_set()
+                                            else "Request deadline exceeded")
+
+    def wait(self, timeout: float) -> bool:
+        """
+        代替 time.sleep，请求被取消时提前返回
+        :return: 是否已取消
+        """
+        if (remaining := self.remaining()) is not None:
+            timeout = min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.cancelled
+
+
+_NEVER = CancelToken()
+_current: ContextVar[CancelToken] = ContextVar("litter_cancel_token", default=_NEVER)
+
+
+def current_token() -> CancelToken:
+    """
+    当前正在处理的请求的取消令牌；不在litter请求处理中时返回一个永远不会取消的令牌
+    """
+    return _current.get()
+
+
+@contextmanager
+def bind(token: CancelToken | None):
+    reset = _current.set(token or _NEVER)
+    try:
+        yield
+    finally:
+        _current.reset(reset)
@@ -1,10 +1,12 @@
 import argparse
 import json
+import time
 
 from loguru import logger
 
 import litter
 from confctl import config
+from litter import registry, retry
 
 
 def publish(channel: str, body: str):
@@ -20,6 +22,53 @@ def request(channel: str, body: str):
     logger.info(f"result from {channel}:\n{result}")
 
 
+def agents(app: str | None, verbose: bool, as_json: bool):
+    infos = sorted(registry.agents(litter.get_redis()), key=lambda x: (x.get("app", ""), x["instance"]))
+    if app is not None:
+        infos = [x for x in infos if x.get("app") == app]
+    if as_json:
+        print(json.dumps(infos, ensure_ascii=False, indent=2))
+        return
+    rows = [("INSTANCE", "HEALTH", "WORKERS", "RUNNING", "QUEUED", "REJECTED", "UPTIME", "HEARTBEAT")]
+    now = time.time()
+    for x in infos:
+        health = "ok" if x["health"]["ok"] else f"FAIL: {x['health']['message']}"
+        rows.append((x["instance"], health, str(x["workers"]), str(x["running"]), str(x["queued"]),
+                     str(x["rejected"]), f"{int(now - x['started'])}s", f"{now - x['heartbeat']:.1f}s ago"))
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    for i, row in enumerate(rows):
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+        if verbose and i > 0:
+            for channel in infos[i - 1]["channels"]:
+                print(f"    {channel}")
+    print(f"{len(infos)} agent(s) alive")
+
+
+def dlq(action: str, channel: str | None, ids: list[str] | None, verbose: bool, as_json: bool):
+    client = litter.get_redis()
+    ids = set(ids) if ids else None
+    if action == "replay":
+        logger.info(f"replayed {retry.replay(client, channel, ids)} dead letter(s)")
+        return
+    if action == "purge":
+        logger.info(f"purged {retry.purge(client, channel, ids)} dead letter(s)")
+        return
+    entries = [x for x in retry.dead_letters(client, channel) if ids is None or x["id"] in ids]
+    if as_json:
+        print(json.dumps(entries, ensure_ascii=False, indent=2))
+        return
+    rows = [("ID", "CHANNEL", "HANDLER", "APP", "ATTEMPTS", "TIME", "ERROR")]
+    for x in entries:
+        rows.append((x["id"], x["channel"], x["handler"], x["app"], str(x["attempts"]),
+                     time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(x["time"])), x["error"].splitlines()[0]))
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+    for i, row in enumerate(rows):
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+        if verbose and i > 0:
+            print("    " + entries[i - 1]["traceback"].rstrip().replace("\n", "\n    "))
+    print(f"{len(entries)} dead letter(s)")
+
+
 def main():
     parser = argparse.ArgumentParser(prog="litter", description="Litter CLI tool")
     parser.add_argument("--config-path", "-c", default="config/config.yaml", help="Configuration file path")
@@ -36,6 +85,22 @@ def main():
     request_parser.add_argument("channel", help="Channel name")
     request_parser.add_argument("body", help="JSON body string")
 
+    # agents 子命令
+    agents_parser = subparsers.add_parser("agents", help="List live agents and their load")
+    agents_parser.add_argument("--app", default=None, help="Only show agents of this app")
+    agents_parser.add_argument("--verbose", "-v", action="store_true", help="Show channels of each agent")
+    agents_parser.add_argument("--json", action="store_true", help="Output raw registry entries as JSON")
+
+    # dlq 子命令
+    dlq_parser = subparsers.add_parser("dlq", help="Inspect, replay or purge dead letters")
+    dlq_parser.add_argument("action", nargs="?", default="list", choices=("list", "replay", "purge"),
+                            help="list (default), replay to the original channel, or purge")
+    dlq_parser.add_argument("--channel", default=None, help="Only dead letters of channels matching this pattern")
+    dlq_parser.add_argument("--id", dest="ids", action="append", default=None,
+                            help="Only the dead letter with this id, can be repeated")
+    dlq_parser.add_argument("--verbose", "-v", action="store_true", help="Show tracebacks")
+    dlq_parser.add_argument("--json", action="store_true", help="Output raw dead letters as JSON")
+
     args = parser.parse_args()
 
     config.load_config(args.config_path)
@@ -45,6 +110,10 @@ def main():
         publish(args.channel, args.body)
     elif args.command == "request":
         request(args.channel, args.body)
+    elif args.command == "agents":
+        agents(args.app, args.verbose, args.json)
+    elif args.command == "dlq":
+        dlq(args.action, args.channel, args.ids, args.verbose, args.json)
     else:
         parser.print_help()
 
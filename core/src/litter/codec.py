@@ -0,0 +1,264 @@
+import base64
+import json
+from datetime import datetime
+from collections.abc import Mapping
+from pathlib import PurePath
+from typing import Any, TypeAlias
+from zoneinfo import ZoneInfo
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = [
+    "JSON",
+    "TJSON",
+    "MSGPACK",
+    "serialize",
+    "deserialize",
+    "available_codecs",
+    "negotiate_codec",
+    "encode",
+    "decode",
+]
+
+Json: TypeAlias = dict[str, Any] | list[dict[str, Any]]
+
+# zoneinfo 的 astimezone 比 pytz 快数倍，解码大量 datetime 时差异明显
+tz = ZoneInfo("Asia/Shanghai")
+
+JSON = "json"
+TJSON = "tjson"
+MSGPACK = "msgpack"
+
+DTM_PREFIX = "<\u200Blt-p:dtm>:"
+BASE64_PREFIX = "<\u200Blt-p:b64>:"
+
+# 0xc1 在 msgpack 中是保留字节，合法的 msgpack/JSON 数据都不会以它开头
+MSGPACK_MAGIC = b"\xc1lt:mp\x00"
+TJSON_MAGIC = b"\xc1lt:tj\x00"
+_EXT_DATETIME = 1
+_T_DATETIME, _T_BYTES = "dt", "b64"
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+def _fallback(o):
+    if isinstance(o, PurePath):
+        return str(o)
+    elif isinstance(o, Exception):
+        return f'{type(o)}: {o}'
+    return str(o)
+
+
+def serialize(obj) -> str:
+    def _default(o):
+        if isinstance(o, datetime):
+            return DTM_PREFIX + o.isoformat()
+        elif isinstance(o, bytes):
+            return BASE64_PREFIX + base64.b64encode(o).decode()
+        return _fallback(o)
+
+    return json.dumps(obj, default=_default, ensure_ascii=False)
+
+
+def _has_markers(data: str) -> bool:
+    # 两种前缀都以零宽空格开头，没有零宽空格时不需要逐个检查字符串
+    return "\u200B" in data or "\\u200" in data
+
+
+def deserialize(data, **kwargs) -> Json:
+    def _obj_hook(d):
+        for k, v in d.items():
+            if isinstance(v, str):
+                if v.startswith(BASE64_PREFIX):
+                    d[k] = base64.b64decode(v[len(BASE64_PREFIX):])
+                elif v.startswith(DTM_PREFIX):
+                    d[k] = datetime.fromisoformat(v[len(DTM_PREFIX):]).astimezone(tz)
+        return d
+
+    if isinstance(data, str):
+        if not kwargs and not _has_markers(data):
+            return json.loads(data)
+        return json.loads(data, object_hook=_obj_hook, **kwargs)
+    else:
+        return data
+
+
+class _Typed(Exception):
+    pass
+
+
+def _raise_typed(o):
+    if isinstance(o, (datetime, bytes, bytearray)):
+        raise _Typed()
+    return _fallback(o)
+
+
+def _dumps(obj, default) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default,
+                                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError as e:
+            if isinstance(e.__cause__, _Typed):
+                raise e.__cause__
+            # orjson 不支持的情况（如超过64位的整数）回退到标准库
+    return json.dumps(obj, default=default, ensure_ascii=False).encode("utf8")
+
+
+def _loads(data: bytes | memoryview):
+    return orjson.loads(data) if orjson is not None else json.loads(bytes(data))
+
+
+def _json_key(k) -> str:
+    # 与 json.dumps 转换非字符串键的规则一致
+    if isinstance(k, str):
+        return k
+    if k is True or k is False or k is None:
+        return json.dumps(k)
+    return str(int(k)) if isinstance(k, int) else repr(k)
+
+
+def _walk(obj, path: tuple, table: dict[str, list]):
+    """
+    将 datetime 和 bytes 转为字符串，并在 table 中记录它们的路径；没有需要转换的值时返回原对象
+    """
+    t = type(obj)
+    # 先按类型快速判断，再兼容 defaultdict、OrderedDict 等子类
+    if t is dict or isinstance(obj, Mapping):
+        out = None if t is dict else dict(obj)
+        for k, v in obj.items():
+            if type(v) in _PLAIN_TYPES:
+                continue
+            nv = _walk(v, path + (_json_key(k),), table)
+            if nv is not v:
+                if out is None:
+                    out = dict(obj)
+                out[k] = nv
+        return obj if out is None else out
+    if t is list or t is tuple or isinstance(obj, (list, tuple)):
+        out = None
+        for i, v in enumerate(obj):
+            if type(v) in _PLAIN_TYPES:
+                continue
+            nv = _walk(v, path + (i,), table)
+            if nv is not v:
+                if out is None:
+                    out = list(obj)
+                out[i] = nv
+        return obj if out is None else out
+    if isinstance(obj, datetime):
+        table[_T_DATETIME].append(path)
+        return obj.isoformat()
+    if isinstance(obj, (bytes, bytearray)):
+        table[_T_BYTES].append(path)
+        return base64.b64encode(obj).decode()
+    return obj
+
+
+def _encode_tjson(obj) -> bytes:
+    """
+    TJSON_MAGIC + 类型表 + 换行 + JSON。
+    类型表列出 datetime/bytes 值的路径，解码时只处理这些值；没有这类值时类型表为空，解码即普通的 JSON
+    """
+    try:
+        return TJSON_MAGIC + b"\n" + _dumps(obj, _raise_typed)
+    except _Typed:
+        pass
+    table = {_T_DATETIME: [], _T_BYTES: []}
+    obj = _walk(obj, (), table)
+    return TJSON_MAGIC + _dumps({k: v for k, v in table.items() if v}, _fallback) + b"\n" + _dumps(obj, _fallback)
+
+
+def _convert(kind: str, v):
+    if kind == _T_DATETIME:
+        return datetime.fromisoformat(v).astimezone(tz)
+    return base64.b64decode(v)
+
+
+def _decode_tjson(data: bytes):
+    view = memoryview(data)
+    newline = data.index(b"\n", len(TJSON_MAGIC))
+    obj = _loads(view[newline + 1:])
+    if newline == len(TJSON_MAGIC):
+        return obj
+    for kind, paths in _loads(view[len(TJSON_MAGIC):newline]).items():
+        for path in paths:
+            if not path:
+                obj = _convert(kind, obj)
+                continue
+            parent = obj
+            for k in path[:-1]:
+                parent = parent[k]
+            parent[path[-1]] = _convert(kind, parent[path[-1]])
+    return obj
+
+
+def _msgpack_default(o):
+    if isinstance(o, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, o.isoformat().encode())
+    return _fallback(o)
+
+
+def _msgpack_ext_hook(code: int, data: bytes):
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode()).astimezone(tz)
+    return msgpack.ExtType(code, data)
+
+
+def available_codecs() -> list[str]:
+    """
+    当前进程能够解码的编码，按优先级排列
+    """
+    return [MSGPACK, TJSON, JSON] if msgpack is not None else [TJSON, JSON]
+
+
+def negotiate_codec(accept: str | None) -> str:
+    """
+    根据对端的 litter-accept-codecs 头选择双方都支持的编码，缺省为 JSON（兼容旧版本）
+    """
+    if not accept:
+        return JSON
+    local = available_codecs()
+    for codec in accept.split(","):
+        if (codec := codec.strip()) in local:
+            return codec
+    return JSON
+
+
+def encode(obj, codec: str = JSON) -> str | bytes:
+    """
+    编码信封；JSON 编码结果与 serialize 完全一致，msgpack 编码原生支持 bytes 和 datetime，
+    TJSON 在数据头列出 bytes 和 datetime 的路径，安装了 orjson 时使用 orjson
+    """
+    if codec == JSON:
+        return serialize(obj)
+    elif codec == TJSON:
+        return _encode_tjson(obj)
+    elif codec == MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed, install mmt-core[msgpack] first")
+        return MSGPACK_MAGIC + msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decode(data: str | bytes) -> Json:
+    """
+    解码信封，根据数据头自动识别编码
+    """
+    if isinstance(data, bytes):
+        if data.startswith(TJSON_MAGIC):
+            return _decode_tjson(data)
+        if data.startswith(MSGPACK_MAGIC):
+            if msgpack is None:
+                raise RuntimeError("msgpack is not installed, install mmt-core[msgpack] first")
+            return msgpack.unpackb(memoryview(data)[len(MSGPACK_MAGIC):], raw=False,
+                                   ext_hook=_msgpack_ext_hook, strict_map_key=False)
+        data = data.decode("utf8")
+    return deserialize(data)
@@ -0,0 +1,119 @@
+import zlib
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Any
+
+from litter.codec import encode, decode
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = [
+    "Compression",
+    "CONTENT_ENCODING_HEADER",
+    "ZLIB",
+    "ZSTD",
+    "configure",
+    "encode_envelope",
+    "inflate",
+]
+
+CONTENT_ENCODING_HEADER = "litter-content-encoding"
+ZLIB = "zlib"
+ZSTD = "zstd"
+
+
+@dataclass(frozen=True)
+class Compression:
+    """
+    :param algorithm: zlib 或 zstd
+    :param level: 压缩级别，None表示使用算法的默认级别
+    :param threshold: 编码后的信封超过该字节数时才压缩消息体
+    """
+    algorithm: str = ZLIB
+    level: int | None = None
+    threshold: int = 16 * 1024
+
+
+# channel（支持通配符）-> Compression，None表示该channel不压缩
+_rules: dict[str, Compression | None] = {}
+_resolved: dict[str, Compression | None] = {}
+
+
+def _compress(rule: Compression, data: bytes) -> bytes:
+    if rule.algorithm == ZLIB:
+        return zlib.compress(data, -1 if rule.level is None else rule.level)
+    return zstandard.ZstdCompressor(level=3 if rule.level is None else rule.level).compress(data)
+
+
+def _decompress(algorithm: str, data: bytes) -> bytes:
+    if algorithm == ZLIB:
+        return zlib.decompress(data)
+    elif algorithm == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed, install mmt-core[zstd] first")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unknown content encoding: {algorithm}")
+
+
+def configure(rules: dict[str, Compression | dict[str, Any] | None] | None) -> None:
+    """
+    设置各channel发出消息的压缩方式，替换之前的设置；接收端总是根据 litter-content-encoding 自动解压
+    :param rules: channel（支持通配符，"*" 匹配全部）-> Compression 或其参数，None表示不压缩；先精确匹配，再按顺序匹配通配符
+    """
+    parsed = {}
+    for channel, rule in (rules or {}).items():
+        if rule is not None and not isinstance(rule, Compression):
+            rule = Compression(**rule)
+        if rule is not None:
+            if rule.algorithm not in (ZLIB, ZSTD):
+                raise ValueError(f"Unknown compression algorithm: {rule.algorithm}")
+            if rule.algorithm == ZSTD and zstandard is None:
+                raise RuntimeError("zstandard is not installed, install mmt-core[zstd] first")
+        parsed[channel] = rule
+    global _rules, _resolved
+    _rules, _resolved = parsed, {}
+
+
+def _rule(channel: str) -> Compression | None:
+    try:
+        return _resolved[channel]
+    except KeyError:
+        pass
+    rule = _rules.get(channel)
+    if channel not in _rules:
+        rule = next((r for pattern, r in _rules.items() if fnmatchcase(channel, pattern)), None)
+    _resolved[channel] = rule
+    return rule
+
+
+def encode_envelope(channel: str, envelope: dict[str, Any], codec: str) -> str | bytes:
+    """
+    编码信封；超过 channel 的压缩阈值时压缩已编码的信封，作为外层信封的消息体发送，并在外层请求头中记录压缩方式。
+    信封只编码一次，外层的请求头保持不压缩，不解压也能读取
+    """
+    data = encode(envelope, codec)
+    if not _rules or (rule := _rule(channel)) is None or len(data) <= rule.threshold \
+            or envelope.get("body") is None:
+        return data
+    raw = data.encode("utf8") if isinstance(data, str) else data
+    packed = _compress(rule, raw)
+    if len(packed) >= len(raw) * 0.9:
+        # 压缩效果不明显（如图片等已压缩的数据），原样发送
+        return data
+    return encode({"headers": {**envelope["headers"], CONTENT_ENCODING_HEADER: rule.algorithm}, "body": packed},
+                  codec)
+
+
+def inflate(envelope: dict[str, Any]) -> dict[str, Any]:
+    """
+    解压已解码的信封中被压缩的消息体，原地修改并返回。
+    被压缩的是完整的内层信封，消息体为 bytes、datetime 时也能按原类型解码
+    """
+    headers = envelope.get("headers")
+    if not headers or (algorithm := headers.pop(CONTENT_ENCODING_HEADER, None)) is None:
+        return envelope
+    envelope["body"] = decode(_decompress(algorithm, envelope["body"]))["body"]
+    return envelope
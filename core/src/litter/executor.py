@@ -0,0 +1,231 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Callable, Any
+
+from loguru import logger
+
+from litter.model import RequestRejectedException
+
+__all__ = [
+    "ChannelLimit",
+    "BoundedExecutor",
+    "HIGH",
+    "NORMAL",
+    "LOW",
+]
+
+HIGH = "high"
+NORMAL = "normal"
+LOW = "low"
+PRIORITIES = (HIGH, NORMAL, LOW)
+# 各优先级都有等待的请求时，按权重分配空闲线程
+DEFAULT_PRIORITY_WEIGHTS = {HIGH: 8, NORMAL: 3, LOW: 1}
+
+
+@dataclass
+class ChannelLimit:
+    """
+    :param concurrency: 同时执行的最大数量，None表示只受线程数限制
+    :param max_queue: 等待执行的最大数量，None表示不限制
+    """
+    concurrency: int | None = None
+    max_queue: int | None = None
+
+
+class _WorkItem:
+    __slots__ = ("future", "fn", "args", "kwargs")
+
+    def __init__(self, future: Future, fn: Callable, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(result)
+
+
+class BoundedExecutor:
+    """
+    按 channel 排队的线程池。
+    每个 channel 有独立的等待队列和并发上限，超过队列上限时 submit 立即抛出 RequestRejectedException 而不是无限排队。
+    高、中、低三个优先级使用独立的队列，按权重分配线程，并可以为高优先级保留线程
+    """
+
+    def __init__(self, max_workers: int = 4, *, max_queue: int | None = None,
+                 channel_limits: dict[str, ChannelLimit | dict[str, Any]] | None = None,
+                 thread_name_prefix: str = "", priority_weights: dict[str, int] | None = None,
+                 reserved_workers: int = 0):
+        """
+        :param max_workers: 线程数
+        :param max_queue: 全部 channel 等待执行的最大数量，None表示不限制
+        :param channel_limits: channel（支持通配符）-> ChannelLimit
+        :param thread_name_prefix: 线程名前缀
+        :param priority_weights: 优先级 -> 权重，缺省为 DEFAULT_PRIORITY_WEIGHTS
+        :param reserved_workers: 只执行高优先级请求的线程数，中、低优先级的请求最多同时执行 max_workers - reserved_workers 个
+        """
+        if not 0 <= reserved_workers < max_workers:
+            raise ValueError(f"reserved_workers must be in [0, {max_workers})")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.channel_limits = {
+            k: (v if isinstance(v, ChannelLimit) else ChannelLimit(**v))
+            for k, v in (channel_limits or {}).items()
+        }
+        self.priority_weights = {**DEFAULT_PRIORITY_WEIGHTS, **(priority_weights or {})}
+        self.reserved_workers = reserved_workers
+        self._cond = threading.Condition()
+        # 优先级 -> channel -> 等待队列
+        self._queues: dict[str, dict[str, deque[_WorkItem]]] = {p: {} for p in PRIORITIES}
+        self._running: dict[str, int] = {}
+        self._rejected: dict[str, int] = {}
+        self._queued = 0
+        self._busy = 0
+        self._lane_queued = {p: 0 for p in PRIORITIES}
+        self._lane_running = {p: 0 for p in PRIORITIES}
+        self._lane_credit = {p: 0 for p in PRIORITIES}
+        # 各优先级内的轮询顺序，避免单个 channel 饿死其他 channel
+        self._rr: dict[str, deque[str]] = {p: deque() for p in PRIORITIES}
+        self._shutdown = False
+        self._threads = []
+        for i in range(max_workers):
+            t = threading.Thread(target=self._worker, name=f"{thread_name_prefix}_{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _limit(self, channel: str) -> ChannelLimit:
+        if channel in self.channel_limits:
+            return self.channel_limits[channel]
+        for pattern, limit in self.channel_limits.items():
+            if fnmatchcase(channel, pattern):
+                return limit
+        return ChannelLimit()
+
+    def _reject(self, channel: str, reason: str):
+        self._rejected[channel] = self._rejected.get(channel, 0) + 1
+        logger.warning(f"Rejected request of {channel}: {reason} (total rejected: {self._rejected[channel]})")
+        raise RequestRejectedException(f"{channel}: {reason}")
+
+    def _channel_queued(self, channel: str) -> int:
+        return sum(len(lane.get(channel, ())) for lane in self._queues.values())
+
+    def submit(self, channel: str, fn: Callable, /, *args, priority: str = NORMAL, **kwargs) -> Future:
+        """
+        :param priority: high、normal 或 low，未知的值视为 normal
+        """
+        if priority not in self._queues:
+            priority = NORMAL
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            running, queued = self._running.get(channel, 0), self._channel_queued(channel)
+            limit = self._limit(channel)
+            concurrency = limit.concurrency or self.max_workers
+            if limit.max_queue is not None and running + queued >= concurrency + limit.max_queue:
+                self._reject(channel, f"channel queue is full ({queued} waiting, {running} running)")
+            if self.max_queue is not None and self._busy + self._queued >= self.max_workers + self.max_queue:
+                self._reject(channel, f"executor queue is full ({self._queued} waiting)")
+
+            future = Future()
+            self._queues[priority].setdefault(channel, deque()).append(_WorkItem(future, fn, args, kwargs))
+            if channel not in self._rr[priority]:
+                self._rr[priority].append(channel)
+            self._queued += 1
+            self._lane_queued[priority] += 1
+            self._cond.notify()
+            return future
+
+    def _pop_lane(self, priority: str) -> tuple[str, _WorkItem] | None:
+        rr, queues = self._rr[priority], self._queues[priority]
+        for _ in range(len(rr)):
+            channel = rr[0]
+            rr.rotate(-1)
+            q = queues[channel]
+            if not q:
+                continue
+            concurrency = self._limit(channel).concurrency or self.max_workers
+            if self._running.get(channel, 0) >= concurrency:
+                continue
+            return channel, q.popleft()
+        return None
+
+    def _pop(self) -> tuple[str, str, _WorkItem] | None:
+        """
+        在有等待请求的优先级之间按权重平滑轮询（smooth weighted round-robin），保留的线程只用于高优先级
+        """
+        shared_free = self._busy - self._lane_running[HIGH] < self.max_workers - self.reserved_workers
+        lanes = [p for p in PRIORITIES if self._lane_queued[p] and (p == HIGH or shared_free)]
+        while lanes:
+            total = sum(self.priority_weights[p] for p in lanes)
+            for p in lanes:
+                self._lane_credit[p] += self.priority_weights[p]
+            priority = max(lanes, key=self._lane_credit.__getitem__)
+            self._lane_credit[priority] -= total
+            if (item := self._pop_lane(priority)) is not None:
+                return priority, *item
+            # 该优先级的 channel 都已达到并发上限
+            lanes.remove(priority)
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while (item := self._pop()) is None:
+                    if self._shutdown and self._queued == 0:
+                        return
+                    self._cond.wait()
+                priority, channel, work = item
+                self._queued -= 1
+                self._lane_queued[priority] -= 1
+                self._busy += 1
+                self._lane_running[priority] += 1
+                self._running[channel] = self._running.get(channel, 0) + 1
+            try:
+                work.run()
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._lane_running[priority] -= 1
+                    self._running[channel] -= 1
+                    # channel 并发数或共享线程释放后，可能有其他线程可以继续执行等待的任务
+                    self._cond.notify_all()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        各 channel 的执行中、等待中以及被拒绝的数量
+        """
+        with self._cond:
+            channels = {c for lane in self._queues.values() for c in lane} | set(self._rejected)
+            return {
+                channel: {
+                    "running": self._running.get(channel, 0),
+                    "queued": self._channel_queued(channel),
+                    "rejected": self._rejected.get(channel, 0),
+                }
+                for channel in channels
+            }
+
+    def priority_stats(self) -> dict[str, dict[str, int]]:
+        """
+        各优先级的执行中和等待中的数量
+        """
+        with self._cond:
+            return {p: {"running": self._lane_running[p], "queued": self._lane_queued[p]} for p in PRIORITIES}
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
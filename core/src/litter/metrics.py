@@ -0,0 +1,139 @@
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Iterable
+
+from loguru import logger
+
+__all__ = [
+    "inc",
+    "observe",
+    "register_gauge",
+    "snapshot",
+    "render",
+    "serve",
+]
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60., 120.)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_lock = threading.Lock()
+# (name, labels) -> value
+_counters: dict[tuple[str, tuple], float] = {}
+# (name, labels) -> [各bucket计数..., 超出最大bucket的计数, 总和]
+_histograms: dict[tuple[str, tuple], list[float]] = {}
+_buckets: dict[str, tuple[float, ...]] = {}
+# 渲染时才计算的指标，返回 [(labels, value)]
+_gauges: dict[str, Callable[[], Iterable[tuple[dict[str, str], float]]]] = {}
+_server: ThreadingHTTPServer | None = None
+
+
+def _labels(labels: dict[str, str]) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels: str) -> None:
+    """
+    计数器加 value
+    """
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, *, buckets: tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> None:
+    """
+    记录一次直方图观测值，同名指标的 buckets 以第一次记录时为准
+    """
+    key = (name, _labels(labels))
+    with _lock:
+        buckets = _buckets.setdefault(name, buckets)
+        if (h := _histograms.get(key)) is None:
+            h = _histograms[key] = [0] * (len(buckets) + 2)
+        h[bisect.bisect_left(buckets, value)] += 1
+        h[-1] += value
+
+
+def register_gauge(name: str, collect: Callable[[], Iterable[tuple[dict[str, str], float]]]) -> None:
+    """
+    注册在渲染时计算的指标，如执行器的队列长度
+    :param collect: 返回 [(labels, value)]
+    """
+    _gauges[name] = collect
+
+
+def snapshot() -> dict[str, list[dict]]:
+    """
+    全部指标的当前值，histogram 的 buckets 为累计计数
+    """
+    result: dict[str, list[dict]] = {}
+    with _lock:
+        for (name, labels), value in _counters.items():
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for (name, labels), h in _histograms.items():
+            cumulative, buckets = 0, {}
+            for le, n in zip(_buckets[name] + (float("inf"),), h[:-1]):
+                cumulative += n
+                buckets[le] = cumulative
+            result.setdefault(name, []).append({"labels": dict(labels), "buckets": buckets,
+                                                "count": cumulative, "sum": h[-1]})
+    for name, collect in list(_gauges.items()):
+        try:
+            result[name] = [{"labels": labels, "value": value} for labels, value in collect()]
+        except Exception as e:
+            logger.warning(f"Failed to collect gauge {name}: {e}")
+    return result
+
+
+def _format_labels(labels: dict[str, str], **extra) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def render() -> str:
+    """
+    Prometheus text 格式
+    """
+    lines = []
+    for name, samples in sorted(snapshot().items()):
+        if "buckets" in samples[0]:
+            lines.append(f"# TYPE {name} histogram")
+            for s in samples:
+                for le, n in s["buckets"].items():
+                    le = "+Inf" if le == float("inf") else le
+                    lines.append(f"{name}_bucket{_format_labels(s['labels'], le=le)} {n}")
+                lines.append(f"{name}_count{_format_labels(s['labels'])} {s['count']}")
+                lines.append(f"{name}_sum{_format_labels(s['labels'])} {s['sum']}")
+        else:
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            for s in samples:
+                lines.append(f"{name}{_format_labels(s['labels'])} {s['value']}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = render().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int, host: str = "127.0.0.1") -> None:
+    """
+    在后台线程中通过HTTP提供 Prometheus text 格式的指标
+    """
+    global _server
+    if _server is not None:
+        return
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="LITTER_METRICS_HTTP", daemon=True).start()
+    logger.info(f"Metrics served on http://{host}:{port}/metrics")
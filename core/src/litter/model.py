@@ -1,11 +1,8 @@
-import base64
-import json
-from datetime import datetime
 from functools import cached_property
-from pathlib import PurePath
 from typing import Any, TypeAlias
 
-import pytz
+from litter import blob, compress
+from litter.codec import serialize, deserialize, encode, decode, JSON
 
 __all__ = [
     "Message",
@@ -13,13 +10,17 @@ __all__ = [
     "deserialize",
     "RequestTimeoutException",
     "RemoteFunctionRaisedException",
+    "BlobNotFoundException",
+    "RequestRejectedException",
+    "RequestCancelledException",
+    "NoSubscriberException",
+    "CircuitOpenException",
+    "RateLimitExceededException",
     "Response"
 ]
 
 Json: TypeAlias = dict[str, Any] | list[dict[str, Any]]
 
-tz = pytz.timezone("Asia/Shanghai")
-
 
 class LitterException(Exception):
     pass
@@ -35,39 +36,52 @@ class RemoteFunctionRaisedException(LitterException):
         super().__init__(resp.headers['litter-exception-type'] + ": " + resp.headers['litter-exception-message'])
 
 
-DTM_PREFIX = "<\u200Blt-p:dtm>:"
-BASE64_PREFIX = "<\u200Blt-p:b64>:"
+class BlobNotFoundException(LitterException):
+    pass
 
 
-def serialize(obj) -> str:
-    def _default(o):
-        if isinstance(o, datetime):
-            return DTM_PREFIX + o.isoformat()
-        elif isinstance(o, bytes):
-            return BASE64_PREFIX + base64.b64encode(o).decode()
-        elif isinstance(o, PurePath):
-            return str(o)
-        elif isinstance(o, Exception):
-            return f'{type(o)}: {o}'
-        return str(o)
+class RequestRejectedException(LitterException):
+    """
+    agent 的执行队列已满，请求被拒绝
+    """
+    pass
+
+
+class RequestCancelledException(LitterException):
+    """
+    请求已超过截止时间或已被客户端取消
+    """
+    pass
 
-    return json.dumps(obj, default=_default, ensure_ascii=False)
 
+class NoSubscriberException(LitterException):
+    """
+    没有agent监听请求的channel，请求未被发送或不会被处理
+    """
+    pass
 
-def deserialize(data, **kwargs) -> Json:
-    def _obj_hook(d):
-        for k, v in d.items():
-            if isinstance(v, str):
-                if v.startswith(BASE64_PREFIX):
-                    d[k] = base64.b64decode(v[len(BASE64_PREFIX):])
-                elif v.startswith(DTM_PREFIX):
-                    d[k] = datetime.fromisoformat(v[len(DTM_PREFIX):]).astimezone(tz)
-        return d
 
-    if isinstance(data, str):
-        return json.loads(data, object_hook=_obj_hook, **kwargs)
-    else:
-        return data
+class CircuitOpenException(LitterException):
+    """
+    调用连续失败，客户端已熔断，请求未被发送
+    """
+    pass
+
+
+class RateLimitExceededException(LitterException):
+    """
+    等待限流额度的时间超过了允许的最长时间
+    """
+    pass
+
+
+def _resolve_body(headers: dict, body):
+    if headers is None or (ref := headers.get(blob.BODY_REF_HEADER)) is None:
+        return body
+    try:
+        return blob.resolve(ref)
+    except KeyError as e:
+        raise BlobNotFoundException(str(e)) from e
 
 
 class Message:
@@ -88,15 +102,19 @@ class Message:
 
     @classmethod
     def from_redis_message(cls, redis_message: dict) -> 'Message':
+        redis_message = dict(redis_message)
+        for k in ("channel", "pattern"):
+            if isinstance(redis_message.get(k), bytes):
+                redis_message[k] = redis_message[k].decode("utf8")
         return cls(**redis_message)
 
     @cached_property
     def data_obj(self):
-        return deserialize(self.data)
+        return compress.inflate(decode(self.data))
 
-    @property
+    @cached_property
     def body(self):
-        return self.data_obj["body"]
+        return _resolve_body(self.headers, self.data_obj["body"])
 
     @property
     def headers(self):
@@ -114,19 +132,41 @@ class Message:
 
 
 class Response:
+    _UNRESOLVED = object()
+
     def __init__(self, headers: dict[str, str] | None, body) -> None:
         self.headers = headers
-        self.body = body
+        self._raw_body = body
+        self._body = self._UNRESOLVED
+
+    @property
+    def body(self):
+        """
+        消息体；通过外部存储传递的消息体在首次访问时才会被读取
+        """
+        if self._body is self._UNRESOLVED:
+            self._body = _resolve_body(self.headers, self._raw_body)
+        return self._body
+
+    @body.setter
+    def body(self, value) -> None:
+        if self.headers is not None:
+            self.headers.pop(blob.BODY_REF_HEADER, None)
+        self._raw_body = self._body = value
+
+    @property
+    def body_ref(self) -> str | None:
+        return None if self.headers is None else self.headers.get(blob.BODY_REF_HEADER)
 
     def json(self):
         return deserialize(self.body)
 
     @classmethod
-    def from_redis_response(self, data: str) -> 'Response':
-        return Response(**deserialize(data))
+    def from_redis_response(cls, data: str | bytes) -> 'Response':
+        return cls(**compress.inflate(decode(data)))
 
-    def serialize(self) -> str:
-        return serialize({"headers": self.headers, "body": self.body})
+    def serialize(self, codec: str = JSON) -> str | bytes:
+        return encode({"headers": self.headers, "body": self._raw_body}, codec)
 
     @property
     def request_id(self):
@@ -148,5 +188,13 @@ class Response:
     def exception_message(self):
         return self.headers.get("litter-exception-message", None)
 
+    @property
+    def stream_seq(self) -> int | None:
+        return self.headers.get("litter-stream-seq", None)
+
+    @property
+    def stream_end(self) -> bool:
+        return bool(self.headers.get("litter-stream-end", False))
+
     def __str__(self):
         return str(dict(headers=self.headers, body=self.body))
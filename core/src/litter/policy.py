@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from loguru import logger
+
+from litter import metrics
+from litter.model import CircuitOpenException
+
+__all__ = [
+    "Policy",
+    "LatencyWindow",
+    "CircuitBreaker",
+]
+
+
+@dataclass(frozen=True)
+class Policy:
+    """
+    客户端调用策略
+    :param hedge: 超过 hedge_percentile 分位的耗时仍没有响应时再发送一个相同的请求，只能用于幂等的方法
+    :param hedge_percentile: 发送第二个请求的耗时分位数
+    :param hedge_min_samples: 记录的耗时少于该数量时不发送第二个请求
+    :param breaker_threshold: 连续失败（超时或异常）达到该次数时熔断，熔断期间调用立即抛出 CircuitOpenException；None表示不熔断
+    :param probe_interval: 熔断后在后台探测恢复的间隔（秒）
+    :param probe: 用于探测的方法名，返回 (是否健康, 说明)
+    """
+    hedge: bool = False
+    hedge_percentile: float = 95.
+    hedge_min_samples: int = 20
+    breaker_threshold: int | None = None
+    probe_interval: float = 5.
+    probe: str = "health_check"
+
+
+class LatencyWindow:
+    """
+    最近 size 次成功调用的耗时
+    """
+
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = 1) -> float | None:
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return None
+            samples = sorted(self._samples)
+        return samples[min(int(len(samples) * p / 100), len(samples) - 1)]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """
+    连续失败 threshold 次后熔断，熔断期间在后台线程中每隔 probe_interval 秒调用 probe，probe 返回True时恢复
+    """
+
+    def __init__(self, name: str, threshold: int, probe: Callable[[], bool], probe_interval: float = 5.):
+        self.name = name
+        self.threshold = threshold
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self._failures = 0
+        self._open = False
+        self._lock = threading.Lock()
+
+    @property
+    def open(self) -> bool:
+        return self._open
+
+    def before_call(self) -> None:
+        if self._open:
+            raise CircuitOpenException(f"Circuit of {self.name} is open after {self.threshold} consecutive failures")
+
+    def record_success(self) -> None:
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._open or self._failures < self.threshold:
+                return
+            self._open = True
+        metrics.inc("litter_circuit_open_total", channel=self.name)
+        logger.warning(f"Circuit of {self.name} opened after {self.threshold} consecutive failures")
+        threading.Thread(target=self._probe_loop, name="LITTER_CIRCUIT_PROBE", daemon=True).start()
+
+    def _probe_loop(self) -> None:
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                ok = self.probe()
+            except Exception as e:
+                logger.debug(f"Probe of {self.name} failed: {e}")
+                continue
+            if ok:
+                break
+        with self._lock:
+            self._failures = 0
+            self._open = False
+        logger.info(f"Circuit of {self.name} closed")
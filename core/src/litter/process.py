@@ -0,0 +1,172 @@
+import concurrent.futures
+import functools
+import heapq
+import itertools
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Any
+
+from loguru import logger
+
+from litter import cancel
+from litter.agent import current_priority
+from litter.executor import PRIORITIES, HIGH, NORMAL
+
+__all__ = [
+    "ProcessPool",
+]
+
+# 同时在子进程中执行或排队的最大调用数，每个调用占用一个取消标记
+MAX_CALLS = 256
+# 子进程检查取消标记的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.1
+
+# 子进程中执行方法的对象，由 _init_worker 在进程启动时创建
+_worker_obj: Any = None
+# 与父进程共享的取消标记，下标为调用占用的槽位
+_cancel_flags = None
+
+
+def _init_worker(factory: Callable[[], Any], cancel_flags, redis_credentials: dict[str, Any] | None,
+                 app_name: str | None) -> None:
+    global _worker_obj, _cancel_flags
+    _cancel_flags = cancel_flags
+    if redis_credentials is not None:
+        # 子进程也连接litter的redis，使限流等共享状态在进程间生效
+        from litter import agent
+        agent.connect(redis_credentials=dict(redis_credentials), app_name=app_name)
+    _worker_obj = factory()
+
+
+def _ping() -> bool:
+    return _worker_obj is not None
+
+
+def _watch(slot: int, token: cancel.CancelToken, done: threading.Event) -> None:
+    while not done.wait(CANCEL_POLL_INTERVAL):
+        if _cancel_flags[slot]:
+            token.cancel()
+            return
+
+
+def _call(name: str, args: tuple, kwargs: dict[str, Any], slot: int, deadline: float | None):
+    token = cancel.CancelToken(deadline)
+    done = threading.Event()
+    threading.Thread(target=_watch, args=(slot, token, done), name="LITTER_PROCESS_CANCEL", daemon=True).start()
+    try:
+        with cancel.bind(token):
+            return getattr(_worker_obj, name)(*args, **kwargs)
+    finally:
+        done.set()
+
+
+class ProcessPool:
+    """
+    在子进程中执行 CPU 密集的方法，避免占用 GIL 阻塞其他请求。
+    每个子进程启动时调用 factory 创建自己的对象，方法的参数和返回值需要可以 pickle。
+    子进程中的方法可以通过 current_token() 得到与父进程同步的取消令牌。
+    没有空闲进程时调用按 current_priority() 排队，高优先级的先执行，相同优先级的按到达顺序执行
+    """
+
+    def __init__(self, factory: Callable[[], Any], max_workers: int = 2, *, warm: bool = True,
+                 redis_credentials: dict[str, Any] | None = None, app_name: str | None = None,
+                 reserved_workers: int = 0):
+        """
+        :param factory: 在子进程中创建对象的函数，需要可以 pickle，如 functools.partial(clazz, *args, **kwargs)
+        :param max_workers: 进程数
+        :param warm: 是否立即启动全部进程并完成初始化
+        :param redis_credentials: 设置时子进程启动后连接该redis，见 litter.connect
+        :param app_name: 子进程连接redis时使用的应用名
+        :param reserved_workers: 只执行高优先级调用的进程数，中、低优先级的调用最多同时占用 max_workers - reserved_workers 个
+        """
+        if not 0 <= reserved_workers < max_workers:
+            raise ValueError(f"reserved_workers must be in [0, {max_workers})")
+        self.max_workers = max_workers
+        self.reserved_workers = reserved_workers
+        self._cond = threading.Condition()
+        # 等待进程的调用，(优先级次序, 到达序号) 的堆
+        self._waiting: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._running = {p: 0 for p in PRIORITIES}
+        # 父进程中已经有redis等线程，fork可能死锁，使用spawn
+        ctx = multiprocessing.get_context("spawn")
+        self._cancel_flags = ctx.RawArray("b", MAX_CALLS)
+        self._slots: queue.Queue[int] = queue.Queue()
+        for slot in range(MAX_CALLS):
+            self._slots.put(slot)
+        self._executor = ProcessPoolExecutor(max_workers, mp_context=ctx, initializer=_init_worker,
+                                             initargs=(factory, self._cancel_flags, redis_credentials, app_name))
+        if warm:
+            for f in [self._executor.submit(_ping) for _ in range(max_workers)]:
+                f.result()
+            logger.info(f"{max_workers} worker processes started")
+
+    def _runnable(self, entry: tuple[int, int], priority: str) -> bool:
+        busy = sum(self._running.values())
+        if busy >= self.max_workers or self._waiting[0] != entry:
+            return False
+        return priority == HIGH or busy - self._running[HIGH] < self.max_workers - self.reserved_workers
+
+    def _acquire(self, priority: str, token: cancel.CancelToken) -> None:
+        """
+        等待轮到本次调用占用进程，等待期间被取消时抛出 RequestCancelledException
+        """
+        entry = (PRIORITIES.index(priority), next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while not self._runnable(entry, priority):
+                    token.raise_if_cancelled()
+                    self._cond.wait(CANCEL_POLL_INTERVAL)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._running[priority] += 1
+            self._cond.notify_all()
+
+    def _release(self, priority: str) -> None:
+        with self._cond:
+            self._running[priority] -= 1
+            self._cond.notify_all()
+
+    def proxy(self, name: str, method: Callable) -> Callable:
+        """
+        返回在子进程中执行 name 方法的函数，保留 method 的签名和 cache 声明。
+        请求被取消时通知子进程取消，放弃等待并抛出 RequestCancelledException
+        """
+
+        @functools.wraps(method)
+        def _inner(*args, **kwargs):
+            token = cancel.current_token()
+            priority = current_priority() or NORMAL
+            self._acquire(priority, token)
+            slot = self._slots.get()
+            self._cancel_flags[slot] = 0
+
+            def _done(_f):
+                # 子进程结束执行后槽位和进程才能给其他调用使用
+                self._slots.put(slot)
+                self._release(priority)
+
+            try:
+                future = self._executor.submit(_call, name, args, kwargs, slot, token.deadline)
+            except BaseException:
+                _done(None)
+                raise
+            future.add_done_callback(_done)
+            while not concurrent.futures.wait([future], timeout=CANCEL_POLL_INTERVAL).done:
+                if token.cancelled:
+                    self._cancel_flags[slot] = 1
+                    future.cancel()
+                    token.raise_if_cancelled()
+            return future.result()
+
+        return _inner
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,127 @@
+import functools
+import threading
+import time
+from typing import Callable
+
+import redis
+from loguru import logger
+
+from litter import cancel
+from litter.agent import get_redis
+from litter.model import RateLimitExceededException
+
+__all__ = [
+    "RateLimiter",
+    "rate_limit",
+]
+
+_KEY_PREFIX = "LRATE:"
+
+# GCRA：key 中保存理论到达时间（TAT，微秒），使用redis的时钟，不受各主机时钟偏差影响。
+# 调用方预约下一个时间点并返回需要等待的微秒数；需要等待的时间超过 max_wait 时不预约
+_GCRA = """
+local emission = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000000 + tonumber(t[2])
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then
+    tat = now
+end
+local wait = tat - tolerance - now
+if wait < 0 then
+    wait = 0
+end
+if max_wait >= 0 and wait > max_wait then
+    return {0, wait}
+end
+local new_tat = tat + emission
+redis.call('SET', KEYS[1], string.format('%d', new_tat), 'PX', math.floor((new_tat - now) / 1000) + 1)
+return {1, wait}
+"""
+
+_script = None
+
+
+class RateLimiter:
+    """
+    基于 GCRA 的限流器，状态保存在redis中，同名的限流器在所有线程、进程和主机间共享额度。
+    未连接redis时退化为进程内限流
+    """
+
+    def __init__(self, name: str, rate: float, per: float = 1., *, burst: int = 1,
+                 get_client: Callable[[], redis.Redis | None] = get_redis):
+        """
+        :param name: 限流的对象，如 pixiv、zodgame
+        :param rate: per 秒内允许的调用次数
+        :param per: 时间窗口（秒）
+        :param burst: 允许连续调用而不等待的次数
+        :param get_client: 返回redis连接的函数，未连接时返回None
+        """
+        assert rate > 0 and per > 0 and burst >= 1
+        self.name = name
+        self.emission = per / rate
+        self.burst = burst
+        self._get_client = get_client
+        self._lock = threading.Lock()
+        self._local_tat = 0.
+
+    def _reserve_local(self, max_wait: float | None) -> float | None:
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._local_tat, now)
+            wait = max(tat - self.emission * (self.burst - 1) - now, 0.)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._local_tat = tat + self.emission
+            return wait
+
+    def _reserve(self, max_wait: float | None) -> float | None:
+        global _script
+        if (client := self._get_client()) is None:
+            return self._reserve_local(max_wait)
+        if _script is None:
+            _script = client.register_script(_GCRA)
+        try:
+            ok, wait = _script(keys=[f"{_KEY_PREFIX}{self.name}"],
+                               args=[int(self.emission * 1e6), int(self.emission * (self.burst - 1) * 1e6),
+                                     -1 if max_wait is None else int(max_wait * 1e6)],
+                               client=client)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Rate limiter {self.name} falls back to local: {e}")
+            return self._reserve_local(max_wait)
+        return wait / 1e6 if ok else None
+
+    def acquire(self, max_wait: float | None = None) -> float:
+        """
+        获取一次调用的额度，需要时等待；等待期间请求被取消时抛出 RequestCancelledException
+        :param max_wait: 最长等待时间（秒），超过时立即抛出 RateLimitExceededException；None表示一直等待
+        :return: 等待的秒数
+        """
+        if (wait := self._reserve(max_wait)) is None:
+            raise RateLimitExceededException(f"Rate limit of {self.name} exceeded")
+        if wait > 0:
+            logger.debug(f"Rate limited by {self.name}, waiting {wait:.2f}s")
+            token = cancel.current_token()
+            if token.wait(wait):
+                token.raise_if_cancelled()
+        return wait
+
+    def __call__(self, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def _inner(*args, **kwargs):
+            self.acquire()
+            return func(*args, **kwargs)
+
+        return _inner
+
+
+def rate_limit(name: str, rate: float, per: float = 1., *, burst: int = 1) -> RateLimiter:
+    """
+    限流装饰器，同名的限流器共享额度，如：
+        @rate_limit("zodgame", 2, burst=4)
+        def _request(self, ...): ...
+    参数见 RateLimiter
+    """
+    return RateLimiter(name, rate, per, burst=burst)
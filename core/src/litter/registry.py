@@ -0,0 +1,181 @@
+import json
+import os
+import socket
+import threading
+import time
+from fnmatch import fnmatchcase
+from typing import Callable, Any
+
+from loguru import logger
+
+__all__ = [
+    "start",
+    "stop",
+    "agents",
+    "listening",
+    "aio_listening",
+]
+
+_AGENTS_KEY = "LAGENTS"
+_AGENT_PREFIX = "LAGENT:"
+# 客户端缓存存活agent的channel列表的时间（秒）
+LISTENING_REFRESH = 1.
+# 健康检查的间隔和超时（秒），健康检查在单独的线程中执行，不影响心跳
+HEALTH_INTERVAL = 30.
+HEALTH_TIMEOUT = 10.
+
+_lock = threading.Lock()
+# (实例id, 停止心跳的Event)
+_running: tuple[str, threading.Event] | None = None
+# (读取时间, 存活agent监听的全部channel)
+_channels: tuple[float, frozenset[str]] | None = None
+
+
+def _health(health_check: Callable[[], tuple[bool, str]] | None) -> dict[str, Any]:
+    if health_check is None:
+        return {"ok": True, "message": "OK"}
+    try:
+        ok, message = health_check()
+        return {"ok": bool(ok), "message": str(message)}
+    except Exception as e:
+        return {"ok": False, "message": f"{type(e).__name__}: {e}"}
+
+
+def _probe_health(health_check: Callable[[], tuple[bool, str]], state: dict[str, Any], stop: threading.Event,
+                  interval: float = HEALTH_INTERVAL, timeout: float = HEALTH_TIMEOUT) -> None:
+    """
+    每隔 interval 秒执行一次健康检查，结果写入 state["health"]；超过 timeout 秒没有返回视为不健康，
+    卡住的检查结束前不会启动新的检查
+    """
+    while not stop.is_set():
+        result, done = {}, threading.Event()
+
+        def _run():
+            result.update(_health(health_check))
+            done.set()
+
+        threading.Thread(target=_run, name="LITTER_HEALTH_CHECK", daemon=True).start()
+        if done.wait(timeout):
+            state["health"] = result
+        else:
+            state["health"] = {"ok": False, "message": f"Health check timed out after {timeout:g}s"}
+            while not done.wait(1.) and not stop.is_set():
+                pass
+        stop.wait(interval)
+
+
+def _heartbeat(get_client: Callable, instance: str, collect: Callable[[], dict[str, Any]],
+               state: dict[str, Any], ttl: float, stop: threading.Event) -> None:
+    started = time.time()
+    while not stop.is_set():
+        if (client := get_client()) is None:
+            stop.wait(0.5)
+            continue
+        try:
+            now = time.time()
+            info = {"instance": instance, "host": socket.gethostname(), "pid": os.getpid(), "started": started,
+                    "heartbeat": now, **collect(), "health": state["health"]}
+            with client.pipeline(transaction=False) as pipe:
+                pipe.set(f"{_AGENT_PREFIX}{instance}", json.dumps(info, ensure_ascii=False), ex=int(ttl))
+                pipe.zadd(_AGENTS_KEY, {instance: now + ttl})
+                pipe.zremrangebyscore(_AGENTS_KEY, 0, now)
+                pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to send heartbeat of {instance}: {e}")
+        stop.wait(ttl / 3)
+
+
+def start(get_client: Callable, app_name: str, collect: Callable[[], dict[str, Any]], *,
+          health_check: Callable[[], tuple[bool, str]] | None = None, ttl: float = 15.) -> str:
+    """
+    在后台线程中定期将本进程的agent信息写入redis，超过 ttl 秒没有更新的agent视为已退出
+    :param get_client: 返回同步redis连接的函数，未连接时返回None
+    :param collect: 返回agent信息的函数，如监听的channel和执行器负载；其中 channels 用于判断channel是否有agent监听
+    :param health_check: 返回 (是否健康, 说明) 的函数，如 ApiBase.health_check；
+        每 HEALTH_INTERVAL 秒在单独的线程中执行，随心跳写入最近一次的结果
+    :return: 实例id
+    """
+    global _running
+    instance = f"{app_name}@{socket.gethostname()}:{os.getpid()}"
+    with _lock:
+        if _running is not None:
+            return _running[0]
+        _running = (instance, threading.Event())
+    stop = _running[1]
+    state = {"health": _health(None) if health_check is None else {"ok": True, "message": "Health check pending"}}
+    if health_check is not None:
+        threading.Thread(target=_probe_health, args=(health_check, state, stop),
+                         name="LITTER_REGISTRY_HEALTH", daemon=True).start()
+    threading.Thread(target=_heartbeat, args=(get_client, instance, collect, state, ttl, stop),
+                     name="LITTER_REGISTRY_HEARTBEAT", daemon=True).start()
+    return instance
+
+
+def stop(client) -> None:
+    """
+    停止心跳并立即注销本进程的agent
+    """
+    global _running
+    with _lock:
+        running, _running = _running, None
+    if running is None:
+        return
+    instance, event = running
+    event.set()
+    try:
+        with client.pipeline(transaction=False) as pipe:
+            pipe.delete(f"{_AGENT_PREFIX}{instance}")
+            pipe.zrem(_AGENTS_KEY, instance)
+            pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to unregister {instance}: {e}")
+
+
+def _agent_keys(instances: list) -> list[str]:
+    return [_AGENT_PREFIX + (i.decode("utf8") if isinstance(i, bytes) else i) for i in instances]
+
+
+def _decode(values: list) -> list[dict[str, Any]]:
+    return [json.loads(v) for v in values if v is not None]
+
+
+def agents(client) -> list[dict[str, Any]]:
+    """
+    全部存活的agent信息
+    """
+    instances = client.zrangebyscore(_AGENTS_KEY, time.time(), "+inf")
+    if not instances:
+        return []
+    return _decode(client.mget(_agent_keys(instances)))
+
+
+def _listening(channel: str) -> bool | None:
+    if _channels is None or time.monotonic() - _channels[0] >= LISTENING_REFRESH:
+        return None
+    return channel in _channels[1] or any(fnmatchcase(channel, c) for c in _channels[1])
+
+
+def _update(infos: list[dict[str, Any]]) -> None:
+    global _channels
+    _channels = (time.monotonic(), frozenset(c for info in infos for c in info.get("channels", ())))
+
+
+def listening(client, channel: str) -> bool:
+    """
+    是否有存活的agent监听 channel（包括通配符），结果缓存 LISTENING_REFRESH 秒
+    """
+    if (ret := _listening(channel)) is None:
+        _update(agents(client))
+        ret = _listening(channel)
+    return ret
+
+
+async def aio_listening(client, channel: str) -> bool:
+    """
+    asyncio版本的 listening，client 为 redis.asyncio 连接
+    """
+    if (ret := _listening(channel)) is None:
+        instances = await client.zrangebyscore(_AGENTS_KEY, time.time(), "+inf")
+        _update(_decode(await client.mget(_agent_keys(instances))) if instances else [])
+        ret = _listening(channel)
+    return ret
@@ -0,0 +1,174 @@
+import base64
+import json
+import random
+import socket
+import time
+import traceback
+import uuid
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Any, Callable
+
+import redis
+
+from litter import stream
+from litter.model import Message
+
+__all__ = [
+    "RetryPolicy",
+    "configure",
+    "policy",
+    "dead_letter",
+    "dead_letters",
+    "replay",
+    "purge",
+]
+
+DEAD_LETTER_KEY = "LDLQ"
+# 死信列表的最大长度，超出时丢弃最旧的
+DEAD_LETTER_MAX_LEN = 10000
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    不需要响应的消息（publish）处理失败时的重试策略，第 n 次重试前等待 min(backoff * multiplier ** (n - 1), max_backoff) 秒
+    :param max_attempts: 最多执行的次数（包括第一次）
+    :param backoff: 第一次重试前等待的秒数
+    :param multiplier: 每次重试等待时间的倍数
+    :param max_backoff: 等待时间的上限（秒）
+    :param jitter: 等待时间随机浮动的比例，避免多个失败的消息同时重试
+    :param dead_letter: 全部失败后是否将原始消息和错误写入redis死信列表，可以用 litter dlq 命令查看和重放
+    """
+    max_attempts: int = 3
+    backoff: float = 1.
+    multiplier: float = 2.
+    max_backoff: float = 60.
+    jitter: float = 0.1
+    dead_letter: bool = True
+
+    def delay(self, attempt: int) -> float:
+        """
+        第 attempt 次执行失败后，下一次执行前等待的秒数
+        """
+        delay = min(self.backoff * self.multiplier ** (attempt - 1), self.max_backoff)
+        return max(delay * (1 + random.uniform(-self.jitter, self.jitter)), 0.)
+
+
+# channel（支持通配符）-> RetryPolicy，None表示该channel不重试
+_rules: dict[str, RetryPolicy | None] = {}
+_resolved: dict[str, RetryPolicy | None] = {}
+
+
+def configure(rules: dict[str, RetryPolicy | dict[str, Any] | None] | None) -> None:
+    """
+    设置各channel的重试策略，替换之前的设置
+    :param rules: channel（支持通配符，"*" 匹配全部）-> RetryPolicy 或其参数，None表示不重试；先精确匹配，再按顺序匹配通配符
+    """
+    parsed = {}
+    for channel, rule in (rules or {}).items():
+        if rule is not None and not isinstance(rule, RetryPolicy):
+            rule = RetryPolicy(**rule)
+        if rule is not None and rule.max_attempts < 1:
+            raise ValueError(f"max_attempts of {channel} must be at least 1")
+        parsed[channel] = rule
+    global _rules, _resolved
+    _rules, _resolved = parsed, {}
+
+
+def policy(channel: str) -> RetryPolicy | None:
+    """
+    channel 的重试策略，没有配置时返回None
+    """
+    if channel not in _resolved:
+        if channel in _rules:
+            rule = _rules[channel]
+        else:
+            rule = next((r for pat, r in _rules.items() if fnmatchcase(channel, pat)), None)
+        _resolved[channel] = rule
+    return _resolved[channel]
+
+
+def _handler_name(handler: Callable) -> str:
+    return f"{getattr(handler, '__module__', '?')}.{getattr(handler, '__qualname__', repr(handler))}"
+
+
+def dead_letter(client: redis.Redis, message: Message, handler: Callable, error: BaseException, *,
+                attempts: int, app: str, transport: str = stream.PUBSUB) -> str:
+    """
+    将处理失败的消息写入死信列表，保留原始的信封以便重放
+    :return: 死信id
+    """
+    data = message.data if isinstance(message.data, bytes) else str(message.data).encode("utf8")
+    entry = {
+        "id": uuid.uuid4().hex,
+        "channel": message.channel,
+        "pattern": message.pattern,
+        "transport": transport,
+        "handler": _handler_name(handler),
+        "app": app,
+        "host": socket.gethostname(),
+        "time": time.time(),
+        "attempts": attempts,
+        "error": f"{type(error).__module__}.{type(error).__qualname__}: {error}",
+        "traceback": "".join(traceback.format_exception(error)),
+        "data": base64.b64encode(data).decode("ascii"),
+    }
+    with client.pipeline(transaction=False) as pipe:
+        pipe.lpush(DEAD_LETTER_KEY, json.dumps(entry, ensure_ascii=False))
+        pipe.ltrim(DEAD_LETTER_KEY, 0, DEAD_LETTER_MAX_LEN - 1)
+        pipe.execute()
+    return entry["id"]
+
+
+def _load(client: redis.Redis, channel: str | None, ids: set[str] | None) -> list[tuple[bytes, dict[str, Any]]]:
+    ret = []
+    for raw in client.lrange(DEAD_LETTER_KEY, 0, -1):
+        entry = json.loads(raw)
+        if channel is not None and not fnmatchcase(entry["channel"], channel):
+            continue
+        if ids is not None and entry["id"] not in ids:
+            continue
+        ret.append((raw, entry))
+    return ret
+
+
+def dead_letters(client: redis.Redis, channel: str | None = None) -> list[dict[str, Any]]:
+    """
+    死信列表，最新的在前；data 为base64编码的原始信封
+    :param channel: 只返回匹配该channel（支持通配符）的死信
+    """
+    return [entry for _, entry in _load(client, channel, None)]
+
+
+def replay(client: redis.Redis, channel: str | None = None, ids: set[str] | None = None) -> int:
+    """
+    将死信的原始信封按原来的传输方式重新发送到原channel，发送成功后从死信列表删除。
+    pubsub 模式下该channel的所有处理函数都会再次收到消息
+    :param channel: 只重放匹配该channel（支持通配符）的死信
+    :param ids: 只重放这些id的死信
+    :return: 重放的数量
+    """
+    count = 0
+    # 从最旧的开始，保持原来的顺序
+    for raw, entry in reversed(_load(client, channel, ids)):
+        data = base64.b64decode(entry["data"])
+        if entry.get("transport") == stream.STREAM:
+            stream.xadd(client, entry["channel"], data)
+        else:
+            client.publish(entry["channel"], data)
+        client.lrem(DEAD_LETTER_KEY, 1, raw)
+        count += 1
+    return count
+
+
+def purge(client: redis.Redis, channel: str | None = None, ids: set[str] | None = None) -> int:
+    """
+    删除死信，参数见 replay
+    :return: 删除的数量
+    """
+    if channel is None and ids is None:
+        count = client.llen(DEAD_LETTER_KEY)
+        client.delete(DEAD_LETTER_KEY)
+        return count
+    return sum(client.lrem(DEAD_LETTER_KEY, 1, raw) for raw, _ in _load(client, channel, ids))
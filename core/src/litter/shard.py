@@ -0,0 +1,164 @@
+import bisect
+import hashlib
+import threading
+import time
+from typing import Callable, Iterable, Any
+
+from loguru import logger
+
+__all__ = [
+    "HashRing",
+    "replica_channel",
+    "join",
+    "leave",
+    "replicas",
+    "route",
+    "aio_route",
+]
+
+REPLICA_SEP = "@"
+_MEMBERS_PREFIX = "LSHARD:"
+# 客户端缓存副本列表的时间（秒），副本加入或退出后最多经过这么久重新分配
+RING_REFRESH = 1.
+
+_lock = threading.Lock()
+# app_name -> (replica_id, 停止心跳的Event)
+_joined: dict[str, tuple[str, threading.Event]] = {}
+# app_name -> (读取时间, HashRing)
+_rings: dict[str, tuple[float, "HashRing"]] = {}
+
+
+def _hash(s: str) -> int:
+    return int.from_bytes(hashlib.md5(s.encode("utf8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    一致性哈希环，每个副本放置 vnodes 个虚拟节点；副本加入或退出时只有相邻区间的key被重新分配
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 64):
+        self.nodes = tuple(sorted(set(nodes)))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def get(self, key: Any) -> str | None:
+        if not self._nodes:
+            return None
+        i = bisect.bisect(self._hashes, _hash(str(key)))
+        return self._nodes[i % len(self._nodes)]
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+def replica_channel(channel: str, replica_id: str) -> str:
+    """
+    副本专属的channel，如 mmt.agent.pixiv:illust@r1
+    """
+    return f"{channel}{REPLICA_SEP}{replica_id}"
+
+
+def _members_key(app_name: str) -> str:
+    return f"{_MEMBERS_PREFIX}{app_name}"
+
+
+def _heartbeat(get_client: Callable, app_name: str, replica_id: str, ttl: float, stop: threading.Event) -> None:
+    key = _members_key(app_name)
+    while not stop.is_set():
+        if (client := get_client()) is None:
+            # 尚未连接
+            stop.wait(0.5)
+            continue
+        try:
+            now = time.time()
+            with client.pipeline(transaction=False) as pipe:
+                pipe.zadd(key, {replica_id: now + ttl})
+                pipe.zremrangebyscore(key, 0, now)
+                pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to send shard heartbeat of {app_name}@{replica_id}: {e}")
+        stop.wait(ttl / 3)
+
+
+def join(get_client: Callable, app_name: str, replica_id: str, *, ttl: float = 15.) -> None:
+    """
+    将副本加入 app_name 的哈希环，在后台线程中定期续期；超过 ttl 秒没有续期的副本会被客户端忽略
+    :param get_client: 返回同步redis连接的函数，未连接时返回None
+    """
+    stop = threading.Event()
+    with _lock:
+        if app_name in _joined:
+            raise RuntimeError(f"{app_name} had already joined as replica {_joined[app_name][0]}")
+        _joined[app_name] = (replica_id, stop)
+    threading.Thread(target=_heartbeat, args=(get_client, app_name, replica_id, ttl, stop),
+                     name="LITTER_SHARD_HEARTBEAT", daemon=True).start()
+    logger.info(f"Joined {app_name} as replica {replica_id}")
+
+
+def leave(client) -> None:
+    """
+    停止心跳并立即从哈希环中移除本进程的副本，使请求尽快分配到其他副本
+    """
+    with _lock:
+        joined = list(_joined.items())
+        _joined.clear()
+    for app_name, (replica_id, stop) in joined:
+        stop.set()
+        try:
+            client.zrem(_members_key(app_name), replica_id)
+        except Exception as e:
+            logger.warning(f"Failed to leave {app_name} as replica {replica_id}: {e}")
+
+
+def _decode_members(members: list) -> list[str]:
+    return [m.decode("utf8") if isinstance(m, bytes) else m for m in members]
+
+
+def replicas(client, app_name: str) -> list[str]:
+    """
+    当前存活的副本
+    """
+    return _decode_members(client.zrangebyscore(_members_key(app_name), time.time(), "+inf"))
+
+
+def _cached_ring(app_name: str) -> HashRing | None:
+    cached = _rings.get(app_name)
+    if cached is not None and time.monotonic() - cached[0] < RING_REFRESH:
+        return cached[1]
+    return None
+
+
+def _update_ring(app_name: str, members: list[str]) -> HashRing:
+    cached = _rings.get(app_name)
+    ring = cached[1] if cached is not None and cached[1].nodes == tuple(sorted(set(members))) else HashRing(members)
+    if cached is not None and ring is not cached[1]:
+        logger.info(f"Replicas of {app_name} changed: {list(cached[1].nodes)} -> {list(ring.nodes)}")
+    _rings[app_name] = (time.monotonic(), ring)
+    return ring
+
+
+def _route(ring: HashRing, channel: str, key: Any) -> str:
+    if key is None or (replica_id := ring.get(key)) is None:
+        return channel
+    return replica_channel(channel, replica_id)
+
+
+def route(client, app_name: str, channel: str, key: Any) -> str:
+    """
+    按 key 选择副本，返回副本专属的channel；没有存活的副本或 key 为None时返回原channel
+    """
+    if (ring := _cached_ring(app_name)) is None:
+        ring = _update_ring(app_name, replicas(client, app_name))
+    return _route(ring, channel, key)
+
+
+async def aio_route(client, app_name: str, channel: str, key: Any) -> str:
+    """
+    asyncio版本的 route，client 为 redis.asyncio 连接
+    """
+    if (ring := _cached_ring(app_name)) is None:
+        members = await client.zrangebyscore(_members_key(app_name), time.time(), "+inf")
+        ring = _update_ring(app_name, _decode_members(members))
+    return _route(ring, channel, key)
@@ -0,0 +1,197 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+import redis
+from loguru import logger
+
+from litter.model import Message
+
+__all__ = [
+    "PUBSUB",
+    "STREAM",
+    "stream_key",
+    "xadd",
+    "listen_stream",
+]
+
+PUBSUB = "pubsub"
+STREAM = "stream"
+
+_STREAM_PREFIX = "LST:"  # lt stream
+_STREAM_MAXLEN = 10000
+
+
+def stream_key(channel: str) -> str:
+    return f"{_STREAM_PREFIX}{channel}"
+
+
+def xadd(client: redis.Redis, channel: str, data: str | bytes) -> str:
+    return client.xadd(stream_key(channel), {"data": data}, maxlen=_STREAM_MAXLEN, approximate=True)
+
+
+class _Inflight:
+    """
+    记录本消费者正在处理的条目，用于限制拉取数量以及刷新条目的空闲时间
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: dict[str, set[bytes]] = {}
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return sum(len(x) for x in self.entries.values())
+
+    def add(self, key: str, entry_id: bytes):
+        with self.cond:
+            self.entries.setdefault(key, set()).add(entry_id)
+
+    def remove(self, key: str, entry_id: bytes):
+        with self.cond:
+            self.entries.get(key, set()).discard(entry_id)
+            self.cond.notify_all()
+
+    def wait_free(self, timeout: float) -> int:
+        with self.cond:
+            self.cond.wait_for(lambda: len(self) < self.capacity, timeout=timeout)
+            return max(self.capacity - len(self), 0)
+
+    def snapshot(self) -> dict[str, list[bytes]]:
+        with self.cond:
+            return {k: list(v) for k, v in self.entries.items() if v}
+
+
+def _ensure_group(client: redis.Redis, key: str, group: str):
+    try:
+        client.xgroup_create(key, group, id="0", mkstream=True)
+    except redis.exceptions.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def listen_stream(client: redis.Redis, register_map: dict[str, list[Callable]],
+                  submit: Callable[[Callable, Message], Future], *,
+                  group: str, consumer: str | None = None, capacity: int = 4,
+                  claim_idle: float = 60., claim_interval: float = 10.,
+                  running: Callable[[], bool] = lambda: True):
+    """
+    基于 Redis Streams 消费者组的监听循环，同一组内每条请求只会被一个消费者执行。
+    处理完成后才 XACK，消费者崩溃后其未确认的条目在空闲 claim_idle 秒后会被组内其他消费者接管
+    :param client: redis客户端
+    :param register_map: channel -> handlers，不支持通配符；监听期间增删的channel会在下一轮读取时生效
+    :param submit: 提交处理函数，返回的Future完成后确认条目
+    :param group: 消费者组名
+    :param consumer: 消费者名，缺省为 hostname:pid
+    :param capacity: 同时处理的最大条目数
+    :param claim_idle: 条目空闲超过该时间（秒）时视为其消费者已崩溃
+    :param claim_interval: 检查待接管条目的间隔（秒）
+    :param running: 返回False时退出循环
+    """
+    consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+    # stream key -> channel
+    channels: dict[str, str] = {}
+    registered: set[str] = set()
+
+    def _refresh():
+        nonlocal registered
+        current = set(register_map)
+        if current == registered:
+            return
+        for channel in current - registered:
+            if any(c in channel for c in "*?["):
+                logger.warning(f"Stream transport does not support pattern {channel}, ignored")
+                continue
+            _ensure_group(client, stream_key(channel), group)
+            channels[stream_key(channel)] = channel
+        for channel in registered - current:
+            channels.pop(stream_key(channel), None)
+        registered = current
+
+    _refresh()
+    inflight = _Inflight(capacity)
+    last_claim = 0.
+
+    def _dispatch(key: str, entry_id: bytes, fields: dict):
+        channel = key[len(_STREAM_PREFIX):]
+        message = Message(fields[b"data"], channel=channel)
+        funcs = register_map.get(channel, [])
+        if not funcs:
+            client.xack(key, group, entry_id)
+            return
+        inflight.add(key, entry_id)
+        remaining = [len(funcs)]
+        lock = threading.Lock()
+
+        def _ack(_f: Future):
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if not done:
+                return
+            try:
+                client.xack(key, group, entry_id)
+            except redis.exceptions.RedisError as e:
+                # 未确认的条目空闲 claim_idle 秒后会被重新执行
+                logger.error(f"Error while acking entry {entry_id} of {channel}: {e}")
+            finally:
+                inflight.remove(key, entry_id)
+
+        for func in funcs:
+            try:
+                future = submit(func, message)
+            except Exception as e:
+                # 无法解码的条目同样确认后丢弃，不能结束监听
+                logger.exception(f"Failed to dispatch entry {entry_id} of {channel}")
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(_ack)
+
+    def _claim():
+        # 先刷新自己正在处理的条目，避免长耗时请求被误判为崩溃
+        for key, ids in inflight.snapshot().items():
+            client.xclaim(key, group, consumer, min_idle_time=0, message_ids=ids, justid=True)
+        for key in list(channels):
+            free = inflight.wait_free(0)
+            if free <= 0:
+                return
+            _, entries, *_ = client.xautoclaim(key, group, consumer, min_idle_time=int(claim_idle * 1000),
+                                               start_id="0-0", count=free)
+            for entry_id, fields in entries:
+                if fields:
+                    logger.info(f"Reclaimed pending entry {entry_id} of {key[len(_STREAM_PREFIX):]}")
+                    _dispatch(key, entry_id, fields)
+
+    def _poll():
+        nonlocal last_claim
+        _refresh()
+        if not channels:
+            time.sleep(0.5)
+            return
+        if time.time() - last_claim > claim_interval:
+            last_claim = time.time()
+            _claim()
+
+        free = inflight.wait_free(0.5)
+        if free <= 0:
+            return
+        result = client.xreadgroup(group, consumer, {key: ">" for key in channels}, count=free, block=500)
+        for key, entries in result or []:
+            key = key.decode("utf8") if isinstance(key, bytes) else key
+            for entry_id, fields in entries:
+                _dispatch(key, entry_id, fields)
+
+    logger.info(f"Consumer {consumer} of group {group} listening streams: {list(channels.values())}")
+    while running():
+        try:
+            _poll()
+        except redis.exceptions.TimeoutError:
+            continue
+        except (redis.exceptions.RedisError, OSError) as e:
+            if not running():
+                break
+            logger.error(f"Error while reading streams: {e}")
+            time.sleep(1)
@@ -0,0 +1,191 @@
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+__all__ = [
+    "SpanExporter",
+    "JsonlExporter",
+    "OtlpHttpExporter",
+    "configure",
+    "current_trace",
+]
+
+TRACE_ID_HEADER = "litter-trace-id"
+SPAN_ID_HEADER = "litter-span-id"
+
+# (trace_id, span_id)：当前正在执行的span，处理函数中发起的嵌套请求以它为父span
+_current: ContextVar[tuple[str, str] | None] = ContextVar("litter_trace", default=None)
+_exporter: "SpanExporter | None" = None
+_queue: queue.Queue[dict[str, Any]] = queue.Queue(maxsize=10000)
+_flush_thread: threading.Thread | None = None
+
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, spans: list[dict[str, Any]]) -> None:
+        """
+        在后台线程中批量导出已结束的span，抛出的异常只记录日志，这批span被丢弃
+        """
+
+
+class JsonlExporter(SpanExporter):
+    """
+    每个span一行JSON写入文件
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, spans: list[dict[str, Any]]) -> None:
+        with self.path.open("a", encoding="utf8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+
+class OtlpHttpExporter(SpanExporter):
+    """
+    以 OTLP/HTTP JSON 格式发送到 collector，如 http://127.0.0.1:4318
+    """
+
+    def __init__(self, endpoint: str, timeout: float = 5.):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    @staticmethod
+    def _attributes(attributes: dict[str, Any]) -> list[dict[str, Any]]:
+        return [{"key": k, "value": {"stringValue": str(v)}} for k, v in attributes.items() if v is not None]
+
+    def export(self, spans: list[dict[str, Any]]) -> None:
+        by_app: dict[str, list[dict[str, Any]]] = {}
+        for span in spans:
+            by_app.setdefault(span["app"], []).append({
+                "traceId": span["trace_id"],
+                "spanId": span["span_id"],
+                "parentSpanId": span["parent_id"] or "",
+                "name": span["name"],
+                "kind": 3 if span["name"] == "request" else 2 if span["name"] == "handle" else 1,
+                "startTimeUnixNano": str(int(span["start"] * 1e9)),
+                "endTimeUnixNano": str(int(span["end"] * 1e9)),
+                "attributes": self._attributes({"litter.channel": span["channel"], **span["attributes"]}),
+                "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+            })
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": self._attributes({"service.name": app})},
+            "scopeSpans": [{"scope": {"name": "litter"}, "spans": items}],
+        } for app, items in by_app.items()]}
+        req = urllib.request.Request(self.url, data=json.dumps(payload).encode("utf8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+        urllib.request.urlopen(req, timeout=self.timeout).close()
+
+
+def _flush_loop():
+    while True:
+        spans = [_queue.get()]
+        while len(spans) < 512:
+            try:
+                spans.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        if (exporter := _exporter) is None:
+            continue
+        try:
+            exporter.export(spans)
+        except Exception as e:
+            logger.warning(f"Failed to export {len(spans)} spans: {e}")
+        time.sleep(0.2)
+
+
+def configure(exporter: SpanExporter | dict[str, Any] | None) -> None:
+    """
+    设置span的导出方式，None表示不记录span（trace id 仍会在请求间传递）
+    :param exporter: SpanExporter；或配置 {"exporter": "jsonl", "path": ...} / {"exporter": "otlp", "endpoint": ...}
+    """
+    global _exporter, _flush_thread
+    if isinstance(exporter, dict):
+        exporter = {
+            "jsonl": lambda c: JsonlExporter(c["path"]),
+            "otlp": lambda c: OtlpHttpExporter(c.get("endpoint", "http://127.0.0.1:4318")),
+        }[exporter.get("exporter", "jsonl")](exporter)
+    _exporter = exporter
+    if exporter is not None and _flush_thread is None:
+        _flush_thread = threading.Thread(target=_flush_loop, name="LITTER_TRACE_EXPORTER", daemon=True)
+        _flush_thread.start()
+
+
+def new_id(n: int = 8) -> str:
+    return os.urandom(n).hex()
+
+
+def current_trace() -> tuple[str, str] | None:
+    """
+    当前的 (trace_id, span_id)，不在litter请求处理中时返回None
+    """
+    return _current.get()
+
+
+def inject(headers: dict[str, Any]) -> None:
+    """
+    为新请求生成span id并写入请求头，trace id 沿用当前上下文
+    """
+    ctx = _current.get()
+    if TRACE_ID_HEADER not in headers:
+        headers[TRACE_ID_HEADER] = ctx[0] if ctx is not None else new_id(16)
+    headers[SPAN_ID_HEADER] = new_id()
+
+
+@contextmanager
+def bind(trace_id: str | None, span_id: str | None):
+    reset = _current.set((trace_id, span_id) if trace_id is not None else None)
+    try:
+        yield
+    finally:
+        _current.reset(reset)
+
+
+def record(name: str, headers: dict[str, Any], start: float, end: float, *, channel: str, app: str,
+           span_id: str | None = None, parent_id: str | None = None, error: str | None = None, **attributes) -> None:
+    """
+    记录一个span，未设置导出方式或请求头中没有trace id时忽略
+    :param headers: 请求头，提供 trace id
+    :param span_id: 缺省时生成新的id
+    :param parent_id: 缺省时为请求头中的 span id
+    """
+    if _exporter is None or (trace_id := headers.get(TRACE_ID_HEADER)) is None:
+        return
+    try:
+        _queue.put_nowait({
+            "trace_id": trace_id,
+            "span_id": span_id or new_id(),
+            "parent_id": (parent_id if parent_id is not None else headers.get(SPAN_ID_HEADER)) or None,
+            "name": name,
+            "channel": channel,
+            "app": app,
+            "start": start,
+            "end": end,
+            "duration_ms": round((end - start) * 1000, 3),
+            "error": error,
+            "attributes": attributes,
+        })
+    except queue.Full:
+        pass
+
+
+def record_request(headers: dict[str, Any], start: float, end: float, *, channel: str, app: str,
+                   error: str | None = None) -> None:
+    """
+    记录客户端的请求span，其id为请求头中的 span id，父span为当前上下文的span
+    """
+    ctx = _current.get()
+    record("request", headers, start, end, channel=channel, app=app, span_id=headers.get(SPAN_ID_HEADER),
+           parent_id=ctx[1] if ctx is not None else "", error=error)
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from litter.adapt import _adapt_method
+from litter.model import NoSubscriberException, RemoteFunctionRaisedException, RequestTimeoutException
+
+framework = pytest.importorskip("mmt.api.framework")
+
+
+@framework.api("test_framework", div={"timeout": 1})
+class Calc(framework.ApiBase):
+    def div(self, a: int, b: int = 1) -> float:
+        ...
+
+    def missing(self) -> None:
+        ...
+
+
+class CalcImpl:
+    def div(self, a: int, b: int = 1) -> float:
+        if b == 0:
+            raise ZeroDivisionError("division by zero")
+        # 被除数越小越晚返回，a == 0 时超时
+        time.sleep(2 if a == 0 else 0.3 / a)
+        return a / b
+
+
+@pytest.fixture(scope="module")
+def calc(litter_agent):
+    litter_agent.subscribe("test_framework:div", _adapt_method("test_framework", "div", CalcImpl().div))
+    time.sleep(0.1)
+    yield Calc.api()
+    litter_agent.unsubscribe("test_framework:div")
+
+
+def test_batch_keeps_call_order(calc):
+    assert calc.batch("div", [(1,), {"a": 6, "b": 3}, ((9,), {"b": 3})]) == [1., 2., 3.]
+
+
+def test_batch_partial_failures(calc):
+    results = calc.batch("div", [(4, 2), (1, 0), (0,), (8,)], concurrency=2)
+    assert results[0] == 2. and results[3] == 8.
+    assert isinstance(results[1], RemoteFunctionRaisedException)
+    assert results[1].resp.exception_type.endswith("ZeroDivisionError")
+    # 单次调用的超时使用 @api 中该方法的设置
+    assert isinstance(results[2], RequestTimeoutException)
+
+
+def test_iter_batch_in_completion_order(calc):
+    order = [index for index, _ in calc.iter_batch("div", [(1,), (3,), (30,)])]
+    assert order == [2, 1, 0]
+
+
+def test_batch_without_subscriber(calc):
+    results = calc.batch("missing", [(), ()])
+    assert all(isinstance(r, NoSubscriberException) for r in results)
@@ -0,0 +1,126 @@
+"""
+litter 的性能基准，需要 pytest-benchmark：
+
+    python -m pytest tests/benchmarks --benchmark-only
+
+不加 --benchmark-only 时跳过。端到端的请求默认使用 fakeredis，设置 LITTER_BENCH_REDIS=host:port 时使用真实的 redis-server
+"""
+import importlib.util
+import os
+import random
+import string
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from litter.codec import tz
+
+
+def pytest_collection_modifyitems(config, items):
+    if importlib.util.find_spec("pytest_benchmark") is None:
+        skip = pytest.mark.skip(reason="pytest-benchmark is not installed")
+    elif not config.getoption("benchmark_only", False):
+        skip = pytest.mark.skip(reason="benchmarks only run with --benchmark-only")
+    else:
+        return
+    here = Path(__file__).parent
+    for item in items:
+        if here in item.path.parents:
+            item.add_marker(skip)
+
+
+_random = random.Random(20250823)
+
+
+def _text(n: int) -> str:
+    return "".join(_random.choices(string.ascii_letters + "的一是在不了有和人这中大为上个国", k=n))
+
+
+@pytest.fixture(scope="session")
+def bookmark_page() -> dict:
+    """
+    一页较大的 pixiv 收藏：大量普通字符串，没有特殊类型
+    """
+    works = [{
+        "id": str(100000000 + i),
+        "title": _text(20),
+        "illustType": i % 3,
+        "url": f"https://i.pximg.net/c/250x250_80_a2/img-master/img/2025/08/23/12/34/56/{100000000 + i}_p0.jpg",
+        "tags": [_text(6) for _ in range(10)],
+        "userId": str(_random.randint(1, 10 ** 8)),
+        "userName": _text(8),
+        "width": 1200,
+        "height": 1800,
+        "pageCount": _random.randint(1, 30),
+        "isBookmarkable": True,
+        "bookmarkData": {"id": str(_random.randint(1, 10 ** 10)), "private": False},
+        "createDate": "2025-08-23T12:34:56+09:00",
+        "updateDate": "2025-08-23T12:34:56+09:00",
+    } for i in range(1000)]
+    return {"works": works, "total": 12345, "bookmarkTags": {}}
+
+
+@pytest.fixture(scope="session")
+def large_bytes() -> dict:
+    return {"data": os.urandom(5 * 1024 * 1024)}
+
+
+@pytest.fixture(scope="session")
+def thread_dump() -> dict:
+    """
+    zodgame 帖子：大量 datetime
+    """
+    base = datetime(2025, 8, 23, 12, 34, 56, tzinfo=tz)
+    return {
+        "tid": "123456",
+        "title": _text(30),
+        "posts": [{
+            "pid": str(i),
+            "author": _text(8),
+            "post_time": base + timedelta(minutes=i),
+            "edit_time": base + timedelta(minutes=i, seconds=30),
+            "content": _text(200),
+            "rates": [{"user": _text(6), "time": base + timedelta(hours=j), "score": j} for j in range(5)],
+        } for i in range(500)],
+    }
+
+
+PAYLOADS = ["bookmark_page", "large_bytes", "thread_dump"]
+
+
+@pytest.fixture(params=PAYLOADS)
+def payload(request):
+    return request.getfixturevalue(request.param)
+
+
+@pytest.fixture(scope="session")
+def redis_client():
+    """
+    设置环境变量 LITTER_BENCH_REDIS=host:port 时使用真实的 redis-server，否则使用 fakeredis
+    """
+    if (addr := os.environ.get("LITTER_BENCH_REDIS")) is not None:
+        import redis
+        host, _, port = addr.partition(":")
+        client = redis.StrictRedis(host=host, port=int(port or 6379), decode_responses=False)
+        client.ping()
+        return client
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeStrictRedis(server=fakeredis.FakeServer(), decode_responses=False)
+
+
+@pytest.fixture(scope="session")
+def litter_agent(redis_client):
+    """
+    在后台监听的 litter agent，提供 bench:echo 接口
+    """
+    from litter import agent
+
+    agent._redis_client = redis_client
+    agent.set_appname("bench")
+    agent.subscribe("bench:echo", lambda message: message.body)
+    agent.subscribe("bench:noop", lambda message: None)
+    agent.listen_bg(app_name="bench", executor_workers=4)
+    time.sleep(0.2)
+    return agent
@@ -0,0 +1,36 @@
+import pytest
+
+from litter.codec import JSON, TJSON, MSGPACK, available_codecs, encode, decode, serialize, deserialize
+from litter.model import Message, Response
+
+
+def test_serialize(benchmark, payload):
+    benchmark(serialize, payload)
+
+
+def test_deserialize(benchmark, payload):
+    benchmark(deserialize, serialize(payload))
+
+
+@pytest.mark.skipif(MSGPACK not in available_codecs(), reason="msgpack is not installed")
+def test_msgpack_roundtrip(benchmark, payload):
+    benchmark(lambda: decode(encode(payload, MSGPACK)))
+
+
+def test_tjson_encode(benchmark, payload):
+    benchmark(encode, payload, TJSON)
+
+
+def test_tjson_decode(benchmark, payload):
+    benchmark(decode, encode(payload, TJSON))
+
+
+def test_message_data_obj(benchmark, payload):
+    data = encode({"headers": {"litter-request-id": "0" * 32}, "body": payload}, JSON)
+    # data_obj 是 cached_property，每轮都需要新的 Message
+    benchmark(lambda: Message(data, channel="bench:echo").body)
+
+
+def test_response_from_redis_response(benchmark, payload):
+    data = encode({"headers": {"litter-request-id": "0" * 32, "litter-codec": JSON}, "body": payload}, JSON)
+    benchmark(lambda: Response.from_redis_response(data).body)
@@ -0,0 +1,30 @@
+from litter.codec import JSON, encode
+from litter.model import Message
+
+
+def test_dispatch(benchmark, litter_agent, bookmark_page):
+    """
+    listen 循环中每条消息的处理：解析redis消息、查找处理函数、提交到执行器并等待执行完成
+    """
+    data = encode({"headers": {}, "body": {"page": bookmark_page["works"][0]}}, JSON)
+    redis_msg = {"type": "pmessage", "pattern": b"bench:noop", "channel": b"bench:noop", "data": data}
+
+    def _dispatch():
+        message = Message.from_redis_message(redis_msg)
+        for func in litter_agent._register_map[message.pattern]:
+            litter_agent._submit(func, message, message.pattern).result()
+
+    benchmark(_dispatch)
+
+
+def test_request_roundtrip_small(benchmark, litter_agent):
+    benchmark(lambda: litter_agent.request("bench:echo", {"x": 1}, timeout=5))
+
+
+def test_request_roundtrip_bookmark_page(benchmark, litter_agent, bookmark_page):
+    benchmark(lambda: litter_agent.request("bench:echo", bookmark_page, timeout=5))
+
+
+def test_request_many(benchmark, litter_agent):
+    bodies = [{"x": i} for i in range(100)]
+    benchmark(lambda: litter_agent.request_many("bench:echo", bodies, timeout=5, concurrency=32))
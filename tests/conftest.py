@@ -0,0 +1,30 @@
+import time
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def redis_server():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture(scope="session")
+def redis_client(redis_server):
+    import fakeredis
+    return fakeredis.FakeStrictRedis(server=redis_server, decode_responses=False)
+
+
+@pytest.fixture(scope="session")
+def litter_agent(redis_client):
+    """
+    在后台监听的 litter agent（fakeredis），各测试在运行时 subscribe 自己的channel
+    """
+    from litter import agent
+
+    agent._redis_client = redis_client
+    agent.set_appname("test")
+    agent.listen_bg(app_name="test", executor_workers=4)
+    time.sleep(0.2)
+    yield agent
+    agent.disconnect()
@@ -0,0 +1,228 @@
+import threading
+import time
+
+from litter import cancel, trace
+
+
+def test_stream_cancelled_when_caller_stops(litter_agent):
+    seen, closed = {}, threading.Event()
+
+    def frames(message):
+        seen["priority"] = litter_agent._priority.get()
+        seen["trace"] = trace.current_trace()
+        token = cancel.current_token()
+        try:
+            for i in range(100):
+                yield i
+                if token.wait(0.02):
+                    return
+        finally:
+            seen["cancelled"] = token.cancelled
+            closed.set()
+
+    litter_agent.subscribe("test:frames", frames)
+    time.sleep(0.1)
+    received = []
+    with litter_agent.with_priority("high"):
+        for resp in litter_agent.iter_request("test:frames", {}, timeout=2):
+            received.append(resp.body)
+            if len(received) == 3:
+                break
+    # 调用方提前退出后，生成器在执行线程中收到取消并结束
+    assert closed.wait(2)
+    assert seen["cancelled"] and received == [0, 1, 2]
+    assert seen["priority"] == "high" and seen["trace"] is not None
+    assert litter_agent.executor_stats()["test:frames"]["running"] == 0
+
+
+def _concurrent_requests(agent, channel: str, n: int, headers=None) -> list:
+    results = [None] * n
+
+    def _call(i):
+        results[i] = agent.request(channel, {"q": 1}, headers=headers, timeout=3).body
+
+    threads = [threading.Thread(target=_call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_identical_requests_coalesced(litter_agent):
+    calls = []
+
+    def slow(message):
+        calls.append(message.body)
+        time.sleep(0.3)
+        return len(calls)
+
+    litter_agent.subscribe("test:coalesce", slow)
+    time.sleep(0.1)
+    assert _concurrent_requests(litter_agent, "test:coalesce", 5) == [1] * 5
+    assert len(calls) == 1
+
+    # no-cache 的请求都会执行
+    calls.clear()
+    _concurrent_requests(litter_agent, "test:coalesce", 3, headers={"litter-cache-control": "no-cache"})
+    assert len(calls) == 3
+
+
+def test_metrics_channel_subscribed_in_stream_mode(litter_agent, monkeypatch):
+    monkeypatch.setattr(litter_agent, "_transport", "stream")
+    assert litter_agent._listen_keys("app:get") == ["app:get:timeout"]
+    # 各副本都要通过 pubsub 返回自己的指标
+    assert litter_agent._listen_keys("app:_metrics") == ["app:_metrics", "app:_metrics:timeout"]
+
+
+def test_malformed_message_does_not_stop_listener(litter_agent, redis_client):
+    litter_agent.subscribe("test:echo", lambda message: message.body)
+    time.sleep(0.1)
+    redis_client.publish("test:echo", b"not json")
+    assert litter_agent.request("test:echo", {"ok": 1}, timeout=2).body == {"ok": 1}
+
+
+def test_concurrent_responses_correlated(litter_agent):
+    def echo(message):
+        # 后发出的请求先返回
+        time.sleep(0.05 * (10 - message.body["i"]))
+        return message.body["i"]
+
+    litter_agent.subscribe("test:correlate", echo)
+    time.sleep(0.1)
+    results = {}
+
+    def _call(i):
+        results[i] = litter_agent.request("test:correlate", {"i": i}, timeout=3).body
+
+    threads = [threading.Thread(target=_call, args=(i,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: i for i in range(10)}
+
+
+def test_undecodable_response_dropped(litter_agent, redis_client):
+    litter_agent.subscribe("test:reply", lambda message: "pong")
+    time.sleep(0.1)
+    litter_agent._ensure_reply_thread()
+    redis_client.lpush(litter_agent._reply_queue, b"\xc1lt:tj\x00garbage", b"not json")
+    time.sleep(0.2)
+    assert litter_agent._reply_thread.is_alive()
+    assert litter_agent.request("test:reply", {}, timeout=2).body == "pong"
+
+
+def test_request_many(litter_agent):
+    from litter.model import NoSubscriberException, RemoteFunctionRaisedException, RequestTimeoutException
+
+    def work(message):
+        i = message.body["i"]
+        if i == 2:
+            raise ValueError("bad input")
+        # 后发出的请求先完成，i == 4 时超时
+        time.sleep(2 if i == 4 else 0.05 * (4 - i))
+        return i * 10
+
+    litter_agent.subscribe("test:many", work)
+    time.sleep(0.1)
+    calls = [("test:many", {"i": i}) for i in range(5)] + [("test:nobody", {})]
+    order = []
+    results = [None] * len(calls)
+    for index, result in litter_agent.iter_request_many(calls, timeout=1):
+        order.append(index)
+        results[index] = result
+    assert [r.body for r in results[:2]] + [results[3].body] == [0, 10, 30]
+    assert isinstance(results[2], RemoteFunctionRaisedException) and "bad input" in str(results[2])
+    assert isinstance(results[4], RequestTimeoutException)
+    assert isinstance(results[5], NoSubscriberException)
+    # 按完成顺序返回：未发送的最先，超时的最后
+    assert order[0] == 5 and order[-1] == 4 and order.index(3) < order.index(0)
+
+    # request_many 按请求顺序返回，concurrency 限制同时等待的请求数
+    resps = litter_agent.request_many("test:many", [{"i": i} for i in (3, 1, 0)], timeout=2, concurrency=2)
+    assert [r.body for r in resps] == [30, 10, 0]
+
+
+def test_response_mirror(litter_agent, redis_client):
+    from litter.model import Response
+
+    def frames(message):
+        yield from range(3)
+
+    litter_agent.subscribe("test:mirror", frames)
+    sub = redis_client.pubsub(ignore_subscribe_messages=True)
+    sub.subscribe("test:mirror:response")
+    time.sleep(0.1)
+
+    def _mirrored() -> list[Response]:
+        ret, deadline = [], time.time() + 0.3
+        while time.time() < deadline:
+            if (m := sub.get_message(timeout=0.05)) is not None:
+                ret.append(Response.from_redis_response(m["data"]))
+        return ret
+
+    try:
+        for mode in ("full", "headers", "off"):
+            litter_agent.set_response_mirror(mode)
+            # 每一帧的 LPUSH 和镜像在同一个pipeline中按顺序发送
+            assert [r.body for r in litter_agent.iter_request("test:mirror", {}, timeout=2)] == [0, 1, 2]
+            mirrored = _mirrored()
+            if mode == "off":
+                assert mirrored == []
+                continue
+            assert [r.stream_seq for r in mirrored[:3]] == [0, 1, 2] and mirrored[3].stream_end
+            assert len({r.request_id for r in mirrored}) == 1
+            assert all(r.headers["litter-publish-channel"] == "test:mirror" for r in mirrored)
+            assert [r.body for r in mirrored] == ([0, 1, 2, None] if mode == "full" else [None] * 4)
+    finally:
+        litter_agent.set_response_mirror("off")
+        sub.close()
+
+
+def test_publish_many_keeps_order(litter_agent, redis_client):
+    from litter.model import Message
+
+    sub = redis_client.pubsub(ignore_subscribe_messages=True)
+    sub.subscribe("test:pipeline")
+    try:
+        received = litter_agent._publish_many([("test:pipeline", i, {"n": i}) for i in range(20)], "pubsub")
+        # 每条消息的 PUBLISH 返回值对应其订阅者数
+        assert received == [1] * 20
+        messages, deadline = [], time.time() + 1
+        while len(messages) < 20 and time.time() < deadline:
+            if (m := sub.get_message(timeout=0.05)) is not None:
+                messages.append(Message.from_redis_message(m))
+        assert [m.body for m in messages] == list(range(20))
+        assert [m.headers["n"] for m in messages] == list(range(20))
+    finally:
+        sub.close()
+
+
+def test_runtime_subscribe_and_unsubscribe(litter_agent, redis_client):
+    received = []
+
+    def handler(message):
+        received.append(message.body)
+
+    def _numsub() -> int:
+        return dict(redis_client.pubsub_numsub("test:runtime"))[b"test:runtime"]
+
+    assert litter_agent.publish("test:runtime", 0) == 0
+    litter_agent.subscribe("test:runtime", handler)
+    deadline = time.time() + 2
+    while _numsub() == 0 and time.time() < deadline:
+        time.sleep(0.02)
+    assert litter_agent.publish("test:runtime", 1) == 1
+    deadline = time.time() + 2
+    while received != [1] and time.time() < deadline:
+        time.sleep(0.02)
+    assert received == [1]
+
+    litter_agent.unsubscribe("test:runtime", handler)
+    deadline = time.time() + 2
+    while _numsub() > 0 and time.time() < deadline:
+        time.sleep(0.02)
+    assert litter_agent.publish("test:runtime", 2) == 0
+    time.sleep(0.2)
+    assert received == [1] and "test:runtime" not in litter_agent._register_map
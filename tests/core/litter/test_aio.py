@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+from litter import aio, blob
+
+
+@pytest.fixture
+def aio_client(litter_agent, redis_server):
+    import fakeredis
+    aio._attach(fakeredis.FakeAsyncRedis(server=redis_server), fakeredis.FakeAsyncRedis(server=redis_server))
+    litter_agent.set_blob_store("redis", threshold=1024)
+    yield aio
+    blob.configure(None)
+    aio._redis_client = aio._reply_client = None
+    aio._reply_task = None
+
+
+def test_request_resolves_blob_ref(aio_client, litter_agent):
+    payload = b"\x00" * 64 * 1024
+    litter_agent.subscribe("test:large", lambda message: payload)
+    time.sleep(0.1)
+
+    async def _main():
+        resp = await aio_client.request("test:large", {}, timeout=5)
+        frames = [r async for r in aio_client.iter_request("test:large_frames", {}, timeout=5)]
+        return resp, frames
+
+    def _frames(message):
+        yield payload
+        yield b"x"
+
+    litter_agent.subscribe("test:large_frames", _frames)
+    time.sleep(0.1)
+    resp, frames = asyncio.run(_main())
+    assert resp.body == payload and resp.body_ref is None
+    assert [f.body for f in frames] == [payload, b"x"]
+
+
+def test_concurrent_requests_out_of_order(aio_client, litter_agent, redis_client):
+    def echo(message):
+        # 后发出的请求先返回
+        time.sleep(0.1 + 0.05 * (8 - message.body["i"]))
+        return message.body["i"]
+
+    litter_agent.subscribe("test:aio_echo", echo)
+    time.sleep(0.1)
+
+    async def _main():
+        pending = asyncio.gather(*(aio_client.request("test:aio_echo", {"i": i}, timeout=5) for i in range(8)))
+        await asyncio.sleep(0.02)
+        # 请求等待期间收到无法解码的响应，不影响其他请求
+        redis_client.lpush(aio_client._reply_queue, b"\xc1lt:tj\x00garbage")
+        resps = await pending
+        return [r.body for r in resps], aio_client._reply_task.done()
+
+    bodies, done = asyncio.run(_main())
+    assert bodies == list(range(8)) and not done
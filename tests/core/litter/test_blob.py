@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pytest
+
+from litter import blob
+from litter.codec import encode, JSON, TJSON, tz
+from litter.model import Response, BlobNotFoundException
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    store = blob.LocalBlobStore(tmp_path)
+    blob.configure(store, threshold=64)
+    yield store
+    blob.configure(None)
+
+
+def _offload(body, codec=JSON):
+    envelope = {"headers": {}, "body": body}
+    return envelope["headers"], blob.offload(envelope, encode(envelope, codec), codec)
+
+
+def test_small_body_stays_inline(local_store):
+    headers, data = _offload({"a": 1})
+    assert data == encode({"headers": {}, "body": {"a": 1}}, JSON)
+    assert blob.BODY_REF_HEADER not in headers
+
+
+def test_large_body_resolved_lazily(local_store):
+    body = {"blob": b"x" * 1024}
+    headers, data = _offload(body)
+    assert headers[blob.BODY_REF_HEADER].startswith("file:")
+    assert len(data) < 256
+
+    resp = Response.from_redis_response(data)
+    assert resp.body_ref == headers[blob.BODY_REF_HEADER]
+    assert resp.body == body
+
+
+@pytest.mark.parametrize("codec", [JSON, TJSON])
+@pytest.mark.parametrize("body", [b"x" * 1024, datetime(2024, 1, 1, tzinfo=tz)])
+def test_top_level_typed_body(local_store, codec, body):
+    # 顶层的 bytes、datetime 也要按原类型还原
+    blob.configure(local_store, threshold=16)
+    headers, data = _offload(body, codec)
+    assert blob.BODY_REF_HEADER in headers
+    assert Response.from_redis_response(data).body == body
+
+
+def test_missing_blob_raises(local_store):
+    resp = Response({blob.BODY_REF_HEADER: "file:/nonexistent/blob"}, None)
+    with pytest.raises(BlobNotFoundException):
+        _ = resp.body
+
+
+def test_ref_outside_store_rejected(local_store, tmp_path):
+    secret = tmp_path.parent / f"{tmp_path.name}_secret.blob"
+    secret.write_text(encode({"headers": {}, "body": "secret"}, JSON))
+    try:
+        for ref in (f"file:{secret}", f"file:{local_store.path}/../{secret.name}"):
+            resp = Response({blob.BODY_REF_HEADER: ref}, None)
+            with pytest.raises(BlobNotFoundException):
+                _ = resp.body
+    finally:
+        secret.unlink()
@@ -0,0 +1,92 @@
+from fnmatch import fnmatchcase
+
+from litter import cache, codec
+
+
+class DictRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match, count=None):
+        return [k for k in list(self.data) if fnmatchcase(k, match)]
+
+
+class Service:
+    def __init__(self):
+        self.calls = 0
+
+    @cache.cached(60, key="{illust_id}")
+    def illust(self, illust_id):
+        self.calls += 1
+        return {"id": illust_id, "n": self.calls}
+
+    @cache.cached(60)
+    def search(self, word, page=1):
+        self.calls += 1
+        return [word, page]
+
+    @cache.invalidates("illust", key="{illust_id}")
+    @cache.invalidates("search")
+    def bookmark(self, *, illust_id=None):
+        return True
+
+
+def _wrap(client, service, name):
+    return cache.wrap(lambda: client, "app", name, getattr(service, name))
+
+
+def test_cache_hit_skips_method():
+    client, service = DictRedis(), Service()
+    illust = _wrap(client, service, "illust")
+    assert illust([1], {}) == {"id": 1, "n": 1}
+    assert illust([], {"illust_id": "1"}) == {"id": 1, "n": 1}
+    assert service.calls == 1
+    assert illust([1], {}, no_cache=True)["n"] == 2
+
+
+def test_default_key_uses_all_arguments():
+    client, service = DictRedis(), Service()
+    search = _wrap(client, service, "search")
+    search(["a"], {})
+    search(["a"], {"page": 1})
+    search(["a", 2], {})
+    assert service.calls == 2
+
+
+def test_invalidates():
+    client, service = DictRedis(), Service()
+    illust, search, bookmark = (_wrap(client, service, x) for x in ("illust", "search", "bookmark"))
+    illust([1], {})
+    illust([2], {})
+    search(["a"], {})
+
+    bookmark([], {"illust_id": 1})
+    assert set(client.data) == {"LCACHE:app:illust:2"}
+
+    illust([1], {})
+    bookmark([], {})  # 没有 illust_id 时使全部缓存失效
+    assert client.data == {}
+
+
+def test_undecodable_entry_is_miss(monkeypatch):
+    client, service = DictRedis(), Service()
+    illust = _wrap(client, service, "illust")
+    client.data["LCACHE:app:illust:1"] = b"not json"
+    assert illust([1], {}) == {"id": 1, "n": 1}
+
+    # 其他副本用本进程未安装的 msgpack 写入
+    monkeypatch.setattr(codec, "msgpack", None)
+    illust = _wrap(client, service, "illust")
+    client.data["LCACHE:app:illust:2"] = codec.MSGPACK_MAGIC + b"\x81"
+    assert illust([2], {}) == {"id": 2, "n": 2}
+    assert service.calls == 2
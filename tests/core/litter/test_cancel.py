@@ -0,0 +1,31 @@
+import time
+
+import pytest
+
+from litter.cancel import CancelToken, current_token, bind
+from litter.model import RequestCancelledException
+
+
+def test_token_expires_at_deadline():
+    token = CancelToken(time.time() + 0.05)
+    assert not token.cancelled
+    assert token.wait(1) is True
+    assert token.expired
+    with pytest.raises(RequestCancelledException):
+        token.raise_if_cancelled()
+
+
+def test_cancel_wakes_waiter():
+    token = CancelToken()
+    token.cancel()
+    start = time.time()
+    assert token.wait(1) is True
+    assert time.time() - start < 0.5
+
+
+def test_current_token_binding():
+    assert current_token().deadline is None
+    token = CancelToken(time.time() + 10)
+    with bind(token):
+        assert current_token() is token
+    assert current_token() is not token
@@ -0,0 +1,41 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from litter.codec import encode, decode, negotiate_codec, JSON, MSGPACK, serialize
+
+msgpack = pytest.importorskip("msgpack")
+
+
+def test_json_encode_is_legacy_serialize():
+    data = {"headers": {}, "body": {"blob": b"abc"}}
+    assert encode(data, JSON) == serialize(data)
+
+
+def test_decode_accepts_json_bytes():
+    data = {"headers": {}, "body": {"blob": b"abc"}}
+    assert decode(encode(data, JSON).encode("utf8")) == data
+
+
+def test_msgpack_roundtrip_bytes_and_datetime():
+    dt = datetime(2025, 8, 23, 12, 34, 56, tzinfo=ZoneInfo("Asia/Shanghai"))
+    data = {"headers": {"a": 1}, "body": {"blob": b"\x00\xff" * 100, "time": dt, "list": [1, "2"]}}
+    s = encode(data, MSGPACK)
+    assert isinstance(s, bytes)
+    result = decode(s)
+    assert result["body"]["blob"] == data["body"]["blob"]
+    assert result["body"]["time"].isoformat() == dt.isoformat()
+    assert result["body"]["list"] == [1, "2"]
+
+
+def test_msgpack_raw_bytes_smaller_than_json():
+    blob = bytes(range(256)) * 1024
+    data = {"headers": {}, "body": blob}
+    assert len(encode(data, MSGPACK)) < len(encode(data, JSON).encode("utf8"))
+
+
+def test_negotiate_codec():
+    assert negotiate_codec(None) == JSON
+    assert negotiate_codec("unknown") == JSON
+    assert negotiate_codec("msgpack,json") == MSGPACK
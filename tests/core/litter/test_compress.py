@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+from litter import compress
+from litter.codec import JSON, TJSON, tz
+from litter.model import Message, Response
+
+
+@pytest.fixture
+def rules():
+    compress.configure({"big:*": {"threshold": 256}, "big:raw": None})
+    yield
+    compress.configure(None)
+
+
+@pytest.mark.parametrize("codec", [JSON, TJSON])
+def test_large_text_body_round_trip(rules, codec):
+    body = {"content_html": "<div>hello</div>" * 200, "blob": b"\x00\x01"}
+    data = compress.encode_envelope("big:thread", {"headers": {"litter-request-id": "1"}, "body": body}, codec)
+    assert len(data) < 1024
+
+    message = Message(data, channel="big:thread")
+    assert message.body == body
+    assert compress.CONTENT_ENCODING_HEADER not in message.headers
+    assert Response.from_redis_response(data).body == body
+
+
+def test_rules_and_threshold(rules):
+    body = "x" * 1024
+    envelope = {"headers": {}, "body": body}
+    assert compress.CONTENT_ENCODING_HEADER.encode() in \
+           compress.encode_envelope("big:thread", envelope, JSON).encode()
+    assert compress.encode_envelope("big:raw", envelope, JSON) == '{"headers": {}, "body": "' + body + '"}'
+    assert compress.encode_envelope("small:x", envelope, JSON) == '{"headers": {}, "body": "' + body + '"}'
+    small = {"headers": {}, "body": "x"}
+    assert compress.encode_envelope("big:thread", small, JSON) == '{"headers": {}, "body": "x"}'
+    assert envelope["headers"] == {}
+
+
+@pytest.mark.parametrize("codec", [JSON, TJSON])
+@pytest.mark.parametrize("body", [b"\x00" * 4096, datetime(2024, 1, 1, tzinfo=tz)])
+def test_top_level_typed_body(codec, body):
+    compress.configure({"*": {"threshold": 16}})
+    try:
+        data = compress.encode_envelope("x", {"headers": {}, "body": body}, codec)
+        if isinstance(body, bytes):
+            assert len(data) < 1024
+        assert Message(data, channel="x").body == body
+    finally:
+        compress.configure(None)
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from litter.executor import BoundedExecutor, ChannelLimit, HIGH, LOW
+from litter.model import RequestRejectedException
+
+
+def test_channel_queue_full_rejects():
+    gate = threading.Event()
+    ex = BoundedExecutor(2, channel_limits={"a:*": ChannelLimit(concurrency=1, max_queue=1)})
+    f1 = ex.submit("a:x", gate.wait)
+    f2 = ex.submit("a:x", gate.wait)
+    with pytest.raises(RequestRejectedException):
+        ex.submit("a:x", gate.wait)
+    # 其他 channel 不受影响
+    assert ex.submit("b:x", lambda: 1).result(timeout=1) == 1
+    assert ex.stats()["a:x"]["rejected"] == 1
+    gate.set()
+    assert f1.result(timeout=1) and f2.result(timeout=1)
+    ex.shutdown()
+
+
+def test_channel_concurrency_limit():
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def job():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    ex = BoundedExecutor(4, channel_limits={"a": {"concurrency": 2}})
+    futures = [ex.submit("a", job) for _ in range(8)]
+    for f in futures:
+        f.result(timeout=2)
+    assert peak[0] == 2
+    ex.shutdown()
+
+
+def test_executor_queue_full_rejects():
+    gate = threading.Event()
+    ex = BoundedExecutor(1, max_queue=1)
+    ex.submit("a", gate.wait)
+    ex.submit("b", gate.wait)
+    with pytest.raises(RequestRejectedException):
+        ex.submit("c", gate.wait)
+    gate.set()
+    ex.shutdown()
+
+
+def test_exception_propagates_to_future():
+    ex = BoundedExecutor(1)
+
+    def boom():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        ex.submit("a", boom).result(timeout=1)
+    ex.shutdown()
+
+
+def test_priority_weighted_order():
+    gate = threading.Event()
+    order = []
+    ex = BoundedExecutor(1, priority_weights={HIGH: 2, LOW: 1})
+    ex.submit("a", gate.wait)
+    time.sleep(0.05)
+    futures = [ex.submit("low", order.append, LOW, priority=LOW) for _ in range(3)]
+    futures += [ex.submit("high", order.append, HIGH, priority=HIGH) for _ in range(3)]
+    assert ex.priority_stats()[LOW]["queued"] == 3
+    gate.set()
+    for f in futures:
+        f.result(timeout=1)
+    # 高优先级按权重先执行，低优先级也不会饿死
+    assert order == [HIGH, LOW, HIGH, HIGH, LOW, LOW]
+    ex.shutdown()
+
+
+def test_reserved_workers_only_run_high():
+    gate = threading.Event()
+    ex = BoundedExecutor(2, reserved_workers=1)
+    low = [ex.submit("bulk", gate.wait, priority=LOW) for _ in range(2)]
+    time.sleep(0.05)
+    assert ex.priority_stats()[LOW] == {"running": 1, "queued": 1}
+    assert ex.submit("interactive", lambda: 1, priority=HIGH).result(timeout=1) == 1
+    gate.set()
+    for f in low:
+        assert f.result(timeout=1)
+    ex.shutdown()
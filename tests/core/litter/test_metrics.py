@@ -0,0 +1,20 @@
+from litter import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    for v in (0.001, 0.01, 0.3, 1000):
+        metrics.observe("test_latency_seconds", v, channel="a")
+    sample = metrics.snapshot()["test_latency_seconds"][0]
+    assert sample["count"] == 4
+    assert sample["buckets"][0.005] == 1
+    assert sample["buckets"][0.01] == 2
+    assert sample["buckets"][0.5] == 3
+    assert sample["buckets"][float("inf")] == 4
+
+
+def test_render_prometheus_text():
+    metrics.inc("test_errors_total", channel='x"y', exception="ValueError")
+    metrics.inc("test_errors_total", channel='x"y', exception="ValueError")
+    text = metrics.render()
+    assert "# TYPE test_errors_total counter" in text
+    assert 'test_errors_total{channel="x\\"y",exception="ValueError"} 2' in text
@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+from litter.model import CircuitOpenException
+from litter.policy import LatencyWindow, CircuitBreaker
+
+
+def test_latency_percentile():
+    window = LatencyWindow(size=100)
+    assert window.percentile(95) is None
+    for i in range(1, 101):
+        window.add(i / 100)
+    assert window.percentile(50) == 0.51
+    assert window.percentile(95) == 0.96
+    assert window.percentile(100) == 1.
+    assert window.percentile(95, min_samples=200) is None
+
+
+def test_breaker_opens_and_recovers_by_probe():
+    healthy = []
+    breaker = CircuitBreaker("app:m", 2, probe=lambda: bool(healthy), probe_interval=0.05)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.open
+    with pytest.raises(CircuitOpenException):
+        breaker.before_call()
+
+    time.sleep(0.15)
+    assert breaker.open
+    healthy.append(True)
+    time.sleep(0.15)
+    assert not breaker.open
+    breaker.before_call()
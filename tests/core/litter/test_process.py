@@ -0,0 +1,108 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from litter import cancel, with_priority
+from litter.model import RequestCancelledException
+from litter.process import ProcessPool
+
+
+class Worker:
+    def add(self, a: int, b: int) -> int:
+        return a + b
+
+    def now(self) -> float:
+        return time.time()
+
+    def wait(self, marker: str) -> None:
+        token = cancel.current_token()
+        while not token.wait(0.05):
+            pass
+        Path(marker).write_text("cancelled")
+        token.raise_if_cancelled()
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ProcessPool(Worker, 1)
+    yield pool
+    pool.shutdown()
+
+
+def test_call_in_process(pool):
+    assert pool.proxy("add", Worker.add)(1, 2) == 3
+
+
+def test_cancel_reaches_child(pool, tmp_path):
+    marker = tmp_path / "marker"
+    token = cancel.CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+    with cancel.bind(token), pytest.raises(RequestCancelledException):
+        pool.proxy("wait", Worker.wait)(str(marker))
+    # 子进程中的方法收到取消并结束，进程可以继续执行其他调用
+    for _ in range(40):
+        if marker.exists():
+            break
+        time.sleep(0.05)
+    assert marker.read_text() == "cancelled"
+    assert pool.proxy("add", Worker.add)(2, 3) == 5
+
+
+def test_deadline_reaches_child(pool, tmp_path):
+    marker = tmp_path / "marker"
+    with cancel.bind(cancel.CancelToken(time.time() + 0.3)), pytest.raises(RequestCancelledException):
+        pool.proxy("wait", Worker.wait)(str(marker))
+    assert pool.proxy("add", Worker.add)(2, 3) == 5
+    assert marker.read_text() == "cancelled"
+
+
+def _occupy(pool, tmp_path, seconds: float, priority: str = "low") -> threading.Thread:
+    """
+    在后台占用一个进程 seconds 秒
+    """
+    def _run():
+        with with_priority(priority), cancel.bind(cancel.CancelToken(time.time() + seconds)):
+            with pytest.raises(RequestCancelledException):
+                pool.proxy("wait", Worker.wait)(str(tmp_path / "busy"))
+
+    t = threading.Thread(target=_run)
+    t.start()
+    time.sleep(0.1)
+    return t
+
+
+def _now_in_thread(pool, priority: str, results: dict) -> threading.Thread:
+    def _run():
+        with with_priority(priority):
+            results[priority] = pool.proxy("now", Worker.now)()
+
+    t = threading.Thread(target=_run)
+    t.start()
+    time.sleep(0.05)
+    return t
+
+
+def test_high_priority_runs_first(pool, tmp_path):
+    busy = _occupy(pool, tmp_path, 0.5)
+    results = {}
+    threads = [_now_in_thread(pool, p, results) for p in ("low", "normal", "high")]
+    for t in [busy, *threads]:
+        t.join()
+    assert results["high"] < results["normal"] < results["low"]
+
+
+def test_reserved_process_for_high_priority(tmp_path):
+    pool = ProcessPool(Worker, 2, reserved_workers=1)
+    try:
+        start = time.time()
+        busy = _occupy(pool, tmp_path, 1.)
+        results = {}
+        threads = [_now_in_thread(pool, p, results) for p in ("low", "high")]
+        for t in [busy, *threads]:
+            t.join()
+        # 高优先级的调用立即在保留的进程中执行，低优先级的等待共享的进程空闲
+        assert results["high"] - start < 0.8 < results["low"] - start
+    finally:
+        pool.shutdown()
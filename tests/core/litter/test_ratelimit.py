@@ -0,0 +1,52 @@
+import pytest
+
+from litter.model import RateLimitExceededException
+from litter.ratelimit import RateLimiter
+
+
+def test_local_limiter_burst_then_spacing():
+    limiter = RateLimiter("test", 10, burst=2, get_client=lambda: None)
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == pytest.approx(0.1, abs=0.02)
+
+
+def test_max_wait_does_not_reserve():
+    limiter = RateLimiter("test", 1, per=60, get_client=lambda: None)
+    limiter.acquire()
+    with pytest.raises(RateLimitExceededException):
+        limiter.acquire(max_wait=0.01)
+    with pytest.raises(RateLimitExceededException):
+        limiter.acquire(max_wait=0.01)
+
+
+def test_decorator_shares_budget():
+    limiter = RateLimiter("test", 1, per=60, get_client=lambda: None)
+    calls = []
+
+    @limiter
+    def f(x):
+        calls.append(x)
+        return x
+
+    assert f(1) == 1
+    with pytest.raises(RateLimitExceededException):
+        limiter.acquire(max_wait=0)
+    assert calls == [1]
+
+
+def test_redis_limiters_share_budget(redis_client):
+    # fakeredis 执行 Lua 脚本需要 lupa
+    pytest.importorskip("lupa")
+    redis_client.delete("LRATE:test:shared")
+    a = RateLimiter("test:shared", 10, burst=2, get_client=lambda: redis_client)
+    b = RateLimiter("test:shared", 10, burst=2, get_client=lambda: redis_client)
+    assert a.acquire() == 0
+    assert b.acquire() == 0
+    # 两个实例共用额度，之后的调用按 0.1 秒的间隔排队
+    assert a.acquire() == pytest.approx(0.1, abs=0.03)
+    assert b.acquire() == pytest.approx(0.1, abs=0.03)
+    with pytest.raises(RateLimitExceededException):
+        a.acquire(max_wait=0.01)
+    # 超过 max_wait 被拒绝的调用不占用额度
+    assert b.acquire() == pytest.approx(0.1, abs=0.03)
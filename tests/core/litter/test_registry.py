@@ -0,0 +1,46 @@
+import threading
+import time
+
+from litter import registry
+
+
+def test_health_check_result():
+    assert registry._health(None) == {"ok": True, "message": "OK"}
+    assert registry._health(lambda: (False, "session expired")) == {"ok": False, "message": "session expired"}
+
+    def _raise():
+        raise ConnectionError("down")
+
+    assert registry._health(_raise) == {"ok": False, "message": "ConnectionError: down"}
+
+
+def test_listening_matches_exact_and_pattern_channels():
+    registry._update([{"channels": ["app:get", "other:*"]}, {"channels": []}])
+    try:
+        assert registry._listening("app:get")
+        assert registry._listening("other:x")
+        assert not registry._listening("app:missing")
+    finally:
+        registry._channels = None
+    assert registry._listening("app:get") is None
+
+
+def test_hung_health_check_times_out():
+    release, stop = threading.Event(), threading.Event()
+    calls = []
+
+    def _check():
+        calls.append(1)
+        release.wait()
+        return True, "OK"
+
+    state = {}
+    threading.Thread(target=registry._probe_health, args=(_check, state, stop, 0.05, 0.1), daemon=True).start()
+    time.sleep(0.3)
+    assert state["health"] == {"ok": False, "message": "Health check timed out after 0.1s"}
+    # 卡住的检查结束前不会重复启动
+    assert len(calls) == 1
+    release.set()
+    time.sleep(0.2)
+    stop.set()
+    assert state["health"]["ok"] and len(calls) >= 2
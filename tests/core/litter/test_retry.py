@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from litter import retry
+from litter.adapt import _adapt_method
+from litter.retry import RetryPolicy
+
+
+@pytest.fixture
+def rules():
+    retry.configure({"mail:send": {"max_attempts": 5}, "mail:*": RetryPolicy(), "mail:noisy": None})
+    yield
+    retry.configure(None)
+
+
+def test_policy_matching(rules):
+    assert retry.policy("mail:send").max_attempts == 5
+    assert retry.policy("mail:other") == RetryPolicy()
+    assert retry.policy("mail:noisy") is None
+    assert retry.policy("ntfy:publish") is None
+
+
+def test_exponential_backoff():
+    p = RetryPolicy(backoff=1., multiplier=2., max_backoff=5., jitter=0.)
+    assert [p.delay(n) for n in range(1, 5)] == [1., 2., 4., 5.]
+    jittered = RetryPolicy(backoff=10., jitter=0.1)
+    assert all(9. <= jittered.delay(1) <= 11. for _ in range(100))
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        retry.configure({"x": {"max_attempts": 0}})
+
+
+def _wait(predicate, timeout: float = 3.):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.05)
+    return predicate()
+
+
+def test_retry_dead_letter_and_replay(litter_agent, redis_client):
+    retry.configure({"test:retry": {"max_attempts": 3, "backoff": 0.05, "jitter": 0.}})
+    # (a, b) -> 剩余的失败次数
+    failures = {(1, 2): 1, (3, 4): 3}
+    calls = []
+
+    def add(a, b):
+        calls.append((a, b))
+        if failures[(a, b)] > 0:
+            failures[(a, b)] -= 1
+            raise ValueError("boom")
+        return a + b
+
+    litter_agent.subscribe("test:retry", _adapt_method("test", "add", add))
+    time.sleep(0.1)
+    try:
+        # 位置参数在重试时仍然完整
+        litter_agent.publish("test:retry", {"_": [1, 2]})
+        assert _wait(lambda: calls.count((1, 2)) == 2)
+
+        litter_agent.publish("test:retry", {"_": [3, 4]})
+        assert _wait(lambda: len(retry.dead_letters(redis_client, "test:retry")) == 1)
+        entry, = retry.dead_letters(redis_client, "test:retry")
+        assert calls.count((3, 4)) == 3
+        assert entry["attempts"] == 3 and entry["error"] == "builtins.ValueError: boom"
+
+        assert retry.replay(redis_client, "test:retry") == 1
+        assert _wait(lambda: calls.count((3, 4)) == 4)
+        assert retry.dead_letters(redis_client, "test:retry") == []
+    finally:
+        litter_agent.unsubscribe("test:retry")
+        retry.configure(None)
+        retry.purge(redis_client, "test:retry")
@@ -0,0 +1,26 @@
+from litter.shard import HashRing, replica_channel, _route
+
+
+def test_ring_is_stable_and_balanced():
+    ring = HashRing(["r1", "r2", "r3"])
+    owners = [ring.get(i) for i in range(3000)]
+    assert owners == [HashRing(["r3", "r1", "r2"]).get(i) for i in range(3000)]
+    for node in ("r1", "r2", "r3"):
+        assert 600 < owners.count(node) < 1400
+
+
+def test_only_keys_of_changed_replica_move():
+    before = HashRing(["r1", "r2", "r3"])
+    after = HashRing(["r1", "r2", "r3", "r4"])
+    moved = [i for i in range(3000) if before.get(i) != after.get(i)]
+    assert all(after.get(i) == "r4" for i in moved)
+    assert len(moved) < 1200
+
+    shrunk = HashRing(["r1", "r3"])
+    assert all(shrunk.get(i) == before.get(i) for i in range(3000) if before.get(i) != "r2")
+
+
+def test_route_falls_back_to_shared_channel():
+    assert _route(HashRing([]), "app:illust", 1) == "app:illust"
+    assert _route(HashRing(["r1"]), "app:illust", None) == "app:illust"
+    assert _route(HashRing(["r1"]), "app:illust", 1) == replica_channel("app:illust", "r1") == "app:illust@r1"
@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+import redis
+
+from litter import stream
+from litter.codec import encode, JSON
+
+
+@pytest.fixture(autouse=True)
+def _cleanup(redis_client):
+    yield
+    redis_client.delete(*(stream.stream_key(c) for c in ("stream:ack", "stream:claim", "stream:flaky", "stream:garbage")))
+
+
+def _submit(func, message) -> Future:
+    f = Future()
+    f.set_result(func(message))
+    return f
+
+
+def _listen(client, register_map, **options):
+    stop = threading.Event()
+    thread = threading.Thread(target=stream.listen_stream, args=(client, register_map, _submit),
+                              kwargs={"running": lambda: not stop.is_set(), **options}, daemon=True)
+    thread.start()
+    return stop, thread
+
+
+def _wait(predicate, timeout: float = 3.):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.05)
+    return predicate()
+
+
+def test_entry_acked_after_handled(redis_client):
+    received = []
+    stop, thread = _listen(redis_client, {"stream:ack": [lambda m: received.append(m.data)]}, group="g1")
+    try:
+        stream.xadd(redis_client, "stream:ack", b"hello")
+        assert _wait(lambda: received == [b"hello"])
+        assert _wait(lambda: redis_client.xpending(stream.stream_key("stream:ack"), "g1")["pending"] == 0)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_reclaim_entries_of_crashed_consumer(redis_client):
+    key = stream.stream_key("stream:claim")
+    redis_client.xgroup_create(key, "g2", id="0", mkstream=True)
+    stream.xadd(redis_client, "stream:claim", b"orphan")
+    # 读取后未确认就崩溃的消费者
+    redis_client.xreadgroup("g2", "crashed", {key: ">"}, count=1)
+    assert redis_client.xpending(key, "g2")["pending"] == 1
+
+    received = []
+    stop, thread = _listen(redis_client, {"stream:claim": [lambda m: received.append(m.data)]},
+                           group="g2", consumer="alive", claim_idle=0., claim_interval=0.)
+    try:
+        assert _wait(lambda: received == [b"orphan"])
+        assert _wait(lambda: redis_client.xpending(key, "g2")["pending"] == 0)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_keep_listening_after_redis_error(redis_client, monkeypatch):
+    xreadgroup = redis_client.xreadgroup
+    failures = [1]
+
+    def _flaky(*args, **kwargs):
+        if failures:
+            failures.pop()
+            raise redis.exceptions.ConnectionError("connection reset")
+        return xreadgroup(*args, **kwargs)
+
+    monkeypatch.setattr(redis_client, "xreadgroup", _flaky)
+    received = []
+    stop, thread = _listen(redis_client, {"stream:flaky": [lambda m: received.append(m.data)]}, group="g3")
+    try:
+        stream.xadd(redis_client, "stream:flaky", b"after error")
+        assert _wait(lambda: received == [b"after error"])
+        assert not failures
+    finally:
+        stop.set()
+        thread.join()
+
+
+
+def test_malformed_entry_dropped(redis_client):
+    received = []
+
+    def _decoding_submit(func, message) -> Future:
+        # 与agent相同，在读取线程中解码请求头
+        _ = message.request_id
+        return _submit(func, message)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=stream.listen_stream,
+                              args=(redis_client, {"stream:garbage": [lambda m: received.append(m.body)]},
+                                    _decoding_submit),
+                              kwargs={"running": lambda: not stop.is_set(), "group": "g4"}, daemon=True)
+    thread.start()
+    try:
+        stream.xadd(redis_client, "stream:garbage", b"not json")
+        stream.xadd(redis_client, "stream:garbage", encode({"headers": {}, "body": "valid"}, JSON))
+        assert _wait(lambda: received == ["valid"])
+        assert _wait(lambda: redis_client.xpending(stream.stream_key("stream:garbage"), "g4")["pending"] == 0)
+    finally:
+        stop.set()
+        thread.join()
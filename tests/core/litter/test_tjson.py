@@ -0,0 +1,49 @@
+from collections import defaultdict, OrderedDict, namedtuple
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from litter import codec
+from litter.codec import encode, decode, deserialize, serialize, TJSON, TJSON_MAGIC
+
+Pair = namedtuple("Pair", "time raw")
+
+
+def test_plain_payload_has_empty_type_table():
+    data = {"headers": {"a": 1}, "body": {"works": [{"title": "标题", "tags": ["a", "b"]}], "n": None}}
+    s = encode(data, TJSON)
+    assert s.startswith(TJSON_MAGIC + b"\n")
+    assert decode(s) == data
+
+
+def test_typed_values_by_path():
+    dt = datetime(2025, 8, 23, 12, 34, 56, tzinfo=ZoneInfo("Asia/Shanghai"))
+    data = {"headers": {}, "body": {"posts": [{"time": dt, "raw": b"\x00\xff"}, ("x", dt)], 1: {"blob": b"1"}}}
+    result = decode(encode(data, TJSON))
+    assert result["body"]["posts"][0]["time"].isoformat() == dt.isoformat()
+    assert result["body"]["posts"][0]["raw"] == b"\x00\xff"
+    assert result["body"]["posts"][1][1].isoformat() == dt.isoformat()
+    assert result["body"]["1"] == {"blob": b"1"}
+    # 原对象不被修改
+    assert data["body"]["posts"][0]["time"] is dt
+
+
+def test_top_level_typed_value():
+    assert decode(encode(b"abc", TJSON)) == b"abc"
+
+
+def test_stdlib_backend(monkeypatch):
+    monkeypatch.setattr(codec, "orjson", None)
+    data = {"headers": {}, "body": {"blob": b"abc", "big": 2 ** 70}}
+    assert decode(encode(data, TJSON)) == data
+
+
+def test_legacy_json_without_markers_skips_hook():
+    assert deserialize(serialize({"a": "plain", "b": [1, 2]})) == {"a": "plain", "b": [1, 2]}
+    assert deserialize(serialize({"a": b"\x00"})) == {"a": b"\x00"}
+
+
+def test_mapping_and_sequence_subclasses():
+    dt = datetime(2025, 8, 23, 12, 34, 56, tzinfo=codec.tz)
+    body = defaultdict(list, {"time": [dt], "raw": OrderedDict(blob=b"\x01")})
+    result = decode(encode({"x": body, "pair": Pair(dt, b"2")}, TJSON))
+    assert result == {"x": {"time": [dt], "raw": {"blob": b"\x01"}}, "pair": [dt, b"2"]}
@@ -0,0 +1,24 @@
+from litter import trace
+
+
+def test_inject_starts_new_trace():
+    headers = {}
+    trace.inject(headers)
+    assert len(headers[trace.TRACE_ID_HEADER]) == 32
+    assert len(headers[trace.SPAN_ID_HEADER]) == 16
+
+
+def test_nested_request_inherits_trace():
+    with trace.bind("a" * 32, "b" * 16):
+        headers = {}
+        trace.inject(headers)
+        assert trace.current_trace() == ("a" * 32, "b" * 16)
+    assert headers[trace.TRACE_ID_HEADER] == "a" * 32
+    assert headers[trace.SPAN_ID_HEADER] != "b" * 16
+    assert trace.current_trace() is None
+
+
+def test_jsonl_exporter(tmp_path):
+    exporter = trace.JsonlExporter(tmp_path / "spans.jsonl")
+    exporter.export([{"name": "handle"}, {"name": "response"}])
+    assert (tmp_path / "spans.jsonl").read_text().splitlines() == ['{"name": "handle"}', '{"name": "response"}']